@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark: queue bookkeeping cost as the backlog grows
+
+Fills a TaskQueue (workers not started) with 1k / 10k / 100k queued tasks and
+times the calls the UI polls - task position, task status and queue status.
+Per-call cost should stay flat as the queue grows.
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import numpy as np
+
+sys.path.insert(0, '/app')
+os.chdir('/app')
+
+import cv2
+from server import TaskQueue, PRIORITY_LEVELS
+
+SIZES = [1_000, 10_000, 100_000]
+CALLS = 2_000
+
+def timed(fn, calls: int) -> float:
+    """Average microseconds per call."""
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+def benchmark_queue(size: int, input_path: str) -> dict:
+    """Submit `size` tasks and time the polling calls."""
+    tq = TaskQueue(devices=['cpu:0'])
+    priorities = list(PRIORITY_LEVELS)
+
+    start = time.perf_counter()
+    for i in range(size):
+        tq.submit(f"t{i}", input_path, {'resolution': 1080, 'priority': random.choice(priorities)})
+    submit_us = (time.perf_counter() - start) / size * 1e6
+
+    sample = [f"t{random.randrange(size)}" for _ in range(CALLS)]
+    calls = iter(sample * 2)
+    results = {
+        'submit': submit_us,
+        'position': timed(lambda: tq.get_task_position(next(calls)), CALLS),
+        'task': timed(lambda: tq.get_task(next(calls)), CALLS),
+        'status': timed(tq.get_status, CALLS),
+    }
+
+    # Worst case: every status call follows a queue change and a full rebuild
+    def rebuild():
+        tq.snapshot = None
+        tq.get_status()
+    results['status_rebuild'] = timed(rebuild, 20)
+
+    tq.shutdown()
+    return results
+
+def print_results(results: dict):
+    """Print formatted results."""
+    print(f"\n{'='*80}")
+    print("QUEUE BOOKKEEPING (microseconds per call)")
+    print(f"{'='*80}")
+    print(f"{'Tasks':>10} {'submit':>10} {'position':>10} {'task':>10} {'status':>10} {'rebuild':>12}")
+    print(f"{'─'*80}")
+    for size, r in results.items():
+        print(f"{size:>10} {r['submit']:>10.1f} {r['position']:>10.1f} {r['task']:>10.1f} "
+              f"{r['status']:>10.1f} {r['status_rebuild']:>12.1f}")
+
+if __name__ == "__main__":
+    random.seed(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'input.png')
+        cv2.imwrite(input_path, np.zeros((64, 64, 3), dtype=np.uint8))
+
+        results = {}
+        for size in SIZES:
+            print(f"Benchmarking {size} queued tasks...")
+            results[size] = benchmark_queue(size, input_path)
+
+    print_results(results)
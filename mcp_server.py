@@ -1,14 +1,14 @@
 """
-SeedVR2 Video Upscaler - MCP Server v1.4.0
-Task Queue Edition - Supports queue status and serial processing
+SeedVR2 Video Upscaler - MCP Server v1.5.0
+Async Edition - pooled HTTP client, batch submit and event-driven waits
 """
 import os
 import sys
-import time
-import uuid
-import requests
+import json
+import asyncio
+import httpx
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 if script_dir not in sys.path:
@@ -20,9 +20,170 @@ mcp = FastMCP("seedvr2-upscaler")
 
 # API base URL (connects to the main server)
 API_BASE = os.environ.get('SEEDVR2_API_URL', 'http://localhost:8200')
+# "local_prefix=server_prefix,..." - where the server sees shared files (e.g. a Docker volume)
+PATH_MAP = [tuple(pair.split('=', 1)) for pair in os.environ.get('SEEDVR2_PATH_MAP', '').split(',') if '=' in pair]
+MAX_CONNECTIONS = int(os.environ.get('SEEDVR2_MAX_CONNECTIONS', 100))  # Pooled keep-alive connections to the API
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.webm'}
+FINAL_STATUSES = ('completed', 'failed')
+EVENT_READ_TIMEOUT = 60  # Seconds without a byte (the server sends keep-alives every 15) before the stream reconnects
+UPLOAD_CHUNK = 8 << 20  # Bytes per chunked-upload request
+
+_http: Optional[httpx.AsyncClient] = None
+
+def _client() -> httpx.AsyncClient:
+    """The shared connection pool - callers beyond MAX_CONNECTIONS wait for a free connection"""
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            base_url=API_BASE,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            timeout=httpx.Timeout(30, pool=None))
+    return _http
+
+async def _get(path: str, **params) -> Dict[str, Any]:
+    resp = await _client().get(path, params=params or None)
+    return resp.json()
+
+def _server_path(file_path: str) -> str:
+    """Path of a local file as the server sees it"""
+    path = os.path.abspath(file_path)
+    for local, remote in PATH_MAP:
+        if path == local or path.startswith(local.rstrip('/') + '/'):
+            return remote.rstrip('/') + path[len(local.rstrip('/')):]
+    return path
+
+async def _submit(file_path: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Submit by server-side path when the server can reach the file (no copy), else upload it"""
+    if not os.path.exists(file_path):
+        return {'status': 'error', 'error': f'File not found: {file_path}'}
+    data = {key: str(value) for key, value in data.items()}
+    resp = await _client().post('/api/process', data=dict(data, input_path=_server_path(file_path)))
+    if resp.status_code not in (403, 404):  # outside INPUT_ROOTS or not visible to the server - upload instead
+        return resp.json()
+    return await _upload(file_path, data)
+
+async def _upload(file_path: str, data: Dict[str, str]) -> Dict[str, Any]:
+    """Send a file through the chunked upload API, reading it on a worker thread so the event loop never blocks"""
+    client = _client()
+    resp = await client.post('/api/uploads', json={'filename': Path(file_path).name, 'size': os.path.getsize(file_path)})
+    if resp.status_code >= 400:
+        return resp.json()
+    url = f"/api/uploads/{resp.json()['upload_id']}"
+    offset = 0
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, UPLOAD_CHUNK)
+            if not chunk:
+                break
+            resp = await client.patch(url, content=chunk, headers={
+                'Upload-Offset': str(offset), 'Content-Type': 'application/offset+octet-stream'})
+            if resp.status_code >= 400:
+                return resp.json()
+            offset = resp.json()['offset']
+    resp = await client.post(f"{url}/finalize", data=data)
+    return resp.json()
+
+async def _task_status(task_id: str) -> Dict[str, Any]:
+    resp = await _client().get(f"/api/status/{task_id}")
+    result = resp.json()
+    if resp.status_code == 404:
+        result.setdefault('status', 'not_found')
+    return result
+
+
+class TaskWatcher:
+    """Resolves waits from one shared server event stream
+    
+    Every wait registers a future for its task. A single /api/events stream
+    subscribed to the waited task ids, open while anyone is waiting,
+    resolves them as tasks finish, so hundreds of waits cost one connection
+    and no polling, and the server filters out everyone else's tasks. The
+    ids go in a POST body, since hundreds of them would overflow the request
+    line limit of the server or a proxy in front of it. A wait
+    for a task outside the subscription reconnects with the new set. While
+    the stream is down, waits fall back to polling the task status; after it
+    reconnects they check the status once, in case the task finished
+    during the gap.
+    """
+    
+    def __init__(self):
+        self.waiters: Dict[str, List[asyncio.Future]] = {}
+        self.stream_task: Optional[asyncio.Task] = None
+        self.subscribed: frozenset = frozenset()  # task ids of the open (or opening) stream
+        self.connected = False
+        self.generation = 0  # bumped on every (re)connect
+    
+    def _ensure_stream(self):
+        if self.stream_task is not None and not self.stream_task.done():
+            if self.waiters.keys() <= self.subscribed:
+                return
+            self.stream_task.cancel()  # resubscribe with the new task ids
+        self.subscribed = frozenset(self.waiters)
+        self.stream_task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def _run(self):
+        while self.waiters:
+            self.subscribed = frozenset(self.waiters)
+            try:
+                timeout = httpx.Timeout(10, read=EVENT_READ_TIMEOUT, pool=None)
+                body = {'task_ids': sorted(self.subscribed), 'positions': False}
+                async with _client().stream('POST', '/api/events', json=body, timeout=timeout) as resp:
+                    resp.raise_for_status()
+                    self.connected = True
+                    self.generation += 1
+                    event = None
+                    async for line in resp.aiter_lines():
+                        if not self.waiters:
+                            return
+                        if line.startswith('event:'):
+                            event = line[6:].strip()
+                        elif line.startswith('data:') and event:
+                            data = json.loads(line[5:])
+                            if event == 'task' and data.get('status') in FINAL_STATUSES:
+                                for future in self.waiters.get(data.get('task_id'), []):
+                                    if not future.done():
+                                        future.set_result(data)
+                            event = None
+            except (httpx.HTTPError, ValueError):
+                pass  # stream unavailable - waits poll until it is back
+            finally:
+                self.connected = False
+            await asyncio.sleep(1)
+    
+    async def wait(self, task_id: str, timeout: float, poll_interval: float) -> Dict[str, Any]:
+        """Final status of task_id, or a timeout result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.waiters.setdefault(task_id, []).append(future)  # before the first check, so no event is missed
+        self._ensure_stream()
+        deadline = loop.time() + timeout
+        try:
+            result = await _task_status(task_id)
+            seen = self.generation if self.connected else -1
+            while result.get('status') not in FINAL_STATUSES + ('not_found',):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return {'status': 'timeout', 'error': f'Task did not complete within {timeout} seconds'}
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), min(remaining, poll_interval))
+                except asyncio.TimeoutError:
+                    if self.connected and self.generation == seen:
+                        continue  # stream is live and said nothing - keep waiting
+                result = await _task_status(task_id)
+                seen = self.generation if self.connected else -1
+            return result
+        finally:
+            futures = self.waiters.get(task_id, [])
+            if future in futures:
+                futures.remove(future)
+            if not futures:
+                self.waiters.pop(task_id, None)
+
+
+watcher = TaskWatcher()
 
 @mcp.tool()
-def get_queue_status() -> Dict[str, Any]:
+async def get_queue_status() -> Dict[str, Any]:
     """
     Get current task queue status.
     
@@ -30,13 +191,12 @@ def get_queue_status() -> Dict[str, Any]:
         dict with queue_length, processing task, pending tasks, and statistics
     """
     try:
-        resp = requests.get(f"{API_BASE}/api/queue/status", timeout=10)
-        return resp.json()
+        return await _get("/api/queue/status")
     except Exception as e:
         return {'status': 'error', 'error': str(e)}
 
 @mcp.tool()
-def submit_image_task(
+async def submit_image_task(
     file_path: str,
     resolution: int = 1080,
     dit_model: str = "seedvr2_ema_3b_fp8_e4m3fn.safetensors",
@@ -46,6 +206,9 @@ def submit_image_task(
     """
     Submit an image upscaling task to the queue.
     
+    The file is passed by path when it lies in one of the server's
+    INPUT_ROOTS, and uploaded otherwise.
+    
     Args:
         file_path: Path to input image (PNG, JPG, etc.)
         resolution: Target resolution for short edge (default: 1080)
@@ -57,26 +220,18 @@ def submit_image_task(
         dict with task_id, queue_position, and estimated_wait_seconds
     """
     try:
-        if not os.path.exists(file_path):
-            return {'status': 'error', 'error': f'File not found: {file_path}'}
-        
-        with open(file_path, 'rb') as f:
-            files = {'file': (Path(file_path).name, f)}
-            data = {
-                'resolution': resolution,
-                'dit_model': dit_model,
-                'color_correction': color_correction,
-                'seed': seed,
-                'batch_size': 1
-            }
-            resp = requests.post(f"{API_BASE}/api/process", files=files, data=data, timeout=30)
-        
-        return resp.json()
+        return await _submit(file_path, {
+            'resolution': resolution,
+            'dit_model': dit_model,
+            'color_correction': color_correction,
+            'seed': seed,
+            'batch_size': 1
+        })
     except Exception as e:
         return {'status': 'error', 'error': str(e)}
 
 @mcp.tool()
-def submit_video_task(
+async def submit_video_task(
     file_path: str,
     resolution: int = 1080,
     batch_size: int = 5,
@@ -87,6 +242,9 @@ def submit_video_task(
     """
     Submit a video upscaling task to the queue.
     
+    The file is passed by path when it lies in one of the server's
+    INPUT_ROOTS, and uploaded otherwise.
+    
     Args:
         file_path: Path to input video (MP4, AVI, etc.)
         resolution: Target resolution for short edge (default: 1080)
@@ -99,26 +257,61 @@ def submit_video_task(
         dict with task_id, queue_position, and estimated_wait_seconds
     """
     try:
-        if not os.path.exists(file_path):
-            return {'status': 'error', 'error': f'File not found: {file_path}'}
-        
-        with open(file_path, 'rb') as f:
-            files = {'file': (Path(file_path).name, f)}
-            data = {
+        return await _submit(file_path, {
+            'resolution': resolution,
+            'batch_size': batch_size,
+            'dit_model': dit_model,
+            'color_correction': color_correction,
+            'seed': seed
+        })
+    except Exception as e:
+        return {'status': 'error', 'error': str(e)}
+
+@mcp.tool()
+async def submit_many(
+    file_paths: List[str],
+    resolution: int = 1080,
+    batch_size: int = 5,
+    dit_model: str = "seedvr2_ema_3b_fp8_e4m3fn.safetensors",
+    color_correction: str = "lab",
+    seed: int = 42
+) -> Dict[str, Any]:
+    """
+    Submit many images and/or videos at once, concurrently.
+    
+    Videos use batch_size, images always 1. Each file is passed by path or
+    uploaded as in submit_image_task.
+    
+    Args:
+        file_paths: Paths to input images or videos
+        resolution: Target resolution for short edge (default: 1080)
+        batch_size: Frames per batch for videos, must be 4n+1
+        dit_model: DiT model to use
+        color_correction: Color correction method
+        seed: Random seed
+    
+    Returns:
+        dict with one result per file (task_id or error) and the submitted task_ids
+    """
+    async def submit_one(file_path: str) -> Dict[str, Any]:
+        is_video = Path(file_path).suffix.lower() in VIDEO_EXTENSIONS
+        try:
+            result = await _submit(file_path, {
                 'resolution': resolution,
-                'batch_size': batch_size,
+                'batch_size': batch_size if is_video else 1,
                 'dit_model': dit_model,
                 'color_correction': color_correction,
                 'seed': seed
-            }
-            resp = requests.post(f"{API_BASE}/api/process", files=files, data=data, timeout=30)
-        
-        return resp.json()
-    except Exception as e:
-        return {'status': 'error', 'error': str(e)}
+            })
+        except Exception as e:
+            result = {'status': 'error', 'error': str(e)}
+        return dict(result, file_path=file_path)
+    
+    results = await asyncio.gather(*(submit_one(path) for path in file_paths))
+    return {'results': results, 'task_ids': [r['task_id'] for r in results if r.get('task_id')]}
 
 @mcp.tool()
-def get_task_status(task_id: str) -> Dict[str, Any]:
+async def get_task_status(task_id: str) -> Dict[str, Any]:
     """
     Get status of a specific task.
     
@@ -129,13 +322,12 @@ def get_task_status(task_id: str) -> Dict[str, Any]:
         dict with task status, progress, queue_position (if queued), and result info (if completed)
     """
     try:
-        resp = requests.get(f"{API_BASE}/api/status/{task_id}", timeout=10)
-        return resp.json()
+        return await _get(f"/api/status/{task_id}")
     except Exception as e:
         return {'status': 'error', 'error': str(e)}
 
 @mcp.tool()
-def get_task_position(task_id: str) -> Dict[str, Any]:
+async def get_task_position(task_id: str) -> Dict[str, Any]:
     """
     Get position of a task in the queue.
     
@@ -146,43 +338,58 @@ def get_task_position(task_id: str) -> Dict[str, Any]:
         dict with position and estimated_wait time
     """
     try:
-        resp = requests.get(f"{API_BASE}/api/queue/position/{task_id}", timeout=10)
-        return resp.json()
+        return await _get(f"/api/queue/position/{task_id}")
     except Exception as e:
         return {'status': 'error', 'error': str(e)}
 
 @mcp.tool()
-def wait_for_task(task_id: str, timeout: int = 600, poll_interval: int = 5) -> Dict[str, Any]:
+async def wait_for_task(task_id: str, timeout: int = 600, poll_interval: int = 5) -> Dict[str, Any]:
     """
-    Wait for a task to complete (blocking).
+    Wait for a task to complete.
+    
+    Woken by the server's event stream as soon as the task finishes, without
+    polling; falls back to polling if the stream is unavailable.
     
     Args:
         task_id: The task ID to wait for
         timeout: Maximum wait time in seconds (default: 600)
-        poll_interval: Polling interval in seconds (default: 5)
+        poll_interval: Polling interval in seconds while the event stream is unavailable (default: 5)
     
     Returns:
         dict with final task status and result info
     """
-    start_time = time.time()
+    try:
+        return await watcher.wait(task_id, timeout, poll_interval)
+    except Exception as e:
+        return {'status': 'error', 'error': str(e)}
+
+@mcp.tool()
+async def wait_many(task_ids: List[str], timeout: int = 600, poll_interval: int = 5) -> Dict[str, Any]:
+    """
+    Wait for several tasks to complete, concurrently.
+    
+    Args:
+        task_ids: Task IDs to wait for (e.g. task_ids from submit_many)
+        timeout: Maximum wait time in seconds for all of them (default: 600)
+        poll_interval: Polling interval in seconds while the event stream is unavailable (default: 5)
     
-    while time.time() - start_time < timeout:
+    Returns:
+        dict with the final status of each task and counts per status
+    """
+    async def wait_one(task_id: str) -> Dict[str, Any]:
         try:
-            resp = requests.get(f"{API_BASE}/api/status/{task_id}", timeout=10)
-            result = resp.json()
-            
-            status = result.get('status')
-            if status in ['completed', 'failed']:
-                return result
-            
-            time.sleep(poll_interval)
+            return await watcher.wait(task_id, timeout, poll_interval)
         except Exception as e:
             return {'status': 'error', 'error': str(e)}
     
-    return {'status': 'timeout', 'error': f'Task did not complete within {timeout} seconds'}
+    results = await asyncio.gather(*(wait_one(task_id) for task_id in task_ids))
+    counts: Dict[str, int] = {}
+    for result in results:
+        counts[result.get('status', 'unknown')] = counts.get(result.get('status', 'unknown'), 0) + 1
+    return {'results': dict(zip(task_ids, results)), 'counts': counts}
 
 @mcp.tool()
-def get_queue_history(limit: int = 20) -> Dict[str, Any]:
+async def get_queue_history(limit: int = 20) -> Dict[str, Any]:
     """
     Get history of completed tasks.
     
@@ -193,13 +400,12 @@ def get_queue_history(limit: int = 20) -> Dict[str, Any]:
         dict with list of completed tasks
     """
     try:
-        resp = requests.get(f"{API_BASE}/api/queue/history", params={'limit': limit}, timeout=10)
-        return resp.json()
+        return await _get("/api/queue/history", limit=limit)
     except Exception as e:
         return {'status': 'error', 'error': str(e)}
 
 @mcp.tool()
-def get_gpu_status() -> Dict[str, Any]:
+async def get_gpu_status() -> Dict[str, Any]:
     """
     Get current GPU status and memory usage.
     
@@ -207,13 +413,12 @@ def get_gpu_status() -> Dict[str, Any]:
         dict with GPU info, VRAM usage, and processing status
     """
     try:
-        resp = requests.get(f"{API_BASE}/api/gpu/status", timeout=10)
-        return resp.json()
+        return await _get("/api/gpu/status")
     except Exception as e:
         return {'status': 'error', 'error': str(e)}
 
 @mcp.tool()
-def release_gpu_memory() -> Dict[str, Any]:
+async def release_gpu_memory() -> Dict[str, Any]:
     """
     Release GPU memory.
     
@@ -221,13 +426,13 @@ def release_gpu_memory() -> Dict[str, Any]:
         dict with status
     """
     try:
-        resp = requests.post(f"{API_BASE}/api/gpu/offload", timeout=10)
+        resp = await _client().post("/api/gpu/offload")
         return resp.json()
     except Exception as e:
         return {'status': 'error', 'error': str(e)}
 
 @mcp.tool()
-def list_available_models() -> Dict[str, Any]:
+async def list_available_models() -> Dict[str, Any]:
     """
     List available DiT models for upscaling.
     
@@ -235,8 +440,7 @@ def list_available_models() -> Dict[str, Any]:
         dict with list of models and default model
     """
     try:
-        resp = requests.get(f"{API_BASE}/api/models", timeout=10)
-        return resp.json()
+        return await _get("/api/models")
     except Exception as e:
         return {'status': 'error', 'error': str(e)}
 
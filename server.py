@@ -1,36 +1,48 @@
 """
 SeedVR2 Video Upscaler - Web Server v1.5.1
-Task Queue Edition - Serial GPU processing with queue management
+Task Queue Edition - pipelined multi-GPU processing with queue management
 """
 import os
 import sys
 import uuid
 import time
 import json
+import glob
+import shutil
+import mimetypes
+import hashlib
+import urllib.parse
+import urllib.request
+import sqlite3
 import threading
 import queue
+import heapq
+import bisect
+import inspect
+import builtins
+import secrets
+import signal
+import subprocess
 import numpy as np
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Dict, Any, List
-from collections import deque
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterator
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 # Setup path
 script_dir = os.path.dirname(os.path.abspath(__file__))
 if script_dir not in sys.path:
     sys.path.insert(0, script_dir)
 
-# cuDNN optimizations for ~14% performance boost
 import torch
-torch.backends.cudnn.benchmark = False  # Disabled - causes slowdown with VAE tiling
-torch.backends.cudnn.allow_tf32 = True
-torch.backends.cuda.matmul.allow_tf32 = True
-print(f"🚀 cuDNN optimizations: benchmark={torch.backends.cudnn.benchmark}, tf32={torch.backends.cudnn.allow_tf32}, matmul_tf32={torch.backends.cuda.matmul.allow_tf32}")
 
-from flask import Flask, request, jsonify, send_file, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string, stream_with_context
 from flask_cors import CORS
 from flasgger import Swagger
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
 
 # Import SeedVR2 components
 from src.utils.model_registry import get_available_dit_models, DEFAULT_DIT, DEFAULT_VAE
@@ -53,349 +65,3533 @@ UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', '/app/uploads')
 OUTPUT_FOLDER = os.environ.get('OUTPUT_FOLDER', '/app/outputs')
 MODEL_DIR = os.environ.get('MODEL_DIR', f'/app/models/{SEEDVR2_FOLDER_NAME}')
 MAX_CONTENT_LENGTH = int(os.environ.get('MAX_UPLOAD_SIZE', 500)) * 1024 * 1024
-GPU_IDLE_TIMEOUT = int(os.environ.get('GPU_IDLE_TIMEOUT', 600))
+GPU_IDLE_TIMEOUT = int(os.environ.get('GPU_IDLE_TIMEOUT', 600))  # Idle seconds before resident weights move GPU -> CPU
+CPU_IDLE_TIMEOUT = int(os.environ.get('CPU_IDLE_TIMEOUT', 1800))  # Further idle seconds before they are dropped to disk
 MAX_HISTORY_SIZE = int(os.environ.get('MAX_HISTORY_SIZE', 100))
+TASK_DB = os.environ.get('TASK_DB', os.path.join(UPLOAD_FOLDER, 'tasks.db'))  # SQLite task store ('' = in-memory only)
+TASK_TTL = int(os.environ.get('TASK_TTL', 86400))  # Seconds finished tasks and their files are kept (0 = forever)
+TASK_STORE_MAX = int(os.environ.get('TASK_STORE_MAX', 10000))  # Finished tasks kept at most, oldest evicted first (0 = unbounded)
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join(OUTPUT_FOLDER, 'cache'))  # Outputs reused for identical submissions ('' = disabled)
+RESULT_CACHE_MAX_GB = float(os.environ.get('RESULT_CACHE_MAX_GB', 20))  # Cache size bound, least recently used evicted first
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 1000))  # Cached outputs kept at most (0 = unbounded)
+LATENT_CACHE_DIR = os.environ.get('LATENT_CACHE_DIR', os.path.join(OUTPUT_FOLDER, 'latents'))  # Encoded latents / decoded frames reused across runs ('' = disabled)
+LATENT_CACHE_MAX_GB = float(os.environ.get('LATENT_CACHE_MAX_GB', 50))  # Latent cache size bound, least recently used evicted first
+LATENT_CACHE_ENTRY_GB = float(os.environ.get('LATENT_CACHE_ENTRY_GB', 4))  # Largest single entry; bigger passes are not cached
+UPLOAD_BLOCK = 1024 * 1024  # Bytes per read when streaming uploads to disk
+DOWNLOAD_ACCEL = os.environ.get('DOWNLOAD_ACCEL', '')  # '' (app sends results), 'x-sendfile' or 'x-accel' (front proxy sends them)
+DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/_outputs/')  # nginx internal location aliased to OUTPUT_FOLDER, for 'x-accel'
+LIVE_POLL_INTERVAL = 0.5  # Seconds between checks for new bytes in a live download
+INPUT_ROOTS = [os.path.realpath(p.strip()) for p in os.environ.get('INPUT_ROOTS', '').split(',') if p.strip()]  # Server dirs submittable by path
+INPUT_URL_HOSTS = {h.strip() for h in os.environ.get('INPUT_URL_HOSTS', '').split(',') if h.strip()}  # Hosts submittable by http(s) URL ('' = none)
+UPLOAD_TTL = int(os.environ.get('UPLOAD_TTL', 86400))  # Seconds an unfinished chunked upload is kept without new data
+UPLOAD_STALL_TIMEOUT = int(os.environ.get('UPLOAD_STALL_TIMEOUT', 300))  # Seconds a task reading a growing upload waits for more bytes
+VIDEO_CHUNK_BATCHES = int(os.environ.get('VIDEO_CHUNK_BATCHES', 0))  # Temporal batches per chunk for long videos (0 = whole clip while it fits)
+VIDEO_WHOLE_MAX_GB = float(os.environ.get('VIDEO_WHOLE_MAX_GB', 8))  # Clips whose upscaled frames would exceed this are chunked anyway (0 = never)
+VIDEO_AUTO_CHUNK_BATCHES = int(os.environ.get('VIDEO_AUTO_CHUNK_BATCHES', 16))  # Temporal batches per chunk when chunking automatically
+VIDEO_CHUNK_OVERLAP = int(os.environ.get('VIDEO_CHUNK_OVERLAP', 4))  # Context frames shared between consecutive chunks
+SEGMENT_MIN_FRAMES = int(os.environ.get('SEGMENT_MIN_FRAMES', 600))  # Videos this long are split across devices (0 = never)
+VIDEO_CODEC = os.environ.get('VIDEO_CODEC', 'libx264')
+VIDEO_PRESET = os.environ.get('VIDEO_PRESET', 'fast')
+VIDEO_CRF = int(os.environ.get('VIDEO_CRF', 18))
+VIDEO_CODECS = {'libx264', 'libx265', 'libsvtav1', 'h264_nvenc', 'hevc_nvenc'}
+# x264-style preset names translated for encoders that use their own scale (SVT-AV1 0-13, NVENC p1-p7)
+VIDEO_PRESET_NAMES = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow')
+CODEC_PRESETS = {
+    'libsvtav1': dict(zip(VIDEO_PRESET_NAMES, ('12', '11', '10', '9', '8', '6', '5', '4', '2'))),
+    'h264_nvenc': dict(zip(VIDEO_PRESET_NAMES, ('p1', 'p1', 'p2', 'p3', 'p4', 'p5', 'p6', 'p7', 'p7'))),
+    'hevc_nvenc': dict(zip(VIDEO_PRESET_NAMES, ('p1', 'p1', 'p2', 'p3', 'p4', 'p5', 'p6', 'p7', 'p7'))),
+}
+PREFETCH_DEPTH = int(os.environ.get('PREFETCH_DEPTH', 1))  # Decoded inputs buffered ahead of the GPU stage
+PIPELINE_WINDOW = 300  # Seconds of history for GPU stage utilization
+PHASE_SHARES = {'vae_encode': 0.25, 'dit_upscale': 0.4, 'vae_decode': 0.3, 'postprocess': 0.05}  # Share of a pass per phase until timings are learned
+IMAGE_BATCH_MAX = int(os.environ.get('IMAGE_BATCH_MAX', 8))  # Compatible image tasks sharing one runner prep (1 = off)
+IMAGE_BATCH_WAIT = float(os.environ.get('IMAGE_BATCH_WAIT', 0.5))  # Seconds a ready image waits for compatible tasks still decoding
+PRIORITY_LEVELS = {'high': 0, 'normal': 1, 'low': 2}
+QUEUE_POLICY = os.environ.get('QUEUE_POLICY', 'priority')  # 'priority' (class, then FIFO) or 'sjf' (class, then shortest predicted first)
+SJF_AGING = float(os.environ.get('SJF_AGING', 1.0))  # Predicted seconds forgiven per second waited under 'sjf'
+PRIORITY_AGING = int(os.environ.get('PRIORITY_AGING', 600))  # Seconds waited per one-class priority boost (0 = never)
+STATUS_SNAPSHOT_TTL = float(os.environ.get('STATUS_SNAPSHOT_TTL', 1.0))  # Min seconds between queue snapshot rebuilds
+EVENT_KEEPALIVE = 15  # Seconds between keep-alive comments on idle event streams
+EVENT_QUEUE_INTERVAL = 0.5  # Min seconds between queue summary events
+STATUS_PENDING_LIMIT = int(os.environ.get('STATUS_PENDING_LIMIT', 100))  # Pending tasks listed in the queue status
+API_KEY_PRIORITIES = dict(  # "key1:high,key2:low" - default priority per X-API-Key header
+    pair.strip().split(':', 1) for pair in os.environ.get('API_KEY_PRIORITIES', '').split(',') if ':' in pair)
+RESIDENT_RUNNERS = int(os.environ.get('RESIDENT_RUNNERS', 1))  # Prepared runners kept loaded per device between tasks (0 = disabled)
+GPU_DEVICES = os.environ.get('GPU_DEVICES', '')  # Comma-separated CUDA devices to run workers on (empty = all visible)
+FAKE_GPUS = int(os.environ.get('FAKE_GPUS', 0))  # Run N CPU workers posing as devices, for testing scheduling without CUDA
+SERVE_MODE = os.environ.get('SERVE_MODE', 'standalone')  # 'standalone' (one process), 'engine' (GPU process + gunicorn front end) or 'frontend' (HTTP worker)
+ENGINE_SOCKET = os.environ.get('ENGINE_SOCKET', '/tmp/seedvr2-engine.sock')  # Unix socket between the front end and the engine
+ENGINE_AUTHKEY = os.environ.get('ENGINE_AUTHKEY', '')  # Shared secret for the engine socket (random if the engine starts the front end)
+HTTP_WORKERS = int(os.environ.get('HTTP_WORKERS', 4))  # gunicorn worker processes in engine mode
+HTTP_THREADS = int(os.environ.get('HTTP_THREADS', 64))  # Threads per gunicorn worker - each open event stream holds one
+EVENT_STREAM_RESERVE = int(os.environ.get('EVENT_STREAM_RESERVE', 8))  # Threads per gunicorn worker kept free of event streams
+FRONTEND = SERVE_MODE == 'frontend'  # HTTP only - queue, caches and GPU live in the engine process
+
+if not FRONTEND:
+    # cuDNN optimizations for ~14% performance boost (front-end workers never touch the GPU)
+    torch.backends.cudnn.benchmark = False  # Disabled - causes slowdown with VAE tiling
+    torch.backends.cudnn.allow_tf32 = True
+    torch.backends.cuda.matmul.allow_tf32 = True
+    print(f"🚀 cuDNN optimizations: benchmark={torch.backends.cudnn.benchmark}, tf32={torch.backends.cudnn.allow_tf32}, matmul_tf32={torch.backends.cuda.matmul.allow_tf32}")
+
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.webm'}
+
+
+def resolve_devices() -> List[str]:
+    """Worker devices from FAKE_GPUS / GPU_DEVICES, defaulting to every visible GPU"""
+    if FAKE_GPUS > 0:
+        return [f'cpu:{i}' for i in range(FAKE_GPUS)]
+    if not torch.cuda.is_available():
+        return ['cpu']
+    if GPU_DEVICES.strip():
+        names = [d.strip() for d in GPU_DEVICES.split(',') if d.strip()]
+        return [d if d.startswith('cuda') else f'cuda:{int(d)}' for d in names]
+    return [f'cuda:{i}' for i in range(torch.cuda.device_count())]
+
+
+def torch_device(device: str) -> str:
+    """Map a worker device name to a torch device - fake 'cpu:N' workers all run on 'cpu'"""
+    return 'cpu' if device.startswith('cpu') else device
+
+
+def accepts_kwarg(fn: Callable, name: str) -> bool:
+    """True if fn takes a keyword argument called name"""
+    try:
+        params = inspect.signature(fn).parameters
+    except (TypeError, ValueError):
+        return False
+    return name in params or any(p.kind == inspect.Parameter.VAR_KEYWORD for p in params.values())
+
+VAE_QUALITY_TILES = {
+    'low': ((512, 512), (64, 64)),
+    'medium': ((768, 768), (96, 96)),
+    'high': ((1024, 1024), (128, 128))
+}
+
+# ============================================================================
+# Metrics - Prometheus text exposition
+# ============================================================================
+
+class MetricsRegistry:
+    """Minimal Prometheus registry for counters, gauges and histograms
+    
+    Workers record samples under the registry's own lock, which is only held
+    for a dict update, so /metrics scrapes never wait on TaskQueue.lock.
+    Callback gauges are evaluated at scrape time from lock-free reads.
+    """
+    
+    PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+    
+    def __init__(self, prefix: str = 'seedvr2'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.meta: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self.values: Dict[str, Dict[Tuple, float]] = {}  # counters and gauges
+        self.histograms: Dict[str, Dict[Tuple, Dict[str, Any]]] = {}
+        self.buckets: Dict[str, Tuple[float, ...]] = {}
+        self.callbacks: List[Tuple[str, Callable[[], List[Tuple[Dict[str, str], float]]]]] = []
+    
+    def counter(self, name: str, help_text: str):
+        self.meta[name] = ('counter', help_text)
+        self.values.setdefault(name, {})
+    
+    def gauge(self, name: str, help_text: str, callback: Optional[Callable[[], List[Tuple[Dict[str, str], float]]]] = None):
+        self.meta[name] = ('gauge', help_text)
+        self.values.setdefault(name, {})
+        if callback:
+            self.callbacks.append((name, callback))
+    
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = PHASE_BUCKETS):
+        self.meta[name] = ('histogram', help_text)
+        self.histograms.setdefault(name, {})
+        self.buckets[name] = buckets
+    
+    @staticmethod
+    def _labels_key(labels: Optional[Dict[str, Any]]) -> Tuple:
+        return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+    
+    def inc(self, name: str, labels: Optional[Dict[str, Any]] = None, value: float = 1):
+        key = self._labels_key(labels)
+        with self.lock:
+            series = self.values[name]
+            series[key] = series.get(key, 0) + value
+    
+    def set(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None):
+        key = self._labels_key(labels)
+        with self.lock:
+            self.values[name][key] = value
+    
+    def set_max(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None):
+        key = self._labels_key(labels)
+        with self.lock:
+            series = self.values[name]
+            series[key] = max(series.get(key, 0), value)
+    
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None):
+        key = self._labels_key(labels)
+        buckets = self.buckets[name]
+        with self.lock:
+            hist = self.histograms[name].get(key)
+            if hist is None:
+                hist = self.histograms[name][key] = {'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist['counts'][i] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+    
+    @staticmethod
+    def _format_labels(key: Tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(key) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+        return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+    
+    @staticmethod
+    def _format_value(value: float) -> str:
+        if value == float('inf'):
+            return '+Inf'
+        return repr(float(value)) if isinstance(value, float) else str(value)
+    
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format (version 0.0.4)"""
+        computed: Dict[str, Dict[Tuple, float]] = {}
+        for name, callback in self.callbacks:
+            try:
+                samples = callback()
+            except Exception:
+                continue  # a broken probe must not break the scrape
+            computed.setdefault(name, {}).update((self._labels_key(labels), value) for labels, value in samples)
+        
+        with self.lock:
+            values = {name: dict(series) for name, series in self.values.items()}
+            histograms = {name: {key: {'counts': list(h['counts']), 'sum': h['sum'], 'count': h['count']}
+                                 for key, h in series.items()}
+                          for name, series in self.histograms.items()}
+        for name, series in computed.items():
+            values.setdefault(name, {}).update(series)
+        
+        lines = []
+        for name, (kind, help_text) in self.meta.items():
+            full = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            if kind == 'histogram':
+                for key, hist in histograms.get(name, {}).items():
+                    for bound, count in zip(self.buckets[name], hist['counts']):
+                        lines.append(f"{full}_bucket{self._format_labels(key, ('le', self._format_value(float(bound))))} {count}")
+                    lines.append(f"{full}_bucket{self._format_labels(key, ('le', '+Inf'))} {hist['count']}")
+                    lines.append(f"{full}_sum{self._format_labels(key)} {self._format_value(hist['sum'])}")
+                    lines.append(f"{full}_count{self._format_labels(key)} {hist['count']}")
+            else:
+                for key, value in values.get(name, {}).items():
+                    lines.append(f"{full}{self._format_labels(key)} {self._format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def model_label(dit_model: str) -> str:
+    """Short model name used in output filenames and metric labels"""
+    return dit_model.replace('seedvr2_ema_', '').replace('.safetensors', '').replace('.gguf', '')
+
+
+metrics = MetricsRegistry()
+metrics.counter('tasks_submitted_total', 'Tasks accepted into the queue')
+metrics.counter('tasks_completed_total', 'Tasks that finished successfully')
+metrics.counter('tasks_failed_total', 'Tasks that failed')
+metrics.histogram('phase_seconds', 'Wall time per processing phase (CUDA-synchronized for GPU phases)')
+metrics.histogram('task_seconds', 'End-to-end processing time per completed task')
+metrics.counter('frames_processed_total', 'Output frames written by completed tasks')
+metrics.gauge('task_fps', 'Output frames per second of the most recent completed task')
+metrics.counter('model_loads_total', 'Runner loads from disk')
+metrics.counter('model_load_failures_total', 'Runner loads that raised')
+metrics.counter('model_load_seconds_total', 'Time spent loading runners from disk')
+metrics.counter('runner_pool_hits_total', 'Tasks that reused a resident runner')
+metrics.counter('runner_pool_misses_total', 'Tasks that had to load a runner')
+metrics.counter('result_cache_hits_total', 'Submissions answered from the result cache')
+metrics.counter('result_cache_misses_total', 'Submissions with no cached result')
+metrics.counter('latent_cache_hits_total', 'GPU passes that resumed from cached phase outputs')
+metrics.counter('latent_cache_misses_total', 'GPU passes with no cached phase outputs')
+metrics.gauge('vram_peak_bytes', 'Highest peak allocated VRAM observed in any GPU phase')
+
+
+# ============================================================================
+# Engine IPC - HTTP front end talking to the GPU engine process
+# ============================================================================
+
+def remote_exception(name: str, message: str) -> Exception:
+    """Rebuild an exception raised in the engine - known types keep their class so routes can catch them"""
+    cls = globals().get(name) or getattr(builtins, name, None)
+    if isinstance(cls, type) and issubclass(cls, Exception):
+        return cls(message)
+    return RuntimeError(f"{name}: {message}")
+
+
+class EngineStream:
+    """File-like view of a request body that the front end streams over an engine connection
+    
+    Blocks arrive as separate messages ending with an empty one; drain()
+    consumes whatever the called method did not read, so the connection
+    is back in step before the reply is sent.
+    """
+    
+    def __init__(self, conn):
+        self.conn = conn
+        self.done = False
+    
+    def read(self, size: int = -1) -> bytes:
+        if self.done:
+            return b''
+        block = self.conn.recv_bytes()
+        self.done = not block
+        return block
+    
+    def drain(self):
+        while self.read():
+            pass
+
+
+class EngineServer:
+    """Serves method calls on the engine's objects to front-end processes over a Unix socket
+    
+    Every connection gets a thread. Requests are ('call' | 'get', object,
+    attribute, args, kwargs, stream_at) and replies ('ok', value) or
+    ('error', exception type, message); only builtins cross the socket.
+    stream_at marks a positional argument that is a request body, sent as
+    raw blocks after the request. A ('subscribe', task_ids) request turns
+    the connection into an event feed for one SSE client.
+    
+    Only the attributes in EXPOSED - what the front-end routes use - can be
+    reached; anything else on the engine's objects is refused.
+    """
+    
+    EXPOSED = {
+        'task_queue': {'devices', 'submit', 'submit_cached', 'finish_upload', 'get_task', 'get_task_event',
+                       'get_task_position', 'get_status', 'get_history', 'queue_summary'},
+        'runner_pool': {'current_model', 'loading_model', 'model_states'},
+        'gpu_manager': {'get_status', 'offload', 'load_model'},
+        'uploads': {'create', 'get', 'path', 'append', 'ready_to_start', 'attach_task', 'finalize', 'abort'},
+        'result_cache': {'get', 'discard'},
+        'metrics': {'render'},
+    }
+    
+    def __init__(self, address: str, authkey: bytes, objects: Dict[str, Any]):
+        self.address = address
+        self.authkey = authkey
+        self.objects = objects
+        self.listener = None
+    
+    def start(self):
+        from multiprocessing.connection import Listener
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        self.listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        os.chmod(self.address, 0o600)
+        threading.Thread(target=self._accept_loop, name='engine-accept', daemon=True).start()
+        print(f"[Engine] Listening on {self.address}")
+    
+    def _accept_loop(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except Exception:
+                if self.listener is None:
+                    return
+                continue  # failed handshake
+            threading.Thread(target=self._serve, args=(conn,), name='engine-conn', daemon=True).start()
+    
+    def _serve(self, conn):
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] == 'subscribe':
+                    self._feed_events(conn, message[1])
+                    return
+                op, name, attr, args, kwargs, stream_at = message
+                stream = EngineStream(conn) if stream_at is not None else None
+                try:
+                    if name not in self.objects or attr not in self.EXPOSED.get(name, ()):
+                        raise AttributeError(f"{name}.{attr} is not exposed by the engine")
+                    value = getattr(self.objects[name], attr)
+                    if op == 'call':
+                        if stream is not None:
+                            args = args[:stream_at] + (stream,) + args[stream_at + 1:]
+                        value = value(*args, **kwargs)
+                    reply = ('ok', value)
+                except Exception as e:
+                    message = e.args[0] if len(e.args) == 1 and isinstance(e.args[0], str) else str(e)
+                    reply = ('error', type(e).__name__, message)
+                if stream is not None:
+                    stream.drain()
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    raise
+                except Exception as e:  # result does not pickle
+                    conn.send(('error', type(e).__name__, str(e)))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+    
+    def _feed_events(self, conn, task_ids: Optional[List[str]]):
+        """Forward one subscriber's events; a None heartbeat notices a front end that went away"""
+        events = self.objects['task_queue'].events
+        sub = events.subscribe(task_ids)
+        try:
+            while True:
+                try:
+                    conn.send(sub['queue'].get(timeout=EVENT_KEEPALIVE))
+                except queue.Empty:
+                    conn.send(None)
+        finally:
+            events.unsubscribe(sub)
+    
+    def shutdown(self):
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.close()
+
+
+class EngineClient:
+    """Front-end side of the engine socket - one persistent connection per thread"""
+    
+    def __init__(self, address: str, authkey: str):
+        if not authkey:
+            raise RuntimeError("SERVE_MODE=frontend needs ENGINE_AUTHKEY - the engine's shared secret")
+        self.address = address
+        self.authkey = authkey.encode()
+        self.local = threading.local()
+    
+    def connect(self):
+        from multiprocessing.connection import Client
+        return Client(self.address, family='AF_UNIX', authkey=self.authkey)
+    
+    def request(self, message: Tuple, stream=None) -> Any:
+        """Send one request (and the body in stream, if any), returning the engine's value or raising its error"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():  # never share a connection across a fork
+            conn = self.local.conn = self.connect()
+            self.local.pid = os.getpid()
+        body_error = None
+        try:
+            conn.send(message)
+            if stream is not None:
+                try:
+                    for block in iter(lambda: stream.read(UPLOAD_BLOCK), b''):
+                        conn.send_bytes(block)
+                except (EOFError, OSError):
+                    raise
+                except Exception as e:  # client went away mid-body - end the stream and still read the reply
+                    body_error = e
+                conn.send_bytes(b'')
+            reply = conn.recv()
+        except (EOFError, OSError) as e:
+            self.local.conn = None
+            conn.close()
+            raise ConnectionError(f"Engine unreachable at {self.address}: {e}") from e
+        if body_error is not None:
+            raise body_error
+        if reply[0] == 'ok':
+            return reply[1]
+        raise remote_exception(reply[1], reply[2])
+
+
+class EngineProxy:
+    """Stand-in for an engine object in a front-end process
+    
+    Method calls go over the engine socket; attributes listed in attrs are
+    fetched as values. A file-like positional argument is streamed.
+    """
+    
+    def __init__(self, client: EngineClient, name: str, attrs: Tuple[str, ...] = ()):
+        self._client = client
+        self._name = name
+        self._attrs = attrs
+    
+    def __getattr__(self, attr: str) -> Any:
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        if attr in self._attrs:
+            return self._client.request(('get', self._name, attr, (), {}, None))
+        
+        def call(*args, **kwargs):
+            stream_at = next((i for i, arg in enumerate(args) if hasattr(arg, 'read')), None)
+            stream = args[stream_at] if stream_at is not None else None
+            if stream is not None:
+                args = args[:stream_at] + (None,) + args[stream_at + 1:]
+            return self._client.request(('call', self._name, attr, args, kwargs, stream_at), stream)
+        return call
+
+
+class RemoteEventQueue:
+    """queue.Queue-like reader of the event feed on a dedicated engine connection"""
+    
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def get(self, timeout: Optional[float] = None) -> Tuple[str, Dict[str, Any]]:
+        deadline = time.time() + (timeout or 0)
+        while self.conn.poll(max(deadline - time.time(), 0) if timeout is not None else None):
+            item = self.conn.recv()
+            if item is not None:  # None is the engine's heartbeat
+                return item
+        raise queue.Empty
+
+
+class RemoteEvents:
+    """EventBroker subscriptions served by the engine, one connection per subscriber"""
+    
+    def __init__(self, client: EngineClient):
+        self.client = client
+    
+    def subscribe(self, task_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        conn = self.client.connect()
+        conn.send(('subscribe', task_ids))
+        return {'task_ids': task_ids, 'queue': RemoteEventQueue(conn)}
+    
+    def unsubscribe(self, sub: Dict[str, Any]):
+        sub['queue'].conn.close()
+
+
+def launch_frontend(host: str, port: int, authkey: str) -> subprocess.Popen:
+    """Start gunicorn serving this app in SERVE_MODE=frontend, connected back to the engine"""
+    env = dict(os.environ, SERVE_MODE='frontend', ENGINE_SOCKET=ENGINE_SOCKET, ENGINE_AUTHKEY=authkey)
+    return subprocess.Popen([sys.executable, '-m', 'gunicorn', '--worker-class', 'gthread',
+                             '--workers', str(HTTP_WORKERS), '--threads', str(HTTP_THREADS),
+                             '--bind', f'{host}:{port}', '--chdir', script_dir, '--preload', 'server:app'], env=env)
+
+
+engine = EngineClient(ENGINE_SOCKET, ENGINE_AUTHKEY) if FRONTEND else None
+
+
+# ============================================================================
+# Resident Runner Pool - keeps prepared models loaded between tasks
+# ============================================================================
+
+class ResidentRunnerPool:
+    """LRU pool of prepared runners keyed by (model, VAE, block swap, tiling, device)
+    
+    max_size applies per device, so every worker keeps its own runners.
+    Resident runners move through residency tiers as they sit idle:
+    'gpu' (ready) -> 'cpu' (weights offloaded to RAM) -> 'disk'. The disk
+    tier is eviction: the runner is dropped and rebuilt from MODEL_DIR on
+    next use. Acquiring a runner promotes it back. Runners with block swap
+    place their own blocks, so they skip the cpu tier and are evicted instead.
+    """
+    
+    def __init__(self, max_size: int = 1):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries: OrderedDict = OrderedDict()  # key -> entry dict, oldest first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_load_time = 0.0
+        self.last_load_time: Optional[float] = None
+        self.transitions: deque = deque(maxlen=50)
+        self.loading: Dict[Tuple, threading.Event] = {}  # keys currently being loaded
+        self.model_load_times: Dict[str, float] = {}  # last load time per DiT model
+        self.load_errors: Dict[str, str] = {}  # last load error per DiT model
+        self.gpu_idle_timeout = 0
+        self.cpu_idle_timeout = 0
+        self.watchdog_thread: Optional[threading.Thread] = None
+        self.running = False
+        
+    @staticmethod
+    def make_key(params: Dict[str, Any], device: str) -> Tuple:
+        """Build the residency key for a task's parameters"""
+        tile_size, tile_overlap = VAE_QUALITY_TILES.get(params.get('vae_quality', 'high'), VAE_QUALITY_TILES['high'])
+        return (
+            params.get('dit_model', DEFAULT_DIT),
+            DEFAULT_VAE,
+            int(params.get('blocks_to_swap', 0)),
+            bool(params.get('encode_tiled', False)),
+            bool(params.get('decode_tiled', False)),
+            tile_size,
+            tile_overlap,
+            device,
+        )
+    
+    @staticmethod
+    def key_id(key: Tuple) -> str:
+        """Short stable id for a residency key, so clients can follow one exact runner"""
+        return hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+    
+    @staticmethod
+    def offloadable(key: Tuple) -> bool:
+        """Whether the runner can be moved between devices whole - block swap keeps its own split"""
+        return key[2] == 0
+    
+    def acquire(self, key: Tuple, loader: Callable[[], Tuple[Any, Dict[str, Any]]]) -> Tuple[Any, Dict[str, Any], bool]:
+        """Return (runner, cache_ctx, hit) for key, calling loader() on a miss
+        
+        Every acquire must be paired with release(key) once the task is done.
+        If the same key is already being loaded (e.g. by a background switch),
+        waits for that load instead of starting a second one.
+        """
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                pending = self.loading.get(key) if entry is None else None
+                if pending is None:
+                    if entry is not None:
+                        self.entries.move_to_end(key)
+                        entry['uses'] += 1
+                        entry['in_use'] += 1
+                        entry['last_used'] = time.time()
+                        self.hits += 1
+                    else:
+                        self.misses += 1
+                        self.loading[key] = threading.Event()
+                        stale = self._pop_stale(key[-1])
+                    break
+            pending.wait()
+        
+        if entry is not None:
+            with entry['move_lock']:
+                if entry['tier'] != 'gpu':
+                    self._move(key, entry, key[-1], 'gpu')
+            return entry['runner'], entry['cache_ctx'], True
+        
+        runner, cache_ctx = self._load(key, loader, stale, in_use=1)
+        return runner, cache_ctx, False
+    
+    def load_async(self, key: Tuple, loader: Callable[[], Tuple[Any, Dict[str, Any]]], tier: str = 'gpu') -> str:
+        """Load a runner in a background thread, returns 'already_loaded' or 'loading'"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if tier == 'gpu':
+                    self.entries.move_to_end(key)
+                entry['last_used'] = time.time()
+            elif key in self.loading:
+                return 'loading'
+            else:
+                self.loading[key] = threading.Event()
+                stale = self._pop_stale(key[-1])
+        if entry is not None:
+            if tier == 'gpu':
+                self.promote(key)
+            return 'already_loaded'
+        
+        def _background_load():
+            try:
+                self._load(key, loader, stale, in_use=0)
+            except Exception as e:
+                print(f"[Pool] Background load of {key[0]} failed: {e}")
+                return
+            if tier == 'cpu' and self.offloadable(key):
+                with self.lock:
+                    entry = self.entries.get(key)
+                if entry is not None:
+                    with entry['move_lock']:
+                        if entry['in_use'] == 0 and entry['tier'] == 'gpu':
+                            self._move(key, entry, 'cpu', 'cpu')
+                    # Preloaded runners stay behind the active one in LRU order
+                    with self.lock:
+                        if key in self.entries:
+                            self.entries.move_to_end(key, last=False)
+        
+        threading.Thread(target=_background_load, daemon=True).start()
+        return 'loading'
+    
+    def _pop_stale(self, device: str) -> List[Tuple[Tuple, Dict[str, Any]]]:
+        """Pop idle LRU entries on device to make room for one more - caller holds self.lock"""
+        stale = []
+        on_device = [k for k in self.entries if k[-1] == device]
+        for old_key in on_device:
+            if self.max_size <= 0 or len(on_device) - len(stale) < self.max_size:
+                break
+            if self.entries[old_key]['in_use'] == 0:
+                stale.append((old_key, self.entries.pop(old_key)))
+        self.evictions += len(stale)
+        return stale
+    
+    def _load(self, key: Tuple, loader: Callable[[], Tuple[Any, Dict[str, Any]]],
+              stale: List[Tuple[Tuple, Dict[str, Any]]], in_use: int) -> Tuple[Any, Dict[str, Any]]:
+        """Release stale entries then load key - caller registered key in self.loading"""
+        try:
+            # Free old weights first so they don't share VRAM with the new ones
+            for old_key, old in stale:
+                self._record(old_key, old['tier'], 'disk', 0.0)
+                self._release(old)
+            
+            load_start = time.time()
+            try:
+                runner, cache_ctx = loader()
+            except Exception as e:
+                with self.lock:
+                    self.load_errors[key[0]] = str(e)
+                metrics.inc('model_load_failures_total', {'model': model_label(key[0])})
+                raise
+            load_time = time.time() - load_start
+            metrics.inc('model_loads_total', {'model': model_label(key[0])})
+            metrics.inc('model_load_seconds_total', {'model': model_label(key[0])}, load_time)
+            
+            with self.lock:
+                self.total_load_time += load_time
+                self.last_load_time = load_time
+                self.model_load_times[key[0]] = load_time
+                self.load_errors.pop(key[0], None)
+                if self.max_size > 0:
+                    self.entries[key] = {
+                        'runner': runner,
+                        'cache_ctx': cache_ctx,
+                        'tier': 'gpu',
+                        'move_lock': threading.Lock(),
+                        'load_time': load_time,
+                        'loaded_at': time.time(),
+                        'last_used': time.time(),
+                        'uses': in_use,
+                        'in_use': in_use
+                    }
+        finally:
+            with self.lock:
+                self.loading.pop(key).set()
+        self._record(key, 'disk', 'gpu', load_time)
+        print(f"[Pool] Loaded {key[0]} on {key[-1]} in {load_time:.1f}s")
+        return runner, cache_ctx
+    
+    def promote(self, key: Tuple):
+        """Move an offloaded runner back to its device in the background (e.g. when a task is queued)"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry['tier'] == 'gpu':
+                return
+            entry['last_used'] = time.time()
+        
+        def _promote():
+            with entry['move_lock']:
+                with self.lock:
+                    if self.entries.get(key) is not entry or entry['tier'] == 'gpu':
+                        return
+                try:
+                    self._move(key, entry, key[-1], 'gpu')
+                except Exception as e:
+                    print(f"[Pool] Promotion of {key[0]} failed ({e}), evicting")
+                    self.evict(key)
+        
+        threading.Thread(target=_promote, daemon=True).start()
+    
+    def release(self, key: Tuple):
+        """Mark a runner returned by acquire() as no longer in use"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry['in_use'] = max(0, entry['in_use'] - 1)
+                entry['last_used'] = time.time()
+    
+    def evict(self, key: Optional[Tuple] = None) -> int:
+        """Evict one runner (or all idle ones when key is None), returns number evicted"""
+        with self.lock:
+            keys = list(self.entries.keys()) if key is None else [key]
+            stale = []
+            for k in keys:
+                entry = self.entries.get(k)
+                # Runners held by a running task are evicted explicitly by that task only
+                if entry is not None and (key is not None or entry['in_use'] == 0):
+                    stale.append((k, self.entries.pop(k)))
+            self.evictions += len(stale)
+        for k, entry in stale:
+            self._record(k, entry['tier'], 'disk', 0.0)
+            self._release(entry)
+        return len(stale)
+    
+    def _move(self, key: Tuple, entry: Dict[str, Any], device: str, tier: str):
+        """Move a runner's DiT/VAE weights to device - caller holds entry['move_lock']"""
+        move_start = time.time()
+        runner = entry['runner']
+        for attr in ('dit', 'vae'):
+            model = getattr(runner, attr, None)
+            if model is not None:
+                model.to(torch_device(device))
+        if tier != 'gpu' and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        old_tier = entry['tier']
+        entry['tier'] = tier
+        self._record(key, old_tier, tier, time.time() - move_start)
+    
+    def _record(self, key: Tuple, from_tier: str, to_tier: str, seconds: float):
+        self.transitions.append({
+            'time': datetime.now().isoformat(),
+            'dit_model': key[0],
+            'device': key[-1],
+            'from': from_tier,
+            'to': to_tier,
+            'seconds': round(seconds, 2)
+        })
+        if from_tier != 'disk' or to_tier != 'gpu':
+            print(f"[Pool] {key[0]} on {key[-1]}: {from_tier} -> {to_tier} ({seconds:.1f}s)")
+    
+    def _release(self, entry: Dict[str, Any]):
+        import gc
+        entry.pop('runner', None)
+        entry.pop('cache_ctx', None)
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    
+    def start_idle_watchdog(self, gpu_idle_timeout: int, cpu_idle_timeout: int):
+        """Demote idle runners gpu -> cpu after gpu_idle_timeout, then cpu -> disk after cpu_idle_timeout"""
+        self.gpu_idle_timeout = gpu_idle_timeout
+        self.cpu_idle_timeout = cpu_idle_timeout
+        if gpu_idle_timeout <= 0 and cpu_idle_timeout <= 0:
+            return
+        self.running = True
+        self.watchdog_thread = threading.Thread(target=self._watchdog_loop, daemon=True)
+        self.watchdog_thread.start()
+        print(f"[Pool] Idle watchdog started - gpu->cpu after {gpu_idle_timeout}s, cpu->disk after {cpu_idle_timeout}s")
+    
+    def _watchdog_loop(self):
+        timeouts = [t for t in (self.gpu_idle_timeout, self.cpu_idle_timeout) if t > 0]
+        interval = max(1.0, min(30.0, min(timeouts) / 4))
+        while self.running:
+            time.sleep(interval)
+            try:
+                self._demote_idle()
+            except Exception as e:
+                print(f"[Pool] Idle watchdog error: {e}")
+    
+    def _demote_idle(self):
+        now = time.time()
+        to_cpu, to_disk = [], []
+        with self.lock:
+            for key, entry in self.entries.items():
+                if entry['in_use']:
+                    continue
+                idle = now - entry['last_used']
+                if entry['tier'] == 'gpu' and self.gpu_idle_timeout > 0 and idle >= self.gpu_idle_timeout:
+                    if self.offloadable(key):
+                        to_cpu.append((key, entry))
+                    else:
+                        to_disk.append(key)
+                elif entry['tier'] == 'cpu' and self.cpu_idle_timeout > 0 and idle >= self.gpu_idle_timeout + self.cpu_idle_timeout:
+                    to_disk.append(key)
+            dropped = [(key, self.entries.pop(key)) for key in to_disk]
+            self.evictions += len(dropped)
+        for key, entry in dropped:
+            self._record(key, entry['tier'], 'disk', 0.0)
+            self._release(entry)
+        for key, entry in to_cpu:
+            # Skip if a task grabbed the runner meanwhile; it will promote it itself
+            if not entry['move_lock'].acquire(blocking=False):
+                continue
+            try:
+                with self.lock:
+                    if entry['in_use'] or key not in self.entries:
+                        continue
+                try:
+                    self._move(key, entry, 'cpu', 'cpu')
+                except Exception as e:
+                    print(f"[Pool] Offload of {key[0]} to CPU failed ({e}), evicting")
+                    self.evict(key)
+            finally:
+                entry['move_lock'].release()
+    
+    def shutdown(self):
+        self.running = False
+    
+    def model_states(self) -> Dict[str, Dict[str, Any]]:
+        """Per DiT model load state ('loading', 'gpu', 'cpu' or 'error'), last load time and runners
+        
+        'runners' lists every resident or loading runner of the model by
+        key_id, since one model can have several runner configurations.
+        """
+        with self.lock:
+            states = {}
+            runners: Dict[str, List[Dict[str, Any]]] = {}
+            for model, error in self.load_errors.items():
+                states[model] = {'state': 'error', 'error': error}
+            for key, entry in self.entries.items():
+                states[key[0]] = {'state': entry['tier'], 'device': key[-1]}
+                runners.setdefault(key[0], []).append({'runner': self.key_id(key), 'state': entry['tier'], 'device': key[-1]})
+            for key in self.loading:
+                states[key[0]] = {'state': 'loading', 'device': key[-1]}
+                runners.setdefault(key[0], []).append({'runner': self.key_id(key), 'state': 'loading', 'device': key[-1]})
+            for model, state in states.items():
+                state['runners'] = runners.get(model, [])
+                load_time = self.model_load_times.get(model)
+                state['load_time'] = round(load_time, 2) if load_time is not None else None
+            return states
+    
+    def is_resident(self, key: Tuple) -> bool:
+        """Whether key is loaded and ready on its device"""
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and entry['tier'] == 'gpu'
+    
+    def device_models(self, device: str) -> List[Dict[str, Any]]:
+        """DiT models resident on device with their tier"""
+        with self.lock:
+            return [{'dit_model': key[0], 'tier': entry['tier'], 'in_use': entry['in_use'] > 0}
+                    for key, entry in self.entries.items() if key[-1] == device]
+    
+    def loading_model(self) -> Optional[str]:
+        """DiT model currently being loaded, if any"""
+        with self.lock:
+            return next(iter(self.loading))[0] if self.loading else None
+    
+    def current_model(self) -> Optional[str]:
+        """DiT model of the most recently used resident runner"""
+        with self.lock:
+            if not self.entries:
+                return None
+            return next(reversed(self.entries))[0]
+    
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'last_load_time': round(self.last_load_time, 2) if self.last_load_time is not None else None,
+                'total_load_time': round(self.total_load_time, 2),
+                'gpu_idle_timeout': self.gpu_idle_timeout,
+                'cpu_idle_timeout': self.cpu_idle_timeout,
+                'resident': [{
+                    'dit_model': key[0],
+                    'vae_model': key[1],
+                    'blocks_to_swap': key[2],
+                    'encode_tiled': key[3],
+                    'decode_tiled': key[4],
+                    'tile_size': list(key[5]),
+                    'device': key[7],
+                    'tier': entry['tier'],
+                    'in_use': entry['in_use'] > 0,
+                    'load_time': round(entry['load_time'], 2),
+                    'uses': entry['uses'],
+                    'idle_seconds': int(time.time() - entry['last_used'])
+                } for key, entry in self.entries.items()],
+                'transitions': list(self.transitions)[-10:]
+            }
+
+
+def make_runner_loader(params: Dict[str, Any], device: str, debug: Debug) -> Callable[[], Tuple[Any, Dict[str, Any]]]:
+    """Build the pool loader that prepares a runner for params on device"""
+    device = torch_device(device)
+    
+    def load():
+        from src.core.generation_utils import setup_generation_context, prepare_runner
+        from src.utils.downloads import download_weight
+        
+        dit_model = params.get('dit_model', DEFAULT_DIT)
+        download_weight(dit_model=dit_model, vae_model=DEFAULT_VAE, model_dir=MODEL_DIR, debug=debug)
+        ctx = setup_generation_context(
+            dit_device=device, vae_device=device,
+            dit_offload_device='cpu', vae_offload_device='cpu',
+            tensor_offload_device='cpu', debug=debug
+        )
+        tile_size, tile_overlap = VAE_QUALITY_TILES.get(params.get('vae_quality', 'high'), VAE_QUALITY_TILES['high'])
+        return prepare_runner(
+            dit_model=dit_model, vae_model=DEFAULT_VAE,
+            model_dir=MODEL_DIR, debug=debug, ctx=ctx,
+            block_swap_config={'blocks_to_swap': params.get('blocks_to_swap', 0)},
+            encode_tiled=params.get('encode_tiled', False),
+            encode_tile_size=tile_size,
+            encode_tile_overlap=tile_overlap,
+            decode_tiled=params.get('decode_tiled', False),
+            decode_tile_size=tile_size,
+            decode_tile_overlap=tile_overlap,
+            dit_cache=True, vae_cache=True
+        )
+    return load
+
+
+runner_pool = EngineProxy(engine, 'runner_pool') if FRONTEND else ResidentRunnerPool(max_size=RESIDENT_RUNNERS)
+
+def process_rss_mb() -> Optional[int]:
+    """Resident set size of this process in MB (None without psutil)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss // (1024 * 1024)
+    except Exception:
+        return None
+
+
+# ============================================================================
+# Video I/O - streaming frame decode
+# ============================================================================
+
+class VideoFrameReader:
+    """Decodes RGB frames from a video file in temporal batches
+    
+    Frames are decoded batch_size at a time into a reused uint8 scratch
+    buffer and converted to float16 from there, so the decode buffers are
+    bounded by the batch size rather than the clip length (no per-frame
+    float32 copies); a read of many frames only adds its float16 output.
+    """
+    
+    def __init__(self, path: str, start: int = 0, limit: Optional[int] = None,
+                 growing: Optional[Callable[[], bool]] = None, batch_size: int = 16):
+        import cv2
+        self.path = path
+        self.start = start
+        self.batch_size = max(1, batch_size)
+        self.growing = growing  # blocks until an in-progress upload grows, False once it is complete
+        self.cap = self._open()
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.frame_count = max(0, int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)))  # container estimate, may be off
+        self.frames_read = 0
+        self.limit = limit  # stop after this many frames (None = end of stream)
+        if not (self.width and self.height):
+            # Header lacks dimensions - probe the first frame, then rewind
+            ret, frame = self.cap.read()
+            if not ret:
+                raise ValueError(f"Video contains no decodable frames: {path}")
+            self.height, self.width = frame.shape[:2]
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        if start:
+            # Read a temporal segment [start, start + limit) of the clip
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+            self.frame_count = max(0, self.frame_count - start)
+        if limit is not None:
+            self.frame_count = min(self.frame_count, limit)
+        self._bgr = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self._scratch: Optional[np.ndarray] = None
+        
+    def _open(self, position: int = 0):
+        """Open the file at a frame position, waiting for a growing upload to land enough bytes"""
+        import cv2
+        while True:
+            cap = cv2.VideoCapture(self.path)
+            if cap.isOpened() or self.growing is None:
+                break
+            cap.release()
+            if not self.growing():
+                self.growing = None  # upload complete - one last attempt
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video: {self.path}")
+        if position:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+        return cap
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+        
+    def close(self):
+        self.cap.release()
+        
+    def _read_into(self, out: np.ndarray) -> int:
+        """Decode up to len(out) frames into the uint8 RGB buffer out, returns frames read"""
+        import cv2
+        n = 0
+        wanted = len(out) if self.limit is None else min(len(out), self.limit - self.frames_read)
+        while n < wanted:
+            ret, frame = self.cap.read(self._bgr)
+            if not ret:
+                if self.growing is None:
+                    break
+                # End of the bytes uploaded so far - wait for more and resume at this frame
+                if not self.growing():
+                    self.growing = None
+                self.cap.release()
+                self.cap = self._open(self.start + self.frames_read + n)
+                if self.limit is None:
+                    self.frame_count = max(self.frame_count, int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)) - self.start)
+                continue
+            if frame.shape != out.shape[1:]:
+                raise ValueError(f"Video frame size changed mid-stream: {frame.shape[1]}x{frame.shape[0]}")
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=out[n])
+            n += 1
+        self.frames_read += n
+        return n
+    
+    def read(self, count: int) -> Optional[torch.Tensor]:
+        """Decode up to count frames as a float16 [n, H, W, 3] tensor in [0, 1], None at end of stream"""
+        if self._scratch is None:
+            self._scratch = np.empty((self.batch_size, self.height, self.width, 3), dtype=np.uint8)
+        frames = None
+        n = 0
+        while n < count:
+            got = self._read_into(self._scratch[:min(self.batch_size, count - n)])
+            if got == 0:
+                break
+            if frames is None:
+                frames = torch.empty((count, self.height, self.width, 3), dtype=torch.float16)
+            frames[n:n + got].copy_(torch.from_numpy(self._scratch[:got])).div_(255.0)
+            n += got
+        return frames[:n] if n else None
+    
+    def iter_batches(self, batch_size: Optional[int] = None) -> Iterator[torch.Tensor]:
+        """Yield float16 [n, H, W, 3] tensors in [0, 1] of up to batch_size frames each"""
+        while True:
+            batch = self.read(batch_size or self.batch_size)
+            if batch is None:
+                return
+            yield batch
+    
+    def read_all(self) -> torch.Tensor:
+        """Decode the whole clip into one preallocated float16 [N, H, W, 3] tensor"""
+        frames = self.read(self.frame_count) if self.frame_count else None
+        n = len(frames) if frames is not None else 0
+        # Container may under-report the frame count - append whatever is left
+        parts = ([frames] if n else []) + (list(self.iter_batches()) if n == self.frame_count else [])
+        if not parts:
+            raise ValueError("Video contains no decodable frames")
+        return torch.cat(parts) if len(parts) > 1 else parts[0]
+
+
+def upscaled_bytes(frames: int, height: int, width: int, resolution: int) -> int:
+    """Estimated host memory of frames upscaled to resolution (short side), as float16 RGB"""
+    scale = resolution / max(min(height, width), 1)
+    return int(frames * height * width * scale * scale * 3 * 2)
+
+
+def encoder_preset(codec: str, preset: str) -> str:
+    """The -preset value for codec, translating x264-style names where the encoder has its own scale"""
+    return CODEC_PRESETS.get(codec, {}).get(preset, preset)
+
+
+def valid_preset(codec: str, preset: str) -> bool:
+    """Whether preset is an x264-style name or one of codec's own presets"""
+    if preset in VIDEO_PRESET_NAMES:
+        return True
+    if codec == 'libsvtav1':
+        return preset.isdigit() and int(preset) <= 13
+    if codec.endswith('_nvenc'):
+        return preset in {f'p{i}' for i in range(1, 8)}
+    return preset == 'placebo'
+
+
+class VideoFrameWriter:
+    """Streams RGB frames into a single ffmpeg process over a pipe
+    
+    Encodes (and muxes source audio) in one pass - no intermediate file.
+    Frames are converted to uint8 in vectorized slices on a background
+    thread before writing.
+    With fragmented=True the MP4 is playable while it is still being written.
+    """
+    
+    CONVERT_FRAMES = 16  # frames converted to uint8 per slice
+    
+    def __init__(self, output_path: str, fps: float, width: int, height: int,
+                 audio_source: Optional[str] = None, codec: str = None, preset: str = None,
+                 crf: int = None, fragmented: bool = False):
+        import subprocess
+        import tempfile
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.frames_written = 0
+        codec = codec or VIDEO_CODEC
+        preset = encoder_preset(codec, preset or VIDEO_PRESET)
+        crf = VIDEO_CRF if crf is None else crf
+        
+        cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', f'{fps}', '-i', 'pipe:0'
+        ]
+        has_audio = bool(audio_source) and self._has_audio(audio_source)
+        if has_audio:
+            cmd += ['-i', audio_source]
+        cmd += ['-map', '0:v:0']
+        if has_audio:
+            cmd += ['-map', '1:a:0?', '-c:a', 'aac', '-b:a', '192k', '-shortest']
+        if width % 2 or height % 2:
+            # yuv420p needs even dimensions
+            cmd += ['-vf', 'crop=trunc(iw/2)*2:trunc(ih/2)*2']
+        cmd += ['-c:v', codec, '-preset', preset]
+        cmd += ['-cq', str(crf)] if codec.endswith('_nvenc') else ['-crf', str(crf)]
+        cmd += ['-pix_fmt', 'yuv420p']
+        cmd += ['-movflags', 'frag_keyframe+empty_moov+default_base_moof' if fragmented else '+faststart']
+        cmd += ['-f', 'mp4', output_path]
+        
+        self.stderr = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self.stderr)
+        self.error: Optional[str] = None
+        self.pending = queue.Queue(maxsize=2)  # bounds frames buffered ahead of ffmpeg
+        self.pump_thread = threading.Thread(target=self._pump, daemon=True)
+        self.pump_thread.start()
+    
+    @staticmethod
+    def _has_audio(path: str) -> bool:
+        import subprocess
+        try:
+            probe = subprocess.run([
+                'ffprobe', '-v', 'error', '-select_streams', 'a',
+                '-show_entries', 'stream=codec_type', '-of', 'csv=p=0', path
+            ], capture_output=True, text=True)
+            return 'audio' in probe.stdout
+        except:
+            return False
+    
+    def write(self, frames):
+        """Queue float RGB frames [n, H, W, 3] in [0, 1] (torch tensor or numpy array) for encoding
+        
+        Conversion and pipe writes happen on a background thread so the caller
+        (the GPU stage) can continue while ffmpeg encodes. The caller must not
+        modify frames after passing them in.
+        """
+        if self.error is not None:
+            raise RuntimeError(f"ffmpeg exited while encoding: {self.error}")
+        if isinstance(frames, np.ndarray):
+            frames = torch.from_numpy(frames)
+        self.pending.put(frames)
+        self.frames_written += len(frames)
+    
+    def _pump(self):
+        while True:
+            frames = self.pending.get()
+            if frames is None:
+                return
+            if self.error is not None:
+                continue  # drain so producers never block on a dead encoder
+            try:
+                for start in range(0, len(frames), self.CONVERT_FRAMES):
+                    chunk = frames[start:start + self.CONVERT_FRAMES]
+                    frames_u8 = chunk.float().mul_(255.0).clamp_(0, 255).to(torch.uint8).contiguous().numpy()
+                    self.proc.stdin.write(frames_u8.data)
+            except (BrokenPipeError, OSError, ValueError) as e:
+                self.error = self._error_output() or str(e)
+    
+    def _error_output(self) -> str:
+        self.proc.wait()
+        self.stderr.seek(0)
+        return self.stderr.read().decode('utf-8', 'replace').strip()[-1000:]
+    
+    def close(self) -> str:
+        """Flush and finish the file, returns the output path"""
+        self.pending.put(None)
+        self.pump_thread.join()
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        if self.error is not None or self.proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed (exit {self.proc.returncode}): {self.error or self._error_output()}")
+        self.stderr.close()
+        return self.output_path
+    
+    def abort(self):
+        """Kill the encoder and discard the partially written file"""
+        self.proc.kill()
+        self.pending.put(None)
+        self.pump_thread.join()
+        self.proc.wait()
+        self.stderr.close()
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+
+def to_uint8(frames: torch.Tensor) -> torch.Tensor:
+    """Float RGB frames in [0, 1] -> uint8 (compact host copy)"""
+    return frames.float().mul(255.0).round_().clamp_(0, 255).to(torch.uint8)
+
+
+def concat_videos(paths: List[str], output_path: str, audio_source: Optional[str] = None):
+    """Join identically encoded MP4 parts with stream copy, muxing audio from audio_source"""
+    import subprocess
+    import tempfile
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as listing:
+        for path in paths:
+            listing.write("file '{}'\n".format(os.path.abspath(path).replace("'", "'\\''")))
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', listing.name]
+    if audio_source and VideoFrameWriter._has_audio(audio_source):
+        cmd += ['-i', audio_source, '-map', '0:v:0', '-map', '1:a:0?', '-c:a', 'aac', '-b:a', '192k', '-shortest']
+    cmd += ['-c:v', 'copy', '-movflags', '+faststart', output_path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    finally:
+        os.unlink(listing.name)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg concat failed: {result.stderr.strip()[-500:]}")
+
+
+# ============================================================================
+# Cost Model - predicted task durations for queue ETAs
+# ============================================================================
+
+def probe_input(path: str) -> Tuple[int, int, int]:
+    """Cheap (width, height, frames) probe from file headers - (0, 0, 1) if unknown"""
+    import cv2
+    if Path(path).suffix.lower() in VIDEO_EXTENSIONS:
+        cap = cv2.VideoCapture(path)
+        try:
+            return (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                    max(1, int(cap.get(cv2.CAP_PROP_FRAME_COUNT))))
+        finally:
+            cap.release()
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.width, img.height, 1
+    except Exception:
+        return 0, 0, 1
+
+
+class DurationModel:
+    """Predicts GPU seconds for a task from its output size
+    
+    A task costs a fixed overhead plus a per-(dit_model, resolution bucket,
+    tiled) rate in seconds per megapixel-frame of output. Rates start from
+    the BENCHMARK.md table (L40S, 256x256 input) and follow an EMA of the
+    rates observed on completed tasks.
+    """
+    
+    TASK_OVERHEAD = 2.5  # seconds per task independent of output size
+    # BENCHMARK.md, 3B FP8 row: resolution -> seconds for a square 1-frame output
+    BENCHMARK_SECONDS = {480: 3, 540: 3, 720: 3, 1080: 4, 1440: 5, 1620: 6,
+                         2160: 9, 2880: 14, 3384: 18, 4320: 27}
+    ALPHA = 0.3
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = sorted(self.BENCHMARK_SECONDS)
+        self.seed_rates = {
+            res: max(seconds - self.TASK_OVERHEAD, 0.5) / (res * res / 1e6)
+            for res, seconds in self.BENCHMARK_SECONDS.items()
+        }
+        self.learned: Dict[Tuple[str, int, bool], Dict[str, Any]] = {}
+    
+    def bucket(self, resolution: int) -> int:
+        for res in self.buckets:
+            if resolution <= res:
+                return res
+        return self.buckets[-1]
+    
+    @staticmethod
+    def work(params: Dict[str, Any], width: int, height: int, frames: int) -> float:
+        """Output megapixel-frames: short edge scaled to the target resolution"""
+        resolution = params.get('resolution', 1080)
+        aspect = max(width, height) / min(width, height) if width and height else 1.0
+        return frames * resolution * resolution * aspect / 1e6
+    
+    def _key(self, params: Dict[str, Any]) -> Tuple[str, int, bool]:
+        return (params.get('dit_model', DEFAULT_DIT), self.bucket(params.get('resolution', 1080)),
+                bool(params.get('encode_tiled') or params.get('decode_tiled')))
+    
+    def rate(self, params: Dict[str, Any]) -> float:
+        key = self._key(params)
+        with self.lock:
+            learned = self.learned.get(key)
+            return learned['rate'] if learned else self.seed_rates[key[1]]
+    
+    def predict(self, params: Dict[str, Any], work: float) -> float:
+        return self.TASK_OVERHEAD + self.rate(params) * work
+    
+    def observe(self, params: Dict[str, Any], work: float, seconds: float):
+        """Fold a completed task's GPU time into its key's rate"""
+        if work <= 0:
+            return
+        observed = max(seconds - self.TASK_OVERHEAD, 0.0) / work
+        key = self._key(params)
+        with self.lock:
+            learned = self.learned.get(key)
+            if learned is None:
+                self.learned[key] = {'rate': observed, 'samples': 1}
+            else:
+                learned['rate'] = learned['rate'] * (1 - self.ALPHA) + observed * self.ALPHA
+                learned['samples'] += 1
+    
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'task_overhead_seconds': self.TASK_OVERHEAD,
+                'learned': [{
+                    'dit_model': model,
+                    'resolution_bucket': bucket,
+                    'tiled': tiled,
+                    'seconds_per_mpx_frame': round(entry['rate'], 4),
+                    'samples': entry['samples']
+                } for (model, bucket, tiled), entry in self.learned.items()]
+            }
+
+
+duration_model = DurationModel()
+
+
+# ============================================================================
+# Task Store - SQLite persistence across restarts
+# ============================================================================
+
+class TaskStore:
+    """SQLite persistence for task records
+    
+    Each task is stored as a JSON document, written when it is submitted and
+    when it finishes, so the queue can be rebuilt after a restart. A single
+    connection (WAL mode) is shared by all threads behind its own lock.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.seqs: Dict[str, int] = {}  # task_id -> sequence number of the last snapshot written
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS tasks (id TEXT PRIMARY KEY, status TEXT NOT NULL, data TEXT NOT NULL)')
+        self.conn.commit()
+    
+    def save(self, task: Dict[str, Any]):
+        """Insert or replace a task record"""
+        self.write(task['id'], task['status'], json.dumps(task, default=str))
+    
+    def write(self, task_id: str, status: str, data: str, seq: Optional[int] = None):
+        """Insert or replace an already serialized task record
+        
+        Snapshots are taken under the queue lock but written after it is
+        released, so two can race here; with seq, one older than the last
+        written for the task is dropped instead of overwriting it.
+        """
+        with self.lock:
+            if seq is not None:
+                if seq <= self.seqs.get(task_id, -1):
+                    return
+                self.seqs[task_id] = seq
+            self.conn.execute('INSERT OR REPLACE INTO tasks (id, status, data) VALUES (?, ?, ?)',
+                              (task_id, status, data))
+            self.conn.commit()
+    
+    def delete(self, task_ids: List[str]):
+        with self.lock:
+            for task_id in task_ids:
+                self.seqs.pop(task_id, None)
+            self.conn.executemany('DELETE FROM tasks WHERE id = ?', [(task_id,) for task_id in task_ids])
+            self.conn.commit()
+    
+    def load(self) -> List[Dict[str, Any]]:
+        """All stored task records, oldest submission first so requeued tasks keep their FIFO order"""
+        with self.lock:
+            rows = self.conn.execute('SELECT data FROM tasks').fetchall()
+        tasks = [json.loads(data) for (data,) in rows]
+        tasks.sort(key=lambda task: task.get('submitted_at', 0))
+        return tasks
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# ============================================================================
+# Result Cache - reuse outputs of identical submissions
+# ============================================================================
+
+class ResultCache:
+    """Completed outputs keyed by input content hash and output-affecting params
+    
+    Each entry is a hard link to a finished output (a copy across file
+    systems) plus a JSON sidecar, so it outlives the task's own files and
+    survives restarts. Entries are evicted least recently used first once
+    the directory exceeds max_bytes or max_entries.
+    """
+    
+    KEY_PARAMS = ('dit_model', 'resolution', 'batch_size', 'color_correction', 'seed',
+                  'vae_quality', 'encode_tiled', 'decode_tiled', 'tf32')
+    VIDEO_KEY_PARAMS = ('video_codec', 'video_preset', 'video_crf')
+    VIDEO_PLAN_PARAMS = (('chunk_batches', VIDEO_CHUNK_BATCHES), ('segment_parallel', 'auto'))
+    
+    def __init__(self, directory: str, max_bytes: int, max_entries: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()  # key -> metadata, least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+    
+    @classmethod
+    def make_key(cls, digest: str, params: Dict[str, Any], is_video: bool, device_count: int = 1) -> str:
+        """Cache key for an input's SHA-256 and the params that change its output
+        
+        Videos also key on the chunk/segment plan - chunk and segment seams
+        change the frames - so the server-side overlap, the automatic
+        chunking and segmenting thresholds and the device count are part of
+        the key.
+        """
+        names = cls.KEY_PARAMS + (cls.VIDEO_KEY_PARAMS if is_video else ())
+        values = [params.get(name) for name in names]
+        if is_video:
+            values += [params.get(name, default) for name, default in cls.VIDEO_PLAN_PARAMS]
+            values += [VIDEO_CHUNK_OVERLAP, VIDEO_WHOLE_MAX_GB, VIDEO_AUTO_CHUNK_BATCHES, SEGMENT_MIN_FRAMES, device_count]
+        material = json.dumps([digest, is_video] + values)
+        return hashlib.sha256(material.encode()).hexdigest()
+    
+    def _path(self, key: str, ext: str = '') -> str:
+        return os.path.join(self.directory, key + ext)
+    
+    def _load(self):
+        """Rebuild the index from the sidecars on disk, ordered by last use"""
+        found = []
+        for meta_path in glob.glob(os.path.join(glob.escape(self.directory), '*.json')):
+            try:
+                with open(meta_path) as f:
+                    entry = json.load(f)
+                key = Path(meta_path).stem
+                found.append((os.path.getmtime(self._path(key, entry['ext'])), key, entry))
+            except (OSError, ValueError, KeyError):
+                os.remove(meta_path)
+        for _, key, entry in sorted(found):
+            self.entries[key] = entry
+            self.bytes += entry['size']
+        if found:
+            print(f"[Cache] Loaded {len(self.entries)} cached result(s), {self.bytes / 1024**3:.2f} GB")
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Entry metadata plus its 'path' if cached, counting the hit or miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is None:
+            metrics.inc('result_cache_misses_total')
+            return None
+        path = self._path(key, entry['ext'])
+        try:
+            os.utime(path)  # last use, for LRU order after a restart
+        except OSError:
+            self.discard(key)
+            return None
+        metrics.inc('result_cache_hits_total')
+        return dict(entry, path=path)
+    
+    def put(self, key: str, output_path: str, meta: Dict[str, Any]):
+        """Add a finished output under key and evict down to the bounds"""
+        ext = Path(output_path).suffix
+        path = self._path(key, ext)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            link_or_copy(output_path, path)
+            entry = dict(meta, ext=ext, size=os.path.getsize(path))
+            with open(self._path(key, '.json'), 'w') as f:
+                json.dump(entry, f)
+        except OSError as e:
+            print(f"[Cache] Could not cache {output_path}: {e}")
+            return
+        
+        evicted = []
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old['size']
+            self.entries[key] = entry
+            self.bytes += entry['size']
+            while len(self.entries) > 1 and (self.bytes > self.max_bytes
+                                             or (self.max_entries > 0 and len(self.entries) > self.max_entries)):
+                old_key, old = self.entries.popitem(last=False)
+                self.bytes -= old['size']
+                evicted.append((old_key, old))
+        for old_key, old in evicted:
+            self._remove_files(old_key, old['ext'])
+    
+    def discard(self, key: str):
+        """Forget an entry whose file disappeared"""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.bytes -= entry['size']
+        if entry is not None:
+            self._remove_files(key, entry['ext'])
+    
+    def _remove_files(self, key: str, ext: str):
+        for path in (self._path(key, ext), self._path(key, '.json')):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                print(f"[Cache] Could not delete {path}: {e}")
+    
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'size_gb': round(self.bytes / 1024**3, 3),
+                'max_size_gb': round(self.max_bytes / 1024**3, 3),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+def link_or_copy(src: str, dst: str):
+    """Hard-link src to dst, copying when they are on different file systems"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+if not RESULT_CACHE_DIR:
+    result_cache = None
+elif FRONTEND:
+    result_cache = EngineProxy(engine, 'result_cache')
+else:
+    result_cache = ResultCache(RESULT_CACHE_DIR, int(RESULT_CACHE_MAX_GB * 1024**3), RESULT_CACHE_MAX_ENTRIES)
+metrics.gauge('result_cache_bytes', 'Bytes held by the result cache',
+              lambda: [({}, result_cache.bytes)] if result_cache is not None else [])
+
+
+class LatentCache:
+    """Generation context state after VAE encode and after VAE decode, keyed by input and params
+    
+    A rerun that only changes seed or DiT settings resumes from the encoded
+    latents and skips phase 1; one that only changes color correction
+    resumes from the decoded frames and reruns post-processing alone. Each
+    entry is one torch.save file, evicted least recently used first beyond
+    max_bytes. Entries are capped at max_entry_bytes: a pass whose decoded
+    frames would be larger (see fits) is not cached at all, so a long clip
+    never spends time and disk on a snapshot that would be dropped anyway.
+    """
+    
+    ENCODE_PARAMS = ('resolution', 'batch_size', 'encode_tiled', 'vae_quality', 'tf32')
+    DECODE_PARAMS = ('dit_model', 'seed', 'decode_tiled')
+    
+    def __init__(self, directory: str, max_bytes: int, max_entry_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.lock = threading.Lock()
+        self.entries: 'OrderedDict[str, int]' = OrderedDict()  # key -> file size, least recently used first
+        self.bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        found = sorted((os.path.getmtime(path), Path(path).stem, os.path.getsize(path))
+                       for path in glob.glob(os.path.join(glob.escape(directory), '*.pt')))
+        for _, key, size in found:
+            self.entries[key] = size
+            self.bytes += size
+    
+    @classmethod
+    def make_keys(cls, digest: str, params: Dict[str, Any]) -> Tuple[str, str]:
+        """(encoded, decoded) keys for an input's SHA-256 - the decoded key also covers the DiT pass"""
+        encode = [digest, DEFAULT_VAE] + [params.get(name) for name in cls.ENCODE_PARAMS]
+        decode = encode + [params.get(name) for name in cls.DECODE_PARAMS]
+        return (hashlib.sha256(json.dumps(encode).encode()).hexdigest(),
+                hashlib.sha256(json.dumps(decode).encode()).hexdigest())
+    
+    def fits(self, frames: int, height: int, width: int, resolution: int) -> bool:
+        """Whether a pass of this shape is small enough to be worth caching
+        
+        The decoded frames dominate both entries - the latents are a small
+        fraction of them (8x spatial, 4x temporal compression).
+        """
+        return upscaled_bytes(frames, height, width, resolution) <= self.max_entry_bytes
+    
+    @staticmethod
+    def _state_bytes(value: Any) -> int:
+        """In-memory size of the tensors in a context snapshot"""
+        if isinstance(value, torch.Tensor):
+            return value.numel() * value.element_size()
+        if isinstance(value, (list, tuple)):
+            return sum(LatentCache._state_bytes(item) for item in value)
+        if isinstance(value, dict):
+            return sum(LatentCache._state_bytes(item) for item in value.values())
+        return 0
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pt")
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Stored context entries, loaded to CPU, or None"""
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            state = torch.load(path, map_location='cpu')
+            os.utime(path)
+            return state
+        except Exception as e:
+            print(f"[Cache] Dropping unreadable latent cache entry {key[:12]}: {e}")
+            self.discard(key)
+            return None
+    
+    def put(self, key: str, state: Dict[str, Any]):
+        """Store context entries under key and evict down to max_bytes"""
+        if self._state_bytes(state) > self.max_entry_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            torch.save(state, tmp_path)
+            size = os.path.getsize(tmp_path)
+            if size > self.max_entry_bytes:
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"[Cache] Could not store latent cache entry {key[:12]}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        
+        evicted = []
+        with self.lock:
+            self.bytes += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            if os.path.exists(self._path(old_key)):
+                os.remove(self._path(old_key))
+    
+    def discard(self, key: str):
+        with self.lock:
+            self.bytes -= self.entries.pop(key, 0)
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+    
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {'entries': len(self.entries), 'size_gb': round(self.bytes / 1024**3, 3),
+                    'max_size_gb': round(self.max_bytes / 1024**3, 3)}
+
+
+def snapshot_context(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Shallow copy of a generation context, with list/dict values copied so in-place appends show up"""
+    return {key: list(value) if isinstance(value, list) else dict(value) if isinstance(value, dict) else value
+            for key, value in ctx.items()}
+
+
+def context_changes(ctx: Dict[str, Any], before: Dict[str, Any]) -> Dict[str, Any]:
+    """Entries of ctx added or replaced since the snapshot before, identity-compared"""
+    changes = {}
+    for key, value in ctx.items():
+        old = before.get(key)
+        if isinstance(value, list) and isinstance(old, list):
+            same = len(value) == len(old) and all(a is b for a, b in zip(value, old))
+        elif isinstance(value, dict) and isinstance(old, dict):
+            same = value.keys() == old.keys() and all(value[k] is old[k] for k in value)
+        else:
+            same = key in before and value is old
+        if not same:
+            changes[key] = value
+    return changes
+
+
+latent_cache = (LatentCache(LATENT_CACHE_DIR, int(LATENT_CACHE_MAX_GB * 1024**3), int(LATENT_CACHE_ENTRY_GB * 1024**3))
+                if LATENT_CACHE_DIR and not FRONTEND else None)
+
+
+# ============================================================================
+# Uploads - chunked, resumable
+# ============================================================================
+
+class UploadConflict(Exception):
+    """An append that does not start at the upload's current offset"""
+
+
+class UploadManager:
+    """Chunked, resumable uploads written straight into UPLOAD_FOLDER
+    
+    An upload is created empty, appended to at its current offset, then
+    finalized into a task; a client that lost its connection asks for the
+    offset and continues from there. Metadata sits in a JSON sidecar next
+    to the data, so unfinished uploads survive restarts. The running
+    SHA-256 is kept in memory and recomputed on finalize if it was lost.
+    
+    A video upload created with processing params may be queued before it
+    completes, once its header is readable and the rest is predicted to
+    arrive before the GPU would catch up (see ready_to_start); its reader
+    then waits for bytes as it goes.
+    """
+    
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.uploads: Dict[str, Dict[str, Any]] = {}
+        self.by_path: Dict[str, str] = {}
+        for meta_path in glob.glob(os.path.join(glob.escape(folder), '*.upload.json')):
+            try:
+                with open(meta_path) as f:
+                    upload = json.load(f)
+            except (OSError, ValueError):
+                continue
+            upload.update(offset=os.path.getsize(upload['path']) if os.path.exists(upload['path']) else 0,
+                          digest=None, hashed=0, busy=False, updated=time.time())
+            self.uploads[upload['id']] = upload
+            self.by_path[upload['path']] = upload['id']
+    
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.folder, f"{upload_id}.upload.json")
+    
+    def _save_meta(self, upload: Dict[str, Any]):
+        keys = ('id', 'filename', 'path', 'size', 'params', 'created', 'task_id')
+        with open(self._meta_path(upload['id']), 'w') as f:
+            json.dump({key: upload.get(key) for key in keys}, f)
+    
+    @staticmethod
+    def _public(upload: Dict[str, Any]) -> Dict[str, Any]:
+        return {'upload_id': upload['id'], 'filename': upload['filename'], 'offset': upload['offset'],
+                'size': upload['size'], 'task_id': upload.get('task_id')}
+    
+    def create(self, filename: str, size: Optional[int], params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Start an empty upload - its id becomes the task id"""
+        upload_id = str(uuid.uuid4())[:8]
+        path = os.path.join(self.folder, f"{upload_id}_{secure_filename(filename)}")
+        open(path, 'wb').close()
+        upload = {'id': upload_id, 'filename': filename, 'path': path, 'size': size, 'params': params,
+                  'created': time.time(), 'updated': time.time(), 'task_id': None,
+                  'offset': 0, 'digest': hashlib.sha256(), 'hashed': 0, 'busy': False}
+        self._save_meta(upload)
+        with self.lock:
+            self.uploads[upload_id] = upload
+            self.by_path[path] = upload_id
+        return self._public(upload)
+    
+    def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+            return self._public(upload) if upload else None
+    
+    def append(self, upload_id: str, offset: int, stream) -> Dict[str, Any]:
+        """Write stream at offset, which must be the upload's current length"""
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+            if upload is None:
+                raise KeyError(upload_id)
+            if upload['busy']:
+                raise UploadConflict('Another append to this upload is in progress')
+            if offset != upload['offset']:
+                raise UploadConflict(f"Upload is at offset {upload['offset']}, not {offset}")
+            upload['busy'] = True
+        digest = upload['digest'] if upload['hashed'] == offset else None
+        limit = upload['size'] if upload['size'] is not None else MAX_CONTENT_LENGTH
+        try:
+            with open(upload['path'], 'r+b') as out:
+                out.seek(offset)
+                out.truncate()
+                while True:
+                    block = stream.read(UPLOAD_BLOCK)
+                    if not block:
+                        break
+                    if offset + len(block) > limit:
+                        raise ValueError(f"Upload exceeds {limit} bytes")
+                    out.write(block)
+                    out.flush()
+                    if digest is not None:
+                        digest.update(block)
+                    offset += len(block)
+                    with self.lock:
+                        upload['offset'] = offset
+                        upload['updated'] = time.time()
+                        self.cond.notify_all()
+        finally:
+            with self.lock:
+                upload['busy'] = False
+                upload['hashed'] = offset if digest is not None else -1
+                self.cond.notify_all()
+        return self._public(upload)
+    
+    def ready_to_start(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """Params of an unfinished video upload that should be queued now, else None
+        
+        True once the container header can be probed and the remaining bytes,
+        at the rate seen so far, arrive before the GPU finishes the predicted
+        work - so an early task rarely waits on the network.
+        """
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+            if (upload is None or not upload['params'] or upload['task_id'] or not upload['size']
+                    or Path(upload['filename']).suffix.lower() not in VIDEO_EXTENSIONS):
+                return None
+            offset, elapsed = upload['offset'], max(time.time() - upload['created'], 1e-3)
+        width, height, frames = probe_input(upload['path'])
+        if not (width and height):
+            return None
+        remaining = (upload['size'] - offset) / max(offset / elapsed, 1.0)
+        predicted = duration_model.predict(upload['params'], DurationModel.work(upload['params'], width, height, frames))
+        return upload['params'] if remaining <= predicted else None
+    
+    def path(self, upload_id: str) -> Optional[str]:
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+            return upload['path'] if upload else None
+    
+    def attach_task(self, upload_id: str, task_id: str):
+        with self.lock:
+            upload = self.uploads[upload_id]
+            upload['task_id'] = task_id
+        self._save_meta(upload)
+    
+    def waiter(self, path: str) -> Optional[Callable[[], bool]]:
+        """For a path still being uploaded, a callable that blocks until it grows
+        
+        It returns True when more bytes arrived and False once the upload is
+        complete, and raises if the upload is aborted or stalls for
+        UPLOAD_STALL_TIMEOUT seconds.
+        """
+        with self.lock:
+            upload_id = self.by_path.get(path)
+            if upload_id is None:
+                return None
+            upload = self.uploads[upload_id]
+        
+        def wait() -> bool:
+            with self.lock:
+                seen = upload['offset']
+                deadline = time.time() + UPLOAD_STALL_TIMEOUT
+                while upload['offset'] == seen and not upload.get('closed'):
+                    left = deadline - time.time()
+                    if left <= 0:
+                        raise ValueError(f"Upload {upload['id']} stalled for {UPLOAD_STALL_TIMEOUT}s")
+                    self.cond.wait(timeout=left)
+                if upload.get('closed') == 'aborted':
+                    raise ValueError(f"Upload {upload['id']} was aborted")
+                return upload.get('closed') != 'complete'
+        return wait
+    
+    def finalize(self, upload_id: str) -> Dict[str, Any]:
+        """Close a complete upload, returns its path, filename, SHA-256, params and early task_id"""
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+            if upload is None:
+                raise KeyError(upload_id)
+            if upload['busy']:
+                raise UploadConflict('An append to this upload is in progress')
+            if upload['size'] is not None and upload['offset'] != upload['size']:
+                raise UploadConflict(f"Upload has {upload['offset']} of {upload['size']} bytes")
+            digest = upload['digest'] if upload['hashed'] == upload['offset'] else None
+        if digest is None:
+            digest = hashlib.sha256()
+            with open(upload['path'], 'rb') as f:
+                for block in iter(lambda: f.read(UPLOAD_BLOCK), b''):
+                    digest.update(block)
+        self._close(upload_id, 'complete')
+        return {'path': upload['path'], 'filename': upload['filename'], 'digest': digest.hexdigest(),
+                'params': upload['params'], 'task_id': upload['task_id']}
+    
+    def abort(self, upload_id: str) -> bool:
+        """Drop an upload and its data - a task already reading it fails"""
+        upload = self._close(upload_id, 'aborted')
+        if upload is None:
+            return False
+        if os.path.exists(upload['path']):
+            os.remove(upload['path'])
+        return True
+    
+    def expire(self) -> int:
+        """Abort uploads that received nothing for UPLOAD_TTL seconds"""
+        if UPLOAD_TTL <= 0:
+            return 0
+        cutoff = time.time() - UPLOAD_TTL
+        with self.lock:
+            stale = [upload_id for upload_id, upload in self.uploads.items()
+                     if upload['updated'] < cutoff and not upload['busy']]
+        for upload_id in stale:
+            self.abort(upload_id)
+        if stale:
+            print(f"[Queue] Dropped {len(stale)} stale upload(s)")
+        return len(stale)
+    
+    def _close(self, upload_id: str, reason: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            upload = self.uploads.pop(upload_id, None)
+            if upload is None:
+                return None
+            self.by_path.pop(upload['path'], None)
+            upload['closed'] = reason
+            self.cond.notify_all()
+        if os.path.exists(self._meta_path(upload_id)):
+            os.remove(self._meta_path(upload_id))
+        return upload
+
+
+uploads = EngineProxy(engine, 'uploads') if FRONTEND else UploadManager(UPLOAD_FOLDER)
+
+
+# ============================================================================
+# Event Stream - push updates for SSE subscribers
+# ============================================================================
+
+class EventBroker:
+    """Fan-out of task and queue events to Server-Sent Events subscribers
+    
+    Each subscriber gets a bounded queue; when a slow client falls behind the
+    oldest event is dropped, since every event carries the full current state.
+    Task events only reach subscribers watching that task (or all tasks).
+    """
+    
+    def __init__(self, max_buffered: int = 256):
+        self.max_buffered = max_buffered
+        self.lock = threading.Lock()
+        self.subscribers: List[Dict[str, Any]] = []
+    
+    def subscribe(self, task_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Register a subscriber; task_ids=None receives events for every task"""
+        sub = {'task_ids': set(task_ids) if task_ids is not None else None,
+               'queue': queue.Queue(maxsize=self.max_buffered)}
+        with self.lock:
+            self.subscribers.append(sub)
+        return sub
+    
+    def unsubscribe(self, sub: Dict[str, Any]):
+        with self.lock:
+            if sub in self.subscribers:
+                self.subscribers.remove(sub)
+    
+    def publish(self, event: str, data: Dict[str, Any], task_id: Optional[str] = None):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for sub in subscribers:
+            if task_id is not None and sub['task_ids'] is not None and task_id not in sub['task_ids']:
+                continue
+            while True:
+                try:
+                    sub['queue'].put_nowait((event, data))
+                    break
+                except queue.Full:
+                    try:
+                        sub['queue'].get_nowait()
+                    except queue.Empty:
+                        pass
+    
+    @property
+    def subscriber_count(self) -> int:
+        return len(self.subscribers)
+    
+    @staticmethod
+    def format(event: str, data: Dict[str, Any]) -> str:
+        """Encode one event in text/event-stream framing"""
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
 # ============================================================================
 # Task Queue System - v1.5.1
 # ============================================================================
 
+class TF32Gate:
+    """Serializes the process-wide TF32 flags across GPU threads
+    
+    torch.backends TF32 switches are global, so flipping them for one task
+    would change the math of tasks running on other devices. Tasks asking
+    for the current mode run together; one asking for the other mode waits
+    until they finish, and holds back new arrivals meanwhile so it cannot
+    be starved.
+    """
+    
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.enabled = torch.backends.cuda.matmul.allow_tf32
+        self.holders = 0
+        self.waiting = {True: 0, False: 0}
+    
+    @contextmanager
+    def hold(self, enabled: bool):
+        with self.cond:
+            self.waiting[enabled] += 1
+            # Yield to a waiting switch even once the holders are gone, or a
+            # newcomer woken first would take the gate in the old mode again
+            while ((self.holders and self.enabled != enabled)
+                   or (self.enabled == enabled and self.waiting[not enabled])):
+                self.cond.wait()
+            self.waiting[enabled] -= 1
+            if self.enabled != enabled:
+                torch.backends.cudnn.allow_tf32 = enabled
+                torch.backends.cuda.matmul.allow_tf32 = enabled
+                self.enabled = enabled
+                print(f"[Queue] TF32 {'enabled' if enabled else 'disabled'}")
+            self.holders += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.holders -= 1
+                self.cond.notify_all()
+
+
+class PendingIndex:
+    """Pending task ids kept sorted by scheduling key, with O(log n) rank lookups
+    
+    Entries are (level, cost, submitted_at, task_id) tuples in a sorted list.
+    Under 'sjf' the aged cost `predicted - SJF_AGING * waited` differs from
+    `predicted + SJF_AGING * submitted_at` by the same amount for every task,
+    so the latter is stored and never goes stale. Priority aging is applied
+    by advance(): tasks of one base class are promoted in submission order,
+    so a FIFO per (base class, current class) only ever needs its head checked.
+    """
+    
+    def __init__(self, policy: str, sjf_aging: float, priority_aging: int):
+        self.policy = policy
+        self.sjf_aging = sjf_aging
+        self.priority_aging = priority_aging
+        self.entries: List[Tuple[int, float, float, str]] = []
+        self.by_id: Dict[str, Tuple[int, float, float, str]] = {}
+        self.base: Dict[str, int] = {}
+        self.aging: Dict[Tuple[int, int], deque] = {}  # (base, current level) -> task ids, oldest first
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def __contains__(self, task_id: str) -> bool:
+        return task_id in self.by_id
+    
+    def __iter__(self) -> Iterator[str]:
+        """Task ids in scheduling order"""
+        return (entry[3] for entry in list(self.entries))
+    
+    def head(self, count: int) -> List[str]:
+        """The next `count` task ids in scheduling order"""
+        return [entry[3] for entry in self.entries[:count]]
+    
+    def _insert(self, task_id: str, level: int, cost: float, submitted_at: float):
+        entry = (level, cost, submitted_at, task_id)
+        bisect.insort(self.entries, entry)
+        self.by_id[task_id] = entry
+        if level > 0 and self.priority_aging > 0:
+            self.aging.setdefault((self.base[task_id], level), deque()).append(task_id)
+    
+    def add(self, task_id: str, level: int, predicted: float, submitted_at: float):
+        cost = predicted + self.sjf_aging * submitted_at if self.policy == 'sjf' else 0.0
+        self.base[task_id] = level
+        self._insert(task_id, level, cost, submitted_at)
+    
+    def remove(self, task_id: str):
+        entry = self.by_id.pop(task_id)
+        del self.entries[bisect.bisect_left(self.entries, entry)]
+        del self.base[task_id]
+    
+    def pop_first(self) -> str:
+        task_id = self.entries[0][3]
+        self.remove(task_id)
+        return task_id
+    
+    def rank(self, task_id: str) -> int:
+        """0-based position of a pending task in scheduling order"""
+        return bisect.bisect_left(self.entries, self.by_id[task_id])
+    
+    def advance(self, now: float) -> bool:
+        """Apply priority aging up to now, True if any task changed class"""
+        if self.priority_aging <= 0:
+            return False
+        changed = False
+        for key in sorted(self.aging):
+            base, level = key
+            fifo = self.aging[key]
+            while fifo:
+                task_id = fifo[0]
+                entry = self.by_id.get(task_id)
+                if entry is None or entry[0] != level:
+                    fifo.popleft()  # taken or already promoted
+                    continue
+                new_level = max(0, base - int((now - entry[2]) // self.priority_aging))
+                if new_level >= level:
+                    break
+                fifo.popleft()
+                self.remove(task_id)
+                self.base[task_id] = base
+                self._insert(task_id, new_level, entry[1], entry[2])
+                changed = True
+            if not fifo:
+                del self.aging[key]
+        return changed
+
+
 class TaskQueue:
-    """Thread-safe task queue with serial GPU processing"""
+    """Thread-safe task queue with a staged decode -> GPU -> encode pipeline
+    
+    Each device gets its own GPU worker thread plus a decode and an encode
+    thread, so every worker always has prepared work waiting. Decode threads
+    take pending tasks in QUEUE_POLICY order (priority class, then FIFO or
+    shortest predicted duration, both with aging). Decoded jobs
+    wait in a shared ready list; a free worker prefers jobs whose runner is
+    already resident on its device and coalesces compatible image jobs into
+    one pass. GPU work on any one device stays serial.
+    
+    With a TaskStore, tasks are persisted on submit and on finish; finished
+    tasks are evicted with their files after TASK_TTL, and tasks that were
+    still queued or running when the server stopped are queued again.
+    """
     
-    def __init__(self, max_history: int = 100):
-        self.queue = queue.Queue()  # FIFO queue for pending tasks
+    def __init__(self, max_history: int = 100, devices: Optional[List[str]] = None,
+                 store: Optional[TaskStore] = None):
+        self.devices = devices or resolve_devices()
+        self.device = self.devices[0]  # default device for model switch/preload
+        self.tf32 = TF32Gate()  # process-wide TF32 flags shared by the GPU threads
+        self.policy = QUEUE_POLICY if QUEUE_POLICY in ('priority', 'sjf') else 'priority'
+        self.pending = PendingIndex(self.policy, SJF_AGING, PRIORITY_AGING)  # tasks not yet taken by a decode thread
+        self.version = 0  # bumped on every change to queue order or running tasks
+        self.snapshot: Optional[Dict[str, Any]] = None  # cached queue order and ETAs, see _snapshot()
+        self.ready_jobs: List[Dict[str, Any]] = []  # decoded inputs waiting for a GPU worker, oldest first
+        self.ready_capacity = max(1, PREFETCH_DEPTH) * len(self.devices)
+        self.encode_queue = queue.Queue(maxsize=len(self.devices))  # GPU results waiting to be saved
         self.tasks: Dict[str, Dict[str, Any]] = {}  # All task info
         self.lock = threading.Lock()
-        self.current_task_id: Optional[str] = None
+        self.ready_cond = threading.Condition(self.lock)
+        self.pending_cond = threading.Condition(self.lock)
+        self.stage_tasks: Dict[str, Dict[str, str]] = {'decode': {}, 'encode': {}}  # thread name -> task_id
+        self.workers: Dict[str, Dict[str, Any]] = {device: {
+            'task_id': None,
+            'busy': deque(),  # (start, end) of recent GPU stage runs
+            'busy_since': None,
+            'completed': 0,
+            'failed': 0
+        } for device in self.devices}
         self.completed_history: deque = deque(maxlen=max_history)
         self.total_completed = 0
         self.total_failed = 0
-        self.worker_thread: Optional[threading.Thread] = None
+        self.worker_threads: List[threading.Thread] = []
         self.running = True
         self.avg_process_time = 30.0  # Initial estimate in seconds
+        self.stage_totals: Dict[str, Dict[str, Any]] = {}  # per-stage timing totals over completed tasks
+        self.throughput: Dict[str, List[float]] = {}  # task_id -> [first report time, frames done then, last report time]
+        self.events = EventBroker()
+        self.store = store
+        self.persist_seq = 0  # orders task snapshots written to the store
+        self.finished: deque = deque()  # (finish time, task_id) of completed/failed tasks, oldest first
+        if store is not None:
+            self._restore()
         
     def start_worker(self):
-        """Start the background worker thread"""
-        self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
-        self.worker_thread.start()
-        print("[Queue] Worker thread started - Serial GPU processing enabled")
+        """Start the decode, GPU and encode stage threads"""
+        for i, device in enumerate(self.devices):
+            for name, target, args in (('decode', self._decode_loop, ()),
+                                       ('gpu', self._worker_loop, (device,)),
+                                       ('encode', self._encode_loop, ())):
+                thread = threading.Thread(target=target, args=args, name=f"queue-{name}-{i}", daemon=True)
+                thread.start()
+                self.worker_threads.append(thread)
+        thread = threading.Thread(target=self._queue_event_loop, name='queue-events', daemon=True)
+        thread.start()
+        self.worker_threads.append(thread)
+        if TASK_TTL > 0 or TASK_STORE_MAX > 0:
+            thread = threading.Thread(target=self._evict_loop, name='queue-evict', daemon=True)
+            thread.start()
+            self.worker_threads.append(thread)
+        print(f"[Queue] Pipeline started - decode / GPU / encode stages, {len(self.devices)} worker(s): {', '.join(self.devices)}")
+    
+    def _restore(self):
+        """Reload stored tasks - finished ones for status and download, unfinished ones back into the queue"""
+        requeued = 0
+        for task in self.store.load():
+            task_id = task['id']
+            if task['status'] in ('completed', 'failed'):
+                self.tasks[task_id] = task
+                finished_at = datetime.fromisoformat(task['completed_at']).timestamp() if task.get('completed_at') else time.time()
+                self.finished.append((finished_at, task_id))
+                continue
+            
+            # Interrupted before finishing - drop partial outputs and start it over
+            for path in glob.glob(os.path.join(OUTPUT_FOLDER, f"{glob.escape(task_id)}_*")):
+                os.remove(path)
+            for key in ('stage', 'device', 'devices', 'started_at', 'start_time', 'timings',
+                        'partial_output_path', 'batch', 'runner_cache_hit', 'latent_cache',
+                        'frames_done', 'frames_total', 'frames_per_second', 'remaining_seconds'):
+                task.pop(key, None)
+            task['progress'] = 0
+            task['restarts'] = task.get('restarts', 0) + 1
+            self.tasks[task_id] = task
+            if not os.path.exists(task['input_path']):
+                task.update(status='failed', error='Input file missing after restart', completed_at=datetime.now().isoformat())
+                self.finished.append((time.time(), task_id))
+                self.store.save(task)
+                continue
+            task['status'] = 'queued'
+            self.pending.add(task_id, PRIORITY_LEVELS.get(task.get('priority', 'normal'), PRIORITY_LEVELS['normal']),
+                             task.get('predicted_duration', self.avg_process_time), task.get('submitted_at', time.time()))
+            requeued += 1
         
-    def _worker_loop(self):
-        """Main worker loop - processes tasks one by one"""
+        self.finished = deque(sorted(self.finished))
+        self.completed_history.extend(task_id for _, task_id in self.finished
+                                      if self.tasks[task_id]['status'] == 'completed')
+        print(f"[Queue] Restored {len(self.tasks)} task(s) from {self.store.path}, re-enqueued {requeued}")
+    
+    def _store_record(self, task_id: str) -> Optional[Tuple[str, str, str, int]]:
+        """Serialized task record for _persist - caller holds self.lock, so the copy is consistent"""
+        if self.store is None or task_id not in self.tasks:
+            return None
+        self.persist_seq += 1
+        task = self.tasks[task_id]
+        return task_id, task['status'], json.dumps(task, default=str), self.persist_seq
+    
+    def _persist(self, record: Optional[Tuple[str, str, str, int]]):
+        """Write a _store_record snapshot to the store - called after releasing self.lock so SQLite commits never block the queue"""
+        if record is not None:
+            self.store.write(*record)
+    
+    def _evict_loop(self):
+        interval = max(1.0, min(60.0, TASK_TTL / 4)) if TASK_TTL > 0 else 60.0
         while self.running:
+            time.sleep(interval)
             try:
-                # Wait for next task (with timeout to check running flag)
+                self.evict_expired()
+                uploads.expire()
+            except Exception as e:
+                print(f"[Queue] Eviction error: {e}")
+    
+    def evict_expired(self) -> int:
+        """Drop finished tasks older than TASK_TTL or beyond TASK_STORE_MAX and delete their files"""
+        expired = []
+        with self.lock:
+            cutoff = time.time() - TASK_TTL
+            while self.finished and ((TASK_TTL > 0 and self.finished[0][0] < cutoff)
+                                     or (TASK_STORE_MAX > 0 and len(self.finished) > TASK_STORE_MAX)):
+                _, task_id = self.finished.popleft()
+                task = self.tasks.pop(task_id, None)
+                if task is not None:
+                    expired.append(task)
+        if not expired:
+            return 0
+        
+        for task in expired:
+            for path in (task.get('input_path'), task.get('output_path')):
                 try:
-                    task_id = self.queue.get(timeout=1.0)
-                except queue.Empty:
+                    if path and os.path.exists(path):
+                        os.remove(path)
+                except OSError as e:
+                    print(f"[Queue] Could not delete {path}: {e}")
+        if self.store is not None:
+            self.store.delete([task['id'] for task in expired])
+        print(f"[Queue] Evicted {len(expired)} finished task(s) and their files")
+        return len(expired)
+    
+    def _task_event(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Small status payload pushed to event subscribers - caller holds self.lock"""
+        task = self.tasks.get(task_id)
+        if task is None:
+            return None
+        event = {'task_id': task_id, 'status': task['status'], 'progress': task['progress']}
+        for key in ('stage', 'device', 'frames_done', 'frames_total', 'frames_per_second', 'remaining_seconds',
+                    'error', 'output_filename', 'output_resolution', 'process_time'):
+            if key in task:
+                event[key] = task[key]
+        return event
+    
+    def _notify(self, task_id: str):
+        """Push a task's current state to its subscribers - caller holds self.lock"""
+        if self.events.subscriber_count:
+            event = self._task_event(task_id)
+            if event is not None:
+                self.events.publish('task', event, task_id)
+    
+    def get_task_event(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Current 'task' event payload for a task, None if unknown"""
+        with self.lock:
+            return self._task_event(task_id)
+    
+    def queue_summary(self) -> Dict[str, Any]:
+        """Queue counters pushed as 'queue' events"""
+        with self.lock:
+            snapshot = self._snapshot()
+            return {
+                'queue_length': self._waiting_count(),
+                'processing': sum(1 for w in self.workers.values() if w['task_id']),
+                'processing_tasks': {device: worker['task_id'] for device, worker in self.workers.items()},
+                'total_completed': self.total_completed,
+                'total_failed': self.total_failed,
+                'avg_process_time': round(self.avg_process_time, 1),
+                'estimated_total_wait': int(snapshot['eta'][-1])
+            }
+    
+    def _queue_event_loop(self):
+        """Publish a queue summary whenever queue order or running tasks change"""
+        published = None
+        while self.running:
+            time.sleep(EVENT_QUEUE_INTERVAL)
+            if self.events.subscriber_count and self.version != published:
+                published = self.version
+                try:
+                    self.events.publish('queue', self.queue_summary())
+                except Exception as e:
+                    print(f"[Queue] Event publish error: {e}")
+    
+    @property
+    def current_task_id(self) -> Optional[str]:
+        """Task on the first busy device (single-device compatible view)"""
+        return next((w['task_id'] for w in list(self.workers.values()) if w['task_id']), None)
+    
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Blocking put that gives up on shutdown"""
+        while self.running:
+            try:
+                q.put(item, timeout=1.0)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _decode_loop(self):
+        """Stage 1 (CPU) - download check and input decode for the next queued task"""
+        name = threading.current_thread().name
+        while self.running:
+            with self.pending_cond:
+                if not self.pending:
+                    self.pending_cond.wait(timeout=1.0)
                     continue
-                
+                self.pending.advance(time.time())
+                task_id = self.pending.pop_first()
+                self.version += 1
+                task = self.tasks[task_id]
+                task['stage'] = 'decoding'
+                self.stage_tasks['decode'][name] = task_id
+            
+            try:
+                job = self._prepare_input(task_id, task['input_path'], task['params'])
+            except Exception as e:
+                self._fail(task_id, e)
+                job = None
+            finally:
                 with self.lock:
-                    if task_id not in self.tasks:
-                        continue
-                    self.current_task_id = task_id
-                    self.tasks[task_id]['status'] = 'processing'
-                    self.tasks[task_id]['started_at'] = datetime.now().isoformat()
-                    
-                print(f"[Queue] Processing task {task_id}")
+                    self.stage_tasks['decode'].pop(name, None)
+            
+            if job is not None:
+                # Images may overfill the ready list by a batch so they can be coalesced
+                capacity = self.ready_capacity + (IMAGE_BATCH_MAX - 1 if job.get('batch_key') else 0)
+                with self.ready_cond:
+                    while self.running and len(self.ready_jobs) >= capacity:
+                        self.ready_cond.wait(timeout=1.0)
+                    task['stage'] = 'ready'
+                    job['ready_at'] = time.time()
+                    self.ready_jobs.extend(job.pop('segment_jobs', None) or [job])
+                    self.version += 1
+                    self.ready_cond.notify_all()
+    
+    def _next_job(self, device: str) -> Optional[Dict[str, Any]]:
+        """Pick a ready job for device - caller holds self.lock
+        
+        Prefers the oldest job whose runner is resident on this device. Otherwise
+        takes the oldest job, skipping ones an idle device already has loaded.
+        """
+        if not self.ready_jobs:
+            return None
+        idle = [d for d, w in self.workers.items() if d != device and w['task_id'] is None]
+        fallback = None
+        for job in self.ready_jobs:
+            if runner_pool.is_resident(ResidentRunnerPool.make_key(job['params'], device)):
+                return job
+            if fallback is None and not any(
+                    runner_pool.is_resident(ResidentRunnerPool.make_key(job['params'], d)) for d in idle):
+                fallback = job
+        return fallback
+    
+    @staticmethod
+    def _batch_params(params: Dict[str, Any]) -> Tuple:
+        """Settings that must match for image tasks to share one runner prep"""
+        return (ResidentRunnerPool.make_key(params, ''), params.get('tf32', 'on'))
+    
+    def _collect_batch(self, job: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Ready jobs to run together with job, or None to keep waiting - caller holds self.lock
+        
+        Image jobs with the same batch key (runner settings and TF32 mode)
+        are coalesced up to IMAGE_BATCH_MAX. A short batch waits up to
+        IMAGE_BATCH_WAIT seconds after job became ready, but only while
+        compatible tasks are decoding or next in line to be.
+        """
+        key = job.get('batch_key')
+        if key is None:
+            return [job]
+        batch = [job] + [j for j in self.ready_jobs if j is not job and j.get('batch_key') == key]
+        batch = batch[:IMAGE_BATCH_MAX]
+        if len(batch) < IMAGE_BATCH_MAX and time.time() < job['ready_at'] + IMAGE_BATCH_WAIT:
+            coming = self.pending.head(IMAGE_BATCH_MAX) + list(self.stage_tasks['decode'].values())
+            if any(Path(self.tasks[tid]['input_path']).suffix.lower() not in VIDEO_EXTENSIONS
+                   and self._batch_params(self.tasks[tid]['params']) == key for tid in coming):
+                return None
+        return batch
+    
+    @staticmethod
+    def _merge_batch(batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Fold image jobs into one job that acquires the runner once and runs each member's own pass"""
+        lead = {key: value for key, value in batch[0].items() if key != 'frames'}
+        return dict(lead, batch=batch, batch_tasks=[member['task_id'] for member in batch])
+    
+    def _split_batch(self, job: Dict[str, Any]):
+        """Give each member the batch's device and an equal share of the shared runner prep time"""
+        batch = job['batch']
+        for member in batch:
+            member['device'] = job['device']
+        with self.lock:
+            entry = self.tasks[job['task_id']].get('timings', {}).get('runner_prep')
+            if entry is None:
+                return
+            entry = dict(entry)
+            for member in batch:
+                timings = self.tasks[member['task_id']].setdefault('timings', {})
+                timings['runner_prep'] = dict(entry, wall=round(entry['wall'] / len(batch), 3))
+                if 'cuda' in entry:
+                    timings['runner_prep']['cuda'] = round(entry['cuda'] / len(batch), 3)
+    
+    def _worker_loop(self, device: str):
+        """Stage 2 (GPU) - processes prepared tasks one by one on device"""
+        if device.startswith('cuda'):
+            torch.cuda.set_device(device)
+        worker = self.workers[device]
+        while self.running:
+            with self.ready_cond:
+                job = self._next_job(device)
+                if job is None:
+                    self.ready_cond.wait(timeout=1.0)
+                    continue
+                batch = self._collect_batch(job)
+                if batch is None:
+                    self.ready_cond.wait(timeout=max(0.01, job['ready_at'] + IMAGE_BATCH_WAIT - time.time()))
+                    continue
+                for member in batch:
+                    self.ready_jobs.remove(member)
+                self.version += 1
+                self.ready_cond.notify_all()
+                if len(batch) > 1:
+                    job = self._merge_batch(batch)
                 
-                # Process the task
+                task_id = job['task_id']
+                member_ids = job.get('batch_tasks', [task_id])
+                segment = job.get('segment')
+                if segment is not None and segment['state']['failed']:
+                    job.pop('reader').close()  # another segment of this video already failed
+                    continue
+                job['device'] = device
+                worker['task_id'] = task_id
+                worker['busy_since'] = time.time()
                 task = self.tasks[task_id]
-                self._process_task(task_id, task['input_path'], task['params'])
-                
+                work = sum(self.tasks[tid].get('work', 0.0) for tid in member_ids)
+                for tid in member_ids:
+                    member = self.tasks[tid]
+                    if member['status'] == 'queued':
+                        member['status'] = 'processing'
+                        member['stage'] = 'gpu'
+                        member['started_at'] = datetime.now().isoformat()
+                        member['start_time'] = time.time()
+                        self._notify(tid)
+                    if len(member_ids) > 1:
+                        member['batch'] = {'tasks': member_ids,
+                                           'predicted_duration': round(duration_model.predict(task['params'], work), 1)}
+                if segment is not None:
+                    task.setdefault('devices', []).append(device)
+                else:
+                    for tid in member_ids:
+                        self.tasks[tid]['device'] = device
+            print(f"[Queue] Processing task {task_id} on {device}"
+                  + (f" (segment {segment['index'] + 1}/{segment['state']['count']})" if segment else "")
+                  + (f" (batch of {len(member_ids)} images)" if len(member_ids) > 1 else ""))
+            
+            try:
+                self._run_gpu_stage(job)
+                if 'batch' in job:
+                    self._split_batch(job)
                 with self.lock:
-                    self.current_task_id = None
-                    
-                self.queue.task_done()
-                
+                    gpu_seconds = time.time() - task['start_time']
+                    worker['completed'] += len(member_ids)
+                if segment is None:
+                    duration_model.observe(task['params'], work, gpu_seconds)
             except Exception as e:
-                print(f"[Queue] Worker error: {e}")
+                job['error'] = e
                 with self.lock:
-                    if self.current_task_id:
-                        self.tasks[self.current_task_id]['status'] = 'failed'
-                        self.tasks[self.current_task_id]['error'] = str(e)
-                    self.current_task_id = None
-                    
-    def _process_task(self, task_id: str, input_path: str, params: Dict[str, Any]):
-        """Process a single task - GPU exclusive"""
-        import torch
-        import cv2
-        import numpy as np
+                    worker['failed'] += len(member_ids)
+                if segment is None or self._abort_segments(segment['state']):
+                    for tid in member_ids:
+                        self._fail(tid, e)
+            finally:
+                with self.ready_cond:
+                    worker['busy'].append((worker['busy_since'], time.time()))
+                    worker['busy_since'] = None
+                    worker['task_id'] = None
+                    self.version += 1
+                    # Jobs skipped for this device's resident runner may now be ours
+                    self.ready_cond.notify_all()
+            
+            # A split video is stitched once its last segment is done
+            if 'error' not in job and (segment is None or job.get('stitch')):
+                for finished in job.get('batch', [job]):
+                    with self.lock:
+                        self.tasks[finished['task_id']]['stage'] = 'encoding'
+                    self._put(self.encode_queue, finished)
+    
+    def _encode_loop(self):
+        """Stage 3 (CPU) - encodes/saves GPU results and marks tasks completed"""
+        while self.running:
+            try:
+                job = self.encode_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            
+            task_id = job['task_id']
+            name = threading.current_thread().name
+            with self.lock:
+                self.stage_tasks['encode'][name] = task_id
+            try:
+                self._finalize(job)
+            except Exception as e:
+                self._fail(task_id, e)
+            finally:
+                with self.lock:
+                    self.stage_tasks['encode'].pop(name, None)
+    
+    @contextmanager
+    def _stage(self, task_id: str, stage: str, device: Optional[str] = None):
+        """Time a processing stage and fold it into the task's timings
         
+        Records host wall time and, for GPU stages (device given), CUDA-synchronized
+        time and peak allocated VRAM. Repeated stages (video chunks) accumulate.
+        """
+        cuda = device is not None and device.startswith('cuda')
+        if cuda:
+            torch.cuda.synchronize(device)
+            torch.cuda.reset_peak_memory_stats(device)
+        start = time.perf_counter()
         try:
+            yield
+        finally:
+            sample = {'wall': time.perf_counter() - start}
+            if cuda:
+                try:
+                    torch.cuda.synchronize(device)
+                    sample['cuda'] = time.perf_counter() - start
+                    sample['peak_vram_mb'] = torch.cuda.max_memory_allocated(device) // (1024 * 1024)
+                except Exception:
+                    pass  # device may be unusable after a failure
+            sample['rss_mb'] = process_rss_mb()
+            labels = None
             with self.lock:
-                self.tasks[task_id]['progress'] = 0
-                self.tasks[task_id]['start_time'] = time.time()
-            
-            # Import processing modules
-            from src.core.generation_utils import setup_generation_context, prepare_runner
-            from src.core.generation_phases import encode_all_batches, upscale_all_batches, decode_all_batches, postprocess_all_batches
-            from src.utils.downloads import download_weight
-            
-            # TF32 setting from UI
-            tf32_enabled = params.get("tf32", "on") == "on"
-            torch.backends.cudnn.allow_tf32 = tf32_enabled
-            torch.backends.cuda.matmul.allow_tf32 = tf32_enabled
-
-            debug = Debug(enabled=params.get('debug', False))
-            dit_model = params.get('dit_model', DEFAULT_DIT)
-            download_weight(dit_model=dit_model, vae_model=DEFAULT_VAE, model_dir=MODEL_DIR, debug=debug)
-            
-            # Load input
-            ext = Path(input_path).suffix.lower()
-            is_video = ext in {'.mp4', '.avi', '.mov', '.mkv', '.webm'}
-            
-            if is_video:
-                cap = cv2.VideoCapture(input_path)
-                fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-                frames = []
-                while True:
-                    ret, frame = cap.read()
-                    if not ret:
-                        break
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
-                    frames.append(frame)
-                cap.release()
-                frames_tensor = torch.from_numpy(np.stack(frames)).to(torch.float16)
+                if task_id in self.tasks:
+                    labels = self._metric_labels(self.tasks[task_id])
+                    timings = self.tasks[task_id].setdefault('timings', {})
+                    entry = timings.setdefault(stage, {'calls': 0, 'wall': 0.0})
+                    entry['calls'] += 1
+                    entry['wall'] = round(entry['wall'] + sample['wall'], 3)
+                    if 'cuda' in sample:
+                        entry['cuda'] = round(entry.get('cuda', 0.0) + sample['cuda'], 3)
+                        entry['peak_vram_mb'] = max(entry.get('peak_vram_mb', 0), sample['peak_vram_mb'])
+                    if sample['rss_mb'] is not None:
+                        entry['rss_mb'] = max(entry.get('rss_mb', 0), sample['rss_mb'])
+            if labels is not None:
+                metrics.observe('phase_seconds', sample.get('cuda', sample['wall']), dict(labels, phase=stage))
+                if 'peak_vram_mb' in sample:
+                    metrics.set_max('vram_peak_bytes', torch.cuda.max_memory_allocated(device), {'device': device})
+    
+    @staticmethod
+    def _metric_labels(task: Dict[str, Any]) -> Dict[str, str]:
+        """Prometheus labels for a task record - resolution is bucketed to keep the series bounded"""
+        params = task['params']
+        return {
+            'model': model_label(params.get('dit_model', DEFAULT_DIT)),
+            'resolution': str(duration_model.bucket(int(params.get('resolution', 1080)))),
+            'is_video': str(Path(task['input_path']).suffix.lower() in VIDEO_EXTENSIONS).lower()
+        }
+    
+    def _metric_queue_depth(self) -> List[Tuple[Dict[str, str], float]]:
+        """Per-stage queue depth for /metrics - lock-free reads only"""
+        return [({'stage': 'decode'}, len(self.pending)),
+                ({'stage': 'gpu'}, len(self.ready_jobs)),
+                ({'stage': 'encode'}, self.encode_queue.qsize())]
+    
+    def _metric_stage_busy(self) -> List[Tuple[Dict[str, str], float]]:
+        """Tasks held by each pipeline stage - lock-free reads only"""
+        return [({'stage': 'decode'}, len(self.stage_tasks['decode'])),
+                ({'stage': 'gpu'}, sum(1 for w in list(self.workers.values()) if w['task_id'])),
+                ({'stage': 'encode'}, len(self.stage_tasks['encode']))]
+    
+    def _aggregate_timings(self, timings: Dict[str, Dict[str, Any]]):
+        """Fold a completed task's stage timings into queue-wide totals - caller holds self.lock"""
+        for stage, entry in timings.items():
+            total = self.stage_totals.setdefault(stage, {'tasks': 0, 'wall': 0.0, 'cuda': 0.0, 'peak_vram_mb': 0})
+            total['tasks'] += 1
+            total['wall'] += entry['wall']
+            total['cuda'] += entry.get('cuda', 0.0)
+            total['peak_vram_mb'] = max(total['peak_vram_mb'], entry.get('peak_vram_mb', 0))
+    
+    def _fail(self, task_id: str, e: Exception):
+        import traceback
+        with self.lock:
+            if task_id in self.tasks:
+                self.tasks[task_id]['status'] = 'failed'
+                self.version += 1
+                self.tasks[task_id]['error'] = str(e)
+                self.tasks[task_id]['traceback'] = traceback.format_exc()
+                self.tasks[task_id]['completed_at'] = datetime.now().isoformat()
+                self.tasks[task_id].pop('partial_output_path', None)
+                self.tasks[task_id].pop('stage', None)
+                self.tasks[task_id].pop('remaining_seconds', None)
+                self.throughput.pop(task_id, None)
+                self.finished.append((time.time(), task_id))
+                record = self._store_record(task_id)
+                self._notify(task_id)
+                labels = self._metric_labels(self.tasks[task_id])
+            else:
+                record, labels = None, {}
+            self.total_failed += 1
+        self._persist(record)
+        metrics.inc('tasks_failed_total', labels)
+        print(f"[Queue] Task {task_id} failed: {e}")
+    
+    def _prepare_input(self, task_id: str, input_path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Download check and input decode - runs on the decode thread"""
+        from src.utils.downloads import download_weight
+        
+        debug = Debug(enabled=params.get('debug', False))
+        with self._stage(task_id, 'download_check'):
+            download_weight(dit_model=params.get('dit_model', DEFAULT_DIT), vae_model=DEFAULT_VAE, model_dir=MODEL_DIR, debug=debug)
+        
+        with self._stage(task_id, 'input_decode'):
+            job = self._decode_input(task_id, input_path, params, debug)
+        self._update_progress(task_id, 10)
+        return job
+    
+    def _decode_input(self, task_id: str, input_path: str, params: Dict[str, Any], debug: Debug) -> Dict[str, Any]:
+        import cv2
+        # Long videos are streamed chunk by chunk by the GPU stage instead of decoded up front
+        ext = Path(input_path).suffix.lower()
+        is_video = ext in VIDEO_EXTENSIONS
+        job = {'task_id': task_id, 'input_path': input_path, 'params': params,
+               'is_video': is_video, 'debug': debug, 'chunk_frames': 0}
+        
+        if is_video:
+            # A video queued before its upload finished is streamed as the bytes arrive, on one device
+            growing = uploads.waiter(input_path)
+            reader = VideoFrameReader(input_path, growing=growing, batch_size=params.get('batch_size', 5))
+            job['fps'] = reader.fps
+            segments = self._plan_segments(reader.frame_count, params) if growing is None else []
+            span = segments[0][1] + self._overlap(params, segments[0][1]) if segments else reader.frame_count
+            chunk_frames = self._chunk_frames(params, span, reader.height, reader.width)
+            if segments:
+                reader.close()
+                job['segment_jobs'] = self._segment_jobs(job, segments, chunk_frames, reader.frame_count)
+            elif chunk_frames and (growing is not None or reader.frame_count > chunk_frames):
+                job['chunk_frames'] = chunk_frames
+                job['reader'] = reader
+                # A growing input's audio track is incomplete until the upload finishes - mux it afterwards
+                job['mux_audio'] = growing is not None
             else:
-                frame = cv2.imread(input_path, cv2.IMREAD_UNCHANGED)
-                if frame.shape[2] == 4:
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2RGBA)
+                try:
+                    job['frames'] = reader.read_all()
+                finally:
+                    reader.close()
+        else:
+            frame = cv2.imread(input_path, cv2.IMREAD_UNCHANGED)
+            if frame is None:
+                raise ValueError(f"Cannot read image: {Path(input_path).name}")
+            if frame.ndim == 2:
+                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
+            elif frame.shape[2] == 4:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2RGBA)
+            else:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            job['frames'] = torch.from_numpy(frame[None, ...]).to(torch.float16).div_(255.0)
+            job['fps'] = 30.0
+            if IMAGE_BATCH_MAX > 1:
+                job['batch_key'] = self._batch_params(params)
+        return job
+    
+    @staticmethod
+    def _chunk_frames(params: Dict[str, Any], frame_count: int, height: int, width: int) -> int:
+        """Frames per chunk for a clip (or segment) of frame_count frames, 0 to run it whole
+        
+        An explicit chunk_batches wins. Otherwise a clip whose upscaled frames
+        would exceed VIDEO_WHOLE_MAX_GB is chunked at VIDEO_AUTO_CHUNK_BATCHES
+        batches, fewer if such a chunk would not fit either, so host memory
+        follows the batch size instead of the clip length.
+        """
+        batch_size = max(1, params.get('batch_size', 5))
+        chunk_batches = int(params.get('chunk_batches', VIDEO_CHUNK_BATCHES))
+        if chunk_batches:
+            return chunk_batches * batch_size
+        budget = int(VIDEO_WHOLE_MAX_GB * 1024**3)
+        per_frame = max(upscaled_bytes(1, height, width, params.get('resolution', 1080)), 1)
+        if budget <= 0 or frame_count * per_frame <= budget:
+            return 0
+        return max(1, min(VIDEO_AUTO_CHUNK_BATCHES, budget // (per_frame * batch_size))) * batch_size
+    
+    def _plan_segments(self, frame_count: int, params: Dict[str, Any]) -> List[Tuple[int, Optional[int]]]:
+        """Split a long video into one (start, length) temporal segment per device
+        
+        Segment lengths are whole multiples of the 4n+1 batch size so batch
+        boundaries line up; the last segment runs to the end of the stream.
+        Returns [] when the video should stay on a single device.
+        """
+        count = len(self.devices)
+        if (count < 2 or SEGMENT_MIN_FRAMES <= 0 or frame_count < SEGMENT_MIN_FRAMES
+                or params.get('segment_parallel', 'auto') == 'off'):
+            return []
+        batch_size = max(1, params.get('batch_size', 5))
+        length = -(-frame_count // (count * batch_size)) * batch_size
+        starts = list(range(0, frame_count, length))
+        if len(starts) < 2:
+            return []
+        return [(start, length if i < len(starts) - 1 else None) for i, start in enumerate(starts)]
+    
+    def _segment_jobs(self, job: Dict[str, Any], segments: List[Tuple[int, Optional[int]]],
+                      chunk_frames: int, frame_count: int) -> List[Dict[str, Any]]:
+        """One GPU job per segment, sharing a state dict used to collect the parts
+        
+        Every segment after the first starts `overlap` frames early; those
+        frames are produced by both neighbours and cross-faded when stitching.
+        """
+        overlap = self._overlap(job['params'], chunk_frames or segments[0][1])
+        state = {
+            'count': len(segments),
+            'pending': len(segments),
+            'parts': [None] * len(segments),
+            'done': [0] * len(segments),
+            'total': max(frame_count, 1),
+            'failed': False
+        }
+        jobs = []
+        for index, (start, length) in enumerate(segments):
+            lead = overlap if index else 0
+            reader = VideoFrameReader(job['input_path'], start=start - lead,
+                                      limit=None if length is None else length + lead,
+                                      batch_size=job['params'].get('batch_size', 5))
+            jobs.append(dict(job, reader=reader, chunk_frames=chunk_frames or max(reader.frame_count, 1),
+                             segment={'index': index, 'state': state}))
+        return jobs
+    
+    def _run_segment(self, job: Dict[str, Any], runner, cache_ctx: Dict[str, Any]):
+        """Process one temporal segment of a split video and record its part"""
+        task_id, segment = job['task_id'], job['segment']
+        state, index = segment['state'], segment['index']
+        path = os.path.join(OUTPUT_FOLDER, f"{task_id}_seg{index}.mp4")
+        
+        def on_frames(done: float):
+            with self.lock:
+                state['done'][index] = done
+                done = sum(state['done'])
+            self._report_frames(task_id, done, state['total'])
+        
+        job['width'], job['height'], frames, head, tail = self._process_chunked(
+            task_id, job['device'], job.pop('reader'), runner, cache_ctx, job['params'], job['debug'],
+            job['chunk_frames'], path, None, hold_head=index > 0, hold_tail=index < state['count'] - 1,
+            on_frames=on_frames)
+        with self.lock:
+            state['parts'][index] = {'path': path, 'frames': frames, 'head': head, 'tail': tail}
+            state['pending'] -= 1
+            failed = state['failed']
+            job['stitch'] = state['pending'] == 0 and not failed
+        if failed and os.path.exists(path):
+            os.remove(path)
+    
+    def _abort_segments(self, state: Dict[str, Any]) -> bool:
+        """Mark a split video failed and drop its finished parts, True for the first caller"""
+        with self.lock:
+            if state['failed']:
+                return False
+            state['failed'] = True
+            parts = [part for part in state['parts'] if part]
+        for part in parts:
+            if os.path.exists(part['path']):
+                os.remove(part['path'])
+        return True
+    
+    def _stitch_segments(self, job: Dict[str, Any], output_path: str) -> int:
+        """Cross-fade the seams between segment parts and join them into output_path, returns frame count"""
+        task_id, params, parts = job['task_id'], job['params'], job['segment']['state']['parts']
+        paths, frames = [], 0
+        try:
+            for index, part in enumerate(parts):
+                prev_tail = parts[index - 1]['tail'] if index else None
+                if prev_tail is not None and part['head'] is not None:
+                    n = min(len(prev_tail), len(part['head']))
+                    ramp = torch.arange(1, n + 1, dtype=torch.float32).div_(n + 1).view(-1, 1, 1, 1)
+                    seam = prev_tail[:n].float().div_(255.0) * (1 - ramp) + part['head'][:n].float().div_(255.0) * ramp
+                    seam_path = os.path.join(OUTPUT_FOLDER, f"{task_id}_seam{index}.mp4")
+                    paths.append(seam_path)
+                    writer = VideoFrameWriter(seam_path, job['fps'], job['width'], job['height'],
+                                              codec=params.get('video_codec'), preset=params.get('video_preset'),
+                                              crf=params.get('video_crf'), fragmented=True)
+                    writer.write(seam)
+                    writer.close()
+                    frames += n
+                paths.append(part['path'])
+                frames += part['frames']
+            concat_videos(paths, output_path, audio_source=job['input_path'])
+        finally:
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+        return frames
+    
+    def _run_gpu_stage(self, job: Dict[str, Any]):
+        """Runner prep and all GPU phases - runs on the GPU thread"""
+        task_id, params, debug = job['task_id'], job['params'], job['debug']
+        member_ids = job.get('batch_tasks', [task_id])
+        
+        def progress(value: int):
+            for tid in member_ids:
+                self._update_progress(tid, value)
+        
+        device = job['device']
+        segment = job.get('segment')
+        runner_key = ResidentRunnerPool.make_key(params, device)
+        # TF32 setting from UI - the flags are process-wide, so hold the gate for the whole GPU stage
+        with self.tf32.hold(params.get('tf32', 'on') == 'on'):
+            try:
+                with self._stage(task_id, 'runner_prep', device=device):
+                    runner, cache_ctx, pool_hit = runner_pool.acquire(runner_key, make_runner_loader(params, device, debug))
+                with self.lock:
+                    for tid in member_ids:
+                        self.tasks[tid]['runner_cache_hit'] = pool_hit
+                metrics.inc('runner_pool_hits_total' if pool_hit else 'runner_pool_misses_total',
+                            {'model': model_label(params.get('dit_model', DEFAULT_DIT))})
+                
+                if segment is not None:
+                    self._run_segment(job, runner, cache_ctx)
+                    return
+                progress(30)
+                
+                if job['chunk_frames']:
+                    job['partial_path'] = os.path.join(OUTPUT_FOLDER, f"{task_id}_partial.mp4")
+                    job['width'], job['height'], job['frames_out'], _, _ = self._process_chunked(
+                        task_id, device, job.pop('reader'), runner, cache_ctx, params, debug,
+                        job['chunk_frames'], job['partial_path'], None if job.get('mux_audio') else job['input_path'])
                 else:
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frame = frame.astype(np.float32) / 255.0
-                frames_tensor = torch.from_numpy(frame[None, ...]).to(torch.float16)
-                fps = 30.0
-            
-            self._update_progress(task_id, 10)
-            
-            # Setup context
-            device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
-            ctx = setup_generation_context(
-                dit_device=device, vae_device=device,
-                dit_offload_device='cpu', vae_offload_device='cpu',
-                tensor_offload_device='cpu', debug=debug
-            )
-            
-            # VAE quality settings
-            vae_quality = params.get('vae_quality', 'high')
-            vae_quality_map = {
-                'low': ((512, 512), (64, 64)),
-                'medium': ((768, 768), (96, 96)),
-                'high': ((1024, 1024), (128, 128))
-            }
-            tile_size, tile_overlap = vae_quality_map.get(vae_quality, vae_quality_map['high'])
-            
-            runner, cache_ctx = prepare_runner(
-                dit_model=dit_model, vae_model=DEFAULT_VAE,
-                model_dir=MODEL_DIR, debug=debug, ctx=ctx,
-                block_swap_config={'blocks_to_swap': params.get('blocks_to_swap', 0)},
-                encode_tiled=params.get('encode_tiled', False),
-                encode_tile_size=tile_size,
-                encode_tile_overlap=tile_overlap,
-                decode_tiled=params.get('decode_tiled', False),
-                decode_tile_size=tile_size,
-                decode_tile_overlap=tile_overlap,
-                dit_cache=False, vae_cache=False
-            )
-            ctx['cache_context'] = cache_ctx if cache_ctx else {}
-            
-            self._update_progress(task_id, 30)
-            
-            # Process
-            resolution = params.get('resolution', 1080)
-            batch_size = params.get('batch_size', 5)
-            
-            ctx = encode_all_batches(runner, ctx=ctx, images=frames_tensor, debug=debug,
-                                     batch_size=batch_size, resolution=resolution)
-            self._update_progress(task_id, 50)
-            
-            ctx = upscale_all_batches(runner, ctx=ctx, debug=debug, seed=params.get('seed', 42))
-            torch.cuda.empty_cache()
-            self._update_progress(task_id, 70)
+                    # Batched images share the runner prep, but each runs its own pass with its own seed
+                    for member in job.get('batch', [job]):
+                        self._run_whole(member, device, runner, cache_ctx)
+            except Exception:
+                # A runner that failed mid-task may hold partial state - don't reuse it
+                runner_pool.evict(runner_key)
+                if 'reader' in job:
+                    job.pop('reader').close()
+                raise
+            finally:
+                runner_pool.release(runner_key)
+                # Always cleanup GPU
+                try:
+                    if torch.cuda.is_available():
+                        torch.cuda.empty_cache()
+                except:
+                    pass
+        progress(90)
+    
+    def _finalize(self, job: Dict[str, Any]):
+        """Save output and mark the task completed - runs on the encode thread"""
+        import cv2
+        task_id, params, input_path = job['task_id'], job['params'], job['input_path']
+        w, h = job['width'], job['height']
+        
+        with self.lock:
+            start_time = self.tasks[task_id].get('start_time', time.time())
+            cache_key = self.tasks[task_id].get('cache_key')
+            labels = self._metric_labels(self.tasks[task_id])
+        elapsed = time.time() - start_time
+        process_time = int(elapsed)
+        output_name = self._output_name(input_path, params, w, h, process_time)
+        
+        with self._stage(task_id, 'save'):
+            if 'segment' in job:
+                output_path = os.path.join(OUTPUT_FOLDER, f"{output_name}.mp4")
+                job['frames_out'] = self._stitch_segments(job, output_path)
+            elif job['chunk_frames']:
+                output_path = os.path.join(OUTPUT_FOLDER, f"{output_name}.mp4")
+                if job.get('mux_audio'):
+                    # The reader only reaches the end once the upload is finalized, so the input is complete here
+                    concat_videos([job['partial_path']], output_path, audio_source=input_path)
+                    os.remove(job['partial_path'])
+                else:
+                    os.replace(job['partial_path'], output_path)
+            elif job['is_video']:
+                output_path = self._save_video(job.pop('result'), output_name, job['fps'], w, h, input_path, params)
+            else:
+                output_path = os.path.join(OUTPUT_FOLDER, f"{output_name}.png")
+                frame_out = job.pop('result')[0].float().mul_(255.0).clamp_(0, 255).to(torch.uint8).numpy()
+                frame_bgr = cv2.cvtColor(frame_out, cv2.COLOR_RGBA2BGRA if frame_out.shape[2] == 4 else cv2.COLOR_RGB2BGR)
+                cv2.imwrite(output_path, frame_bgr)
+        
+        # Mark completed
+        with self.lock:
+            self.tasks[task_id]['status'] = 'completed'
+            self.tasks[task_id]['progress'] = 100
+            self.tasks[task_id]['output_path'] = output_path
+            self.tasks[task_id]['output_filename'] = Path(output_path).name
+            self.tasks[task_id]['output_resolution'] = f"{w}x{h}"
+            self.tasks[task_id]['process_time'] = process_time
+            self.tasks[task_id]['completed_at'] = datetime.now().isoformat()
+            self.tasks[task_id].pop('partial_output_path', None)
+            self.tasks[task_id].pop('stage', None)
+            self.tasks[task_id].pop('remaining_seconds', None)
+            self.throughput.pop(task_id, None)
+            self.total_completed += 1
+            self.completed_history.append(task_id)
+            self.finished.append((time.time(), task_id))
+            record = self._store_record(task_id)
+            self._notify(task_id)
+            self._aggregate_timings(self.tasks[task_id].get('timings', {}))
+            # Update average process time
+            self.avg_process_time = (self.avg_process_time * 0.8) + (process_time * 0.2)
+        self._persist(record)
+        
+        if cache_key and result_cache is not None:
+            result_cache.put(cache_key, output_path, {'width': w, 'height': h, 'frames': job['frames_out'],
+                                                      'process_time': process_time})
+        metrics.inc('tasks_completed_total', labels)
+        metrics.observe('task_seconds', elapsed, labels)
+        metrics.inc('frames_processed_total', labels, job['frames_out'])
+        metrics.set('task_fps', round(job['frames_out'] / max(elapsed, 1e-6), 3), labels)
+        print(f"[Queue] Task {task_id} completed in {process_time}s")
+    
+    def _run_whole(self, job: Dict[str, Any], device: str, runner, cache_ctx: Dict[str, Any]):
+        """Run a job's decoded frames in one pass, resuming from and filling the latent cache"""
+        task_id, params = job['task_id'], job['params']
+        frames = job.pop('frames')
+        total = len(frames)
+        with self.lock:
+            digest = self.tasks[task_id].get('input_digest')
+        latent_keys = None
+        if latent_cache is not None and digest and latent_cache.fits(total, frames.shape[1], frames.shape[2],
+                                                                     params.get('resolution', 1080)):
+            latent_keys = LatentCache.make_keys(digest, params)
+        
+        self._report_frames(task_id, 0, total)
+        result_tensor = self._run_phases(task_id, device, runner, cache_ctx, frames, params, job['debug'],
+                                         on_frames=lambda done: self._report_frames(task_id, done, total),
+                                         latent_keys=latent_keys)
+        del frames
+        job['result'] = result_tensor
+        job['frames_out'] = result_tensor.shape[0]
+        job['height'], job['width'] = result_tensor.shape[1:3]
+    
+    def _run_phases(self, task_id: str, device: str, runner, cache_ctx: Dict[str, Any], frames: torch.Tensor, params: Dict[str, Any],
+                    debug: Debug, on_frames: Optional[Callable[[float], None]] = None,
+                    latent_keys: Optional[Tuple[str, str]] = None) -> torch.Tensor:
+        """Run encode -> DiT -> decode -> postprocess on frames, returns float CPU frames [N, H, W, C]
+        
+        on_frames receives the frames done so far (fractional) - each phase
+        counts for its share of the pass, and phase functions that take a
+        progress_callback report their finished batches within it.
+        
+        With latent_keys (see LatentCache.make_keys) the pass resumes from the
+        cached decoded frames or encoded latents when present, and stores
+        both for later runs when it computes them.
+        """
+        from src.core.generation_utils import setup_generation_context
+        from src.core.generation_phases import encode_all_batches, upscale_all_batches, decode_all_batches, postprocess_all_batches
+        
+        ctx = setup_generation_context(
+            dit_device=torch_device(device), vae_device=torch_device(device),
+            dit_offload_device='cpu', vae_offload_device='cpu',
+            tensor_offload_device='cpu', debug=debug
+        )
+        ctx['cache_context'] = cache_ctx if cache_ctx else {}
+        
+        with self.lock:
+            shares = self._phase_shares()
+        n = len(frames)
+        finished = [0.0]  # share of the pass done by earlier phases
+        
+        def hook(fn: Callable, phase: str) -> Dict[str, Any]:
+            """progress_callback reporting batches done inside a phase, if fn accepts one"""
+            if on_frames is None or not accepts_kwarg(fn, 'progress_callback'):
+                return {}
+            base = finished[0]
             
-            ctx = decode_all_batches(runner, ctx=ctx, debug=debug)
-            self._update_progress(task_id, 85)
+            def callback(batch: int, batches: int, *_):
+                on_frames(n * (base + shares[phase] * min(1.0, batch / max(batches, 1))))
+            return {'progress_callback': callback}
+        
+        def phase_done(*phases: str):
+            finished[0] += sum(shares[phase] for phase in phases)
+            if on_frames:
+                on_frames(n * min(1.0, finished[0]))
+        
+        resume = self._load_latents(task_id, latent_keys) if latent_keys else None
+        before = snapshot_context(ctx)
+        if resume is not None:
+            ctx.update(resume[1])
+        
+        if resume is None:
+            with self._stage(task_id, 'vae_encode', device=device):
+                ctx = encode_all_batches(runner, ctx=ctx, images=frames, debug=debug,
+                                         batch_size=params.get('batch_size', 5), resolution=params.get('resolution', 1080),
+                                         **hook(encode_all_batches, 'vae_encode'))
+            if latent_keys:
+                with self._stage(task_id, 'latent_cache_save'):
+                    latent_cache.put(latent_keys[0], context_changes(ctx, before))
+        phase_done('vae_encode')
+        
+        if resume is None or resume[0] == 'latents':
+            with self._stage(task_id, 'dit_upscale', device=device):
+                ctx = upscale_all_batches(runner, ctx=ctx, debug=debug, seed=params.get('seed', 42),
+                                          **hook(upscale_all_batches, 'dit_upscale'))
+                torch.cuda.empty_cache()
+            phase_done('dit_upscale')
             
+            with self._stage(task_id, 'vae_decode', device=device):
+                ctx = decode_all_batches(runner, ctx=ctx, debug=debug, **hook(decode_all_batches, 'vae_decode'))
+            if latent_keys:
+                with self._stage(task_id, 'latent_cache_save'):
+                    latent_cache.put(latent_keys[1], context_changes(ctx, before))
+            phase_done('vae_decode')
+        else:
+            phase_done('dit_upscale', 'vae_decode')
+        
+        with self._stage(task_id, 'postprocess', device=device):
             ctx = postprocess_all_batches(ctx=ctx, debug=debug,
-                                          color_correction=params.get('color_correction', 'lab'))
-            
-            # Convert result
+                                          color_correction=params.get('color_correction', 'lab'),
+                                          **hook(postprocess_all_batches, 'postprocess'))
+        phase_done('postprocess')
+        
+        with self._stage(task_id, 'result_copy', device=device):
             result_tensor = ctx['final_video']
             if result_tensor.dtype == torch.bfloat16:
                 result_tensor = result_tensor.to(torch.float32)
-            result = result_tensor.cpu().numpy()
-            
-            # Save output
-            original_name = Path(input_path).stem.split('_', 1)[-1]
-            model_short = dit_model.replace('seedvr2_ema_', '').replace('.safetensors', '').replace('.gguf', '')
-            with self.lock:
-                start_time = self.tasks[task_id].get('start_time', time.time())
-            process_time = int(time.time() - start_time)
-            h, w = result.shape[1:3]
-            output_res = min(h, w)
-            
-            color_correction = params.get('color_correction', 'lab')
-            seed = params.get('seed', 42)
-            encode_tiled = params.get('encode_tiled', False)
-            vae_suffix = f"_vae{vae_quality[0].upper()}" if encode_tiled else ""
-            output_name = f"{original_name}_{model_short}_{output_res}p_b{batch_size}_c{color_correction}_s{seed}{vae_suffix}_{process_time}s"
-            
-            if is_video:
-                output_path = self._save_video(result, output_name, fps, w, h, input_path)
-            else:
-                output_path = os.path.join(OUTPUT_FOLDER, f"{output_name}.png")
-                frame_out = (result[0] * 255).astype(np.uint8)
-                frame_bgr = cv2.cvtColor(frame_out, cv2.COLOR_RGBA2BGRA if frame_out.shape[2] == 4 else cv2.COLOR_RGB2BGR)
-                cv2.imwrite(output_path, frame_bgr)
-            
-            # Mark completed
+            return result_tensor.cpu()
+    
+    def _load_latents(self, task_id: str, latent_keys: Tuple[str, str]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """('decoded' | 'latents', cached context entries) for the furthest cached phase, None on a miss"""
+        with self._stage(task_id, 'latent_cache_load'):
+            for level, key in (('decoded', latent_keys[1]), ('latents', latent_keys[0])):
+                state = latent_cache.get(key)
+                if state is not None:
+                    break
+        with self.lock:
+            if task_id in self.tasks:
+                self.tasks[task_id]['latent_cache'] = level if state is not None else 'miss'
+        metrics.inc('latent_cache_hits_total' if state is not None else 'latent_cache_misses_total')
+        return (level, state) if state is not None else None
+    
+    def _process_chunked(self, task_id: str, device: str, reader: 'VideoFrameReader', runner, cache_ctx: Dict[str, Any],
+                         params: Dict[str, Any], debug: Debug, chunk_frames: int,
+                         output_path: str, input_path: Optional[str], hold_head: bool = False, hold_tail: bool = False,
+                         on_frames: Optional[Callable[[float], None]] = None
+                         ) -> Tuple[int, int, int, Optional[torch.Tensor], Optional[torch.Tensor]]:
+        """Run all phases chunk by chunk, streaming finished frames to output_path
+        
+        Each chunk after the first is prefixed with the last `overlap` input
+        frames of the previous one for temporal context. The matching output
+        frames are held back and cross-faded with the next chunk's prefix, so
+        host memory stays bounded by chunk_frames regardless of clip length.
+        
+        For a segment of a split video, hold_head/hold_tail keep the first/last
+        `overlap` output frames out of the file and return them (uint8) so the
+        seams can be blended with the neighbouring segments. on_frames receives
+        the running count of input frames processed, fractional mid-chunk;
+        without it the task's frame progress is reported directly and
+        output_path is published as its partial output.
+        Returns (width, height, frames written, head, tail).
+        """
+        overlap = self._overlap(params, chunk_frames)
+        writer = None
+        tail_in = tail_out = head = None
+        done = 0
+        processed = 0
+        
+        if on_frames is None:
+            # frame_count can grow while a still-uploading input is read
+            on_frames = lambda n: self._report_frames(task_id, n, reader.frame_count)
             with self.lock:
-                self.tasks[task_id]['status'] = 'completed'
-                self.tasks[task_id]['progress'] = 100
-                self.tasks[task_id]['output_path'] = output_path
-                self.tasks[task_id]['output_filename'] = Path(output_path).name
-                self.tasks[task_id]['output_resolution'] = f"{w}x{h}"
-                self.tasks[task_id]['process_time'] = process_time
-                self.tasks[task_id]['completed_at'] = datetime.now().isoformat()
-                self.total_completed += 1
-                self.completed_history.append(task_id)
-                # Update average process time
-                self.avg_process_time = (self.avg_process_time * 0.8) + (process_time * 0.2)
+                self.tasks[task_id]['partial_output_path'] = output_path
+        on_frames(0)
+        # Decode the next chunk on a helper thread while the GPU works on the current one
+        read_ahead = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chunk-reader')
+        try:
+            pending = read_ahead.submit(reader.read, chunk_frames)
+            while True:
+                with self._stage(task_id, 'input_decode'):
+                    new_frames = pending.result()
+                if new_frames is None:
+                    break
+                pending = read_ahead.submit(reader.read, chunk_frames - overlap)
+                prefix = len(tail_in) if tail_in is not None else 0
+                chunk = torch.cat([tail_in, new_frames]) if prefix else new_frames
+                del new_frames
+                
+                # Context frames were counted with the previous chunk, so only the new ones advance progress
+                base, scale = processed, (len(chunk) - prefix) / len(chunk)
+                out = self._run_phases(task_id, device, runner, cache_ctx, chunk, params, debug,
+                                       on_frames=lambda n: on_frames(base + n * scale)).float()
+                processed += len(chunk) - prefix
+                if writer is None:
+                    h, w = out.shape[1:3]
+                    writer = VideoFrameWriter(output_path, reader.fps, w, h, audio_source=input_path,
+                                              codec=params.get('video_codec'), preset=params.get('video_preset'),
+                                              crf=params.get('video_crf'), fragmented=True)
+                
+                if prefix:
+                    # Cross-fade the overlapping frames from the previous chunk into this one
+                    ramp = torch.arange(1, prefix + 1, dtype=torch.float32).div_(prefix + 1).view(-1, 1, 1, 1)
+                    out[:prefix] = tail_out * (1 - ramp) + out[:prefix] * ramp
                 
-            print(f"[Queue] Task {task_id} completed in {process_time}s")
+                hold = min(overlap, len(chunk))
+                tail_in = chunk[len(chunk) - hold:].clone() if hold else None
+                tail_out = out[len(out) - hold:].clone() if hold else None
+                ready = out[:len(out) - hold]
+                if hold_head and head is None:
+                    head = to_uint8(ready[:overlap])
+                    ready = ready[len(head):]
+                if len(ready):
+                    with self._stage(task_id, 'save'):
+                        writer.write(ready)
+                done += len(ready)
+                del chunk, out, ready
+                torch.cuda.empty_cache()
             
-        except Exception as e:
-            import traceback
-            with self.lock:
-                self.tasks[task_id]['status'] = 'failed'
-                self.tasks[task_id]['error'] = str(e)
-                self.tasks[task_id]['traceback'] = traceback.format_exc()
-                self.tasks[task_id]['completed_at'] = datetime.now().isoformat()
-                self.total_failed += 1
-            print(f"[Queue] Task {task_id} failed: {e}")
+            if writer is None:
+                raise ValueError("Video contains no decodable frames")
+            tail = None
+            with self._stage(task_id, 'save'):
+                if tail_out is not None:
+                    if hold_tail:
+                        tail = to_uint8(tail_out)
+                    else:
+                        writer.write(tail_out)
+                        done += len(tail_out)
+                writer.close()
+            return w, h, done, head, tail
+        except Exception:
+            if writer is not None:
+                writer.abort()
+            raise
         finally:
-            # Always cleanup GPU
-            try:
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-            except:
-                pass
+            read_ahead.shutdown(wait=True)
+            reader.close()
+    
+    @staticmethod
+    def _overlap(params: Dict[str, Any], chunk_frames: int) -> int:
+        """Context frames shared between consecutive chunks/segments"""
+        return max(0, min(VIDEO_CHUNK_OVERLAP, params.get('batch_size', 5) - 1, chunk_frames - 1))
+    
+    def _output_name(self, input_path: str, params: Dict[str, Any], w: int, h: int, process_time: int) -> str:
+        original_name = Path(input_path).stem.split('_', 1)[-1]
+        dit_model = params.get('dit_model', DEFAULT_DIT)
+        model_short = model_label(dit_model)
+        output_res = min(h, w)
+        
+        batch_size = params.get('batch_size', 5)
+        color_correction = params.get('color_correction', 'lab')
+        seed = params.get('seed', 42)
+        encode_tiled = params.get('encode_tiled', False)
+        vae_quality = params.get('vae_quality', 'high')
+        vae_suffix = f"_vae{vae_quality[0].upper()}" if encode_tiled else ""
+        return f"{original_name}_{model_short}_{output_res}p_b{batch_size}_c{color_correction}_s{seed}{vae_suffix}_{process_time}s"
                 
     def _update_progress(self, task_id: str, progress: int):
         with self.lock:
-            if task_id in self.tasks:
+            if task_id in self.tasks and self.tasks[task_id]['progress'] != progress:
                 self.tasks[task_id]['progress'] = progress
-                
-    def _save_video(self, result, output_name, fps, w, h, input_path):
-        """Save video with H.264 encoding"""
-        import cv2
-        import subprocess
-        
-        temp_path = os.path.join(OUTPUT_FOLDER, f"{output_name}_temp.mp4")
-        output_path = os.path.join(OUTPUT_FOLDER, f"{output_name}.mp4")
-        
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        writer = cv2.VideoWriter(temp_path, fourcc, fps, (w, h))
-        for frame in result:
-            frame_bgr = cv2.cvtColor((frame * 255).astype(np.uint8), cv2.COLOR_RGB2BGR)
-            writer.write(frame_bgr)
-        writer.release()
-        
-        # Check audio
-        has_audio = False
-        try:
-            probe = subprocess.run([
-                'ffprobe', '-v', 'error', '-select_streams', 'a',
-                '-show_entries', 'stream=codec_type', '-of', 'csv=p=0', input_path
-            ], capture_output=True, text=True)
-            has_audio = 'audio' in probe.stdout
-        except:
-            pass
+                self._notify(task_id)
+    
+    def _report_frames(self, task_id: str, done: float, total: int):
+        """Record frames done out of frames total for a running task
         
-        # Convert to H.264
+        Progress maps frames done onto 30-90%. The remaining time comes from
+        throughput measured since the task's first report, so it tracks the
+        actual GPU speed instead of the duration predicted at submit.
+        """
+        now = time.time()
+        total = max(total, 1)
+        done = max(0.0, min(done, total))
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None or task['status'] != 'processing':
+                return
+            rate = self.throughput.setdefault(task_id, [now, done, now])
+            rate[2] = now
+            if task.get('frames_done') == round(done, 2):
+                return
+            task['frames_done'] = round(done, 2)
+            task['frames_total'] = total
+            if done > rate[1] and now > rate[0]:
+                fps = (done - rate[1]) / (now - rate[0])
+                task['frames_per_second'] = round(fps, 3)
+                task['remaining_seconds'] = round((total - done) / fps, 1)
+            task['progress'] = min(90, 30 + int(60 * done / total))
+            self._notify(task_id)
+    
+    def _phase_shares(self) -> Dict[str, float]:
+        """Share of a pass spent in each phase, learned from completed tasks - caller holds self.lock"""
+        walls = {phase: self.stage_totals[phase]['wall'] / self.stage_totals[phase]['tasks']
+                 for phase in PHASE_SHARES if phase in self.stage_totals}
+        total = sum(walls.values())
+        if len(walls) < len(PHASE_SHARES) or total <= 0:
+            return PHASE_SHARES
+        return {phase: wall / total for phase, wall in walls.items()}
+                
+    def _save_video(self, result, output_name, fps, w, h, input_path, params):
+        """Save video in a single ffmpeg pass (video + source audio)"""
+        writer = VideoFrameWriter(os.path.join(OUTPUT_FOLDER, f"{output_name}.mp4"), fps, w, h, audio_source=input_path,
+                                  codec=params.get('video_codec'), preset=params.get('video_preset'),
+                                  crf=params.get('video_crf'))
         try:
-            if has_audio:
-                subprocess.run([
-                    'ffmpeg', '-y', '-i', temp_path, '-i', input_path,
-                    '-c:v', 'libx264', '-preset', 'fast', '-crf', '18',
-                    '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-b:a', '192k',
-                    '-map', '0:v:0', '-map', '1:a:0?', '-shortest', output_path
-                ], check=True, capture_output=True)
-            else:
-                subprocess.run([
-                    'ffmpeg', '-y', '-i', temp_path,
-                    '-c:v', 'libx264', '-preset', 'fast', '-crf', '18',
-                    '-pix_fmt', 'yuv420p', output_path
-                ], check=True, capture_output=True)
-            os.remove(temp_path)
-        except:
-            if os.path.exists(temp_path):
-                os.rename(temp_path, output_path)
-        
-        return output_path
+            writer.write(result)
+        except Exception:
+            writer.abort()
+            raise
+        return writer.close()
     
-    def submit(self, task_id: str, input_path: str, params: Dict[str, Any]) -> Dict[str, Any]:
-        """Submit a new task to the queue"""
+    def submit(self, task_id: str, input_path: str, params: Dict[str, Any], cache_key: Optional[str] = None,
+               input_digest: Optional[str] = None, uploading: bool = False) -> Dict[str, Any]:
+        """Submit a new task to the queue, its output is cached under cache_key when it completes
+        
+        input_digest (SHA-256 of the input) lets its GPU pass reuse cached latents.
+        uploading marks an input that is still being uploaded (see UploadManager).
+        """
+        work = DurationModel.work(params, *probe_input(input_path))
+        predicted = duration_model.predict(params, work)
         with self.lock:
-            position = self.queue.qsize() + 1  # +1 for this task
-            estimated_wait = int(position * self.avg_process_time)
-            
             self.tasks[task_id] = {
                 'id': task_id,
                 'status': 'queued',
                 'progress': 0,
                 'input_path': input_path,
                 'params': params,
+                'priority': params.get('priority', 'normal'),
                 'created_at': datetime.now().isoformat(),
-                'queue_position': position,
-                'estimated_wait': estimated_wait
+                'submitted_at': time.time(),
+                'work': round(work, 3),
+                'predicted_duration': round(predicted, 1)
             }
+            if cache_key:
+                self.tasks[task_id]['cache_key'] = cache_key
+            if input_digest:
+                self.tasks[task_id]['input_digest'] = input_digest
+            if uploading:
+                self.tasks[task_id]['uploading'] = True
+            self.pending.add(task_id, PRIORITY_LEVELS.get(params.get('priority', 'normal'), PRIORITY_LEVELS['normal']),
+                             predicted, self.tasks[task_id]['submitted_at'])
+            self.version += 1
+            record = self._store_record(task_id)
+            self._notify(task_id)
+            self.pending_cond.notify()
+            position, estimated_wait = self._position(task_id)
+            self.tasks[task_id]['queue_position'] = position
+            self.tasks[task_id]['estimated_wait'] = estimated_wait
+        self._persist(record)
             
-        self.queue.put(task_id)
+        metrics.inc('tasks_submitted_total', self._metric_labels({'params': params, 'input_path': input_path}))
+        # Warm up offloaded weights while the task waits in the queue
+        for device in self.devices:
+            runner_pool.promote(ResidentRunnerPool.make_key(params, device))
         
         return {
             'task_id': task_id,
             'status': 'queued',
+            'priority': params.get('priority', 'normal'),
             'queue_position': position,
             'estimated_wait_seconds': estimated_wait
         }
     
+    def finish_upload(self, task_id: str, input_digest: str):
+        """Record the input hash of a task queued while its upload was still in progress"""
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None:
+                return
+            task.pop('uploading', None)
+            task['input_digest'] = input_digest
+            record = self._store_record(task_id)
+        self._persist(record)
+    
+    def submit_cached(self, task_id: str, input_path: str, params: Dict[str, Any], entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Record a submission answered from the result cache as an already completed task"""
+        width, height = entry['width'], entry['height']
+        output_path = os.path.join(OUTPUT_FOLDER, f"{self._output_name(input_path, params, width, height, entry['process_time'])}{entry['ext']}")
+        link_or_copy(entry['path'], output_path)
+        now = datetime.now().isoformat()
+        with self.lock:
+            self.tasks[task_id] = {
+                'id': task_id,
+                'status': 'completed',
+                'progress': 100,
+                'input_path': input_path,
+                'params': params,
+                'priority': params.get('priority', 'normal'),
+                'created_at': now,
+                'submitted_at': time.time(),
+                'completed_at': now,
+                'cache_hit': True,
+                'output_path': output_path,
+                'output_filename': Path(output_path).name,
+                'output_resolution': f"{width}x{height}",
+                'process_time': 0
+            }
+            self.total_completed += 1
+            self.completed_history.append(task_id)
+            self.finished.append((time.time(), task_id))
+            record = self._store_record(task_id)
+            self._notify(task_id)
+        self._persist(record)
+        print(f"[Queue] Task {task_id} answered from the result cache")
+        return {
+            'task_id': task_id,
+            'status': 'completed',
+            'cache_hit': True,
+            'priority': params.get('priority', 'normal'),
+            'queue_position': 0,
+            'estimated_wait_seconds': 0
+        }
+    
+    def _remaining_seconds(self, task_id: Optional[str]) -> float:
+        """Predicted GPU seconds left on a running task - caller holds self.lock"""
+        task = self.tasks.get(task_id) if task_id else None
+        if task is None:
+            return 0.0
+        if 'remaining_seconds' in task and task_id in self.throughput:
+            # Live estimate from measured throughput, aged by the time since the last report
+            return max(0.0, task['remaining_seconds'] - (time.time() - self.throughput[task_id][2]))
+        predicted = task['batch']['predicted_duration'] if 'batch' in task else task.get('predicted_duration', self.avg_process_time)
+        return max(0.0, predicted - (time.time() - task['start_time']))
+    
+    def _taken(self) -> List[str]:
+        """Queued tasks already held by a decode thread or the ready list, in run order - caller holds self.lock"""
+        taken = list(self.stage_tasks['decode'].values()) + [job['task_id'] for job in self.ready_jobs]
+        return [tid for tid in dict.fromkeys(taken) if self.tasks[tid]['status'] == 'queued']
+    
+    def _snapshot(self) -> Dict[str, Any]:
+        """Queue order and predicted start times, cached until the queue changes - caller holds self.lock
+        
+        Rebuilding is O(n), so a changed queue is re-snapshotted at most every
+        STATUS_SNAPSHOT_TTL seconds; an unchanged one is refreshed every ten
+        TTLs so running tasks' remaining time stays current.
+        """
+        now = time.time()
+        snapshot = self.snapshot
+        if snapshot is not None:
+            age = now - snapshot['built_at']
+            if age < STATUS_SNAPSHOT_TTL or (snapshot['version'] == self.version and age < 10 * STATUS_SNAPSHOT_TTL):
+                return snapshot
+        if self.pending.advance(now):
+            self.version += 1
+        taken = self._taken()
+        order = taken + list(self.pending)
+        self.snapshot = {
+            'version': self.version,
+            'built_at': now,
+            'taken': taken,
+            'eta': self._schedule(order),
+            'pending_tasks': [self._pending_summary(tid) for tid in order[:STATUS_PENDING_LIMIT]]
+        }
+        return self.snapshot
+    
+    def _pending_summary(self, task_id: str) -> Dict[str, Any]:
+        task = self.tasks[task_id]
+        return {
+            'id': task_id,
+            'created_at': task['created_at'],
+            'priority': task.get('priority', 'normal'),
+            'predicted_duration': task.get('predicted_duration'),
+            'params': {
+                'resolution': task['params'].get('resolution'),
+                'model': task['params'].get('dit_model', '').replace('seedvr2_ema_', '')
+            }
+        }
+    
+    def _position(self, task_id: str) -> Tuple[int, int]:
+        """(1-based queue position, estimated wait seconds) of a queued task - caller holds self.lock
+        
+        The position is exact (O(log n) rank in the pending index); the wait is
+        read from the snapshot at that position.
+        """
+        snapshot = self._snapshot()
+        taken = self._taken()
+        if task_id in taken:
+            index = taken.index(task_id)
+        elif task_id in self.pending:
+            index = len(taken) + self.pending.rank(task_id)
+        else:
+            index = len(taken) + len(self.pending)
+        position = index + 1
+        # Count the running task(s) as ahead, as before
+        if self.current_task_id:
+            position += 1
+        eta = snapshot['eta']
+        if index < len(eta):
+            return position, int(eta[index])
+        # Behind tasks submitted since the snapshot - extrapolate with this task's own prediction
+        predicted = self.tasks[task_id].get('predicted_duration', self.avg_process_time)
+        return position, int(eta[-1] + (index - len(eta) + 1) * predicted / len(self.workers))
+    
+    def _schedule(self, order: List[str]) -> List[float]:
+        """Predicted seconds until a device is free for each position in order,
+        plus one entry for behind the whole queue - caller holds self.lock
+        
+        Each task ahead is assigned to whichever device frees up first.
+        """
+        free_at = [self._remaining_seconds(w['task_id']) for w in self.workers.values()]
+        heapq.heapify(free_at)
+        eta = []
+        for tid in order:
+            eta.append(free_at[0])
+            predicted = self.tasks[tid].get('predicted_duration', self.avg_process_time)
+            heapq.heapreplace(free_at, free_at[0] + predicted)
+        eta.append(free_at[0])
+        return eta
+    
+    def _waiting_count(self) -> int:
+        """Tasks not yet on a GPU (queued, decoding or decoded) - caller holds self.lock"""
+        return len(self.pending) + len(self.stage_tasks['decode']) + len(self.ready_jobs)
+    
+    def _busy_fraction(self, worker: Dict[str, Any], now: float) -> float:
+        """Share of the last PIPELINE_WINDOW seconds the worker spent on GPU stages - caller holds self.lock"""
+        window_start = now - PIPELINE_WINDOW
+        while worker['busy'] and worker['busy'][0][1] < window_start:
+            worker['busy'].popleft()
+        busy = sum(end - max(start, window_start) for start, end in worker['busy'])
+        if worker['busy_since'] is not None:
+            busy += now - max(worker['busy_since'], window_start)
+        return min(1.0, busy / PIPELINE_WINDOW)
+    
+    def device_status(self) -> List[Dict[str, Any]]:
+        """Per-device load: running task, GPU stage utilization and task counts"""
+        with self.lock:
+            now = time.time()
+            return [{
+                'device': device,
+                'current_task': worker['task_id'],
+                'gpu_stage_utilization': round(self._busy_fraction(worker, now), 3),
+                'tasks_completed': worker['completed'],
+                'tasks_failed': worker['failed']
+            } for device, worker in self.workers.items()]
+    
+    def _pipeline_status(self) -> Dict[str, Any]:
+        """Stage occupancy, queue depths and GPU stage utilization - caller holds self.lock"""
+        now = time.time()
+        utilization = {device: self._busy_fraction(worker, now) for device, worker in self.workers.items()}
+        return {
+            'stages': {
+                'decode': list(self.stage_tasks['decode'].values()),
+                'gpu': {device: worker['task_id'] for device, worker in self.workers.items()},
+                'encode': list(self.stage_tasks['encode'].values())
+            },
+            'queue_depth': {
+                'decode': len(self.pending),
+                'gpu': len(self.ready_jobs),
+                'encode': self.encode_queue.qsize()
+            },
+            'gpu_stage_utilization': round(sum(utilization.values()) / len(utilization), 3),
+            'device_utilization': {device: round(u, 3) for device, u in utilization.items()},
+            'utilization_window_seconds': PIPELINE_WINDOW
+        }
+    
     def get_status(self) -> Dict[str, Any]:
         """Get overall queue status"""
         with self.lock:
-            pending_count = self.queue.qsize()
+            pending_count = self._waiting_count()
             processing = self.current_task_id
             
-            # Get pending task IDs
-            pending_tasks = []
-            for tid, task in self.tasks.items():
-                if task['status'] == 'queued':
-                    pending_tasks.append({
-                        'id': tid,
-                        'created_at': task['created_at'],
-                        'params': {
-                            'resolution': task['params'].get('resolution'),
-                            'model': task['params'].get('dit_model', '').replace('seedvr2_ema_', '')
-                        }
-                    })
-            
-            # Sort by creation time
-            pending_tasks.sort(key=lambda x: x['created_at'])
+            # Pending tasks in the order they will run
+            snapshot = self._snapshot()
             
             return {
                 'queue_length': pending_count,
                 'processing': processing,
                 'processing_progress': self.tasks[processing]['progress'] if processing and processing in self.tasks else 0,
-                'pending_tasks': pending_tasks,
+                'processing_tasks': {device: worker['task_id'] for device, worker in self.workers.items()},
+                'pending_tasks': snapshot['pending_tasks'],
+                'policy': self.policy,
                 'total_completed': self.total_completed,
                 'total_failed': self.total_failed,
                 'avg_process_time': round(self.avg_process_time, 1),
-                'estimated_total_wait': int(pending_count * self.avg_process_time)
+                'estimated_total_wait': int(snapshot['eta'][-1]),
+                'cost_model': duration_model.get_status(),
+                'result_cache': result_cache.get_status() if result_cache is not None else None,
+                'latent_cache': latent_cache.get_status() if latent_cache is not None else None,
+                'pipeline': self._pipeline_status(),
+                'stage_timings': {stage: {
+                    'tasks': total['tasks'],
+                    'avg_wall': round(total['wall'] / total['tasks'], 3),
+                    'avg_cuda': round(total['cuda'] / total['tasks'], 3),
+                    'max_peak_vram_mb': total['peak_vram_mb']
+                } for stage, total in self.stage_totals.items()}
             }
     
     def get_task_position(self, task_id: str) -> Dict[str, Any]:
@@ -413,22 +3609,13 @@ class TaskQueue:
                     'estimated_wait': 0
                 }
             
-            # Count position
-            position = 0
-            for tid, t in self.tasks.items():
-                if t['status'] == 'queued' and t['created_at'] < task['created_at']:
-                    position += 1
-            position += 1  # 1-indexed
-            
-            # Add 1 if something is processing
-            if self.current_task_id:
-                position += 1
-                
+            position, estimated_wait = self._position(task_id)
             return {
                 'task_id': task_id,
                 'status': 'queued',
+                'priority': task.get('priority', 'normal'),
                 'position': position,
-                'estimated_wait': int(position * self.avg_process_time)
+                'estimated_wait': estimated_wait
             }
     
     def get_history(self, limit: int = 20) -> List[Dict[str, Any]]:
@@ -454,23 +3641,45 @@ class TaskQueue:
         with self.lock:
             if task_id in self.tasks:
                 task = self.tasks[task_id].copy()
+                if 'timings' in task:
+                    task['timings'] = {stage: dict(entry) for stage, entry in task['timings'].items()}
                 # Add current position if queued
                 if task['status'] == 'queued':
-                    pos_info = self.get_task_position(task_id)
-                    task['queue_position'] = pos_info.get('position', 0)
-                    task['estimated_wait'] = pos_info.get('estimated_wait', 0)
+                    task['queue_position'], task['estimated_wait'] = self._position(task_id)
                 return task
             return None
     
     def shutdown(self):
-        """Shutdown the worker"""
+        """Shutdown the pipeline threads"""
         self.running = False
-        if self.worker_thread:
-            self.worker_thread.join(timeout=5)
+        for thread in self.worker_threads:
+            thread.join(timeout=5)
+
+
+def _vram_samples(read: Callable[[int], int]) -> List[Tuple[Dict[str, str], float]]:
+    if not torch.cuda.is_available():
+        return []
+    return [({'device': f'cuda:{i}'}, read(i)) for i in range(torch.cuda.device_count())]
 
 
 # Initialize task queue
-task_queue = TaskQueue(max_history=MAX_HISTORY_SIZE)
+if FRONTEND:
+    task_store = None
+    task_queue = EngineProxy(engine, 'task_queue', attrs=('devices',))
+    task_queue.events = RemoteEvents(engine)
+    metrics = EngineProxy(engine, 'metrics')
+else:
+    task_store = TaskStore(TASK_DB) if TASK_DB else None
+    task_queue = TaskQueue(max_history=MAX_HISTORY_SIZE, store=task_store)
+    metrics.gauge('queue_depth', 'Tasks waiting in front of each pipeline stage', task_queue._metric_queue_depth)
+    metrics.gauge('stage_busy', 'Whether a pipeline stage is currently working on a task', task_queue._metric_stage_busy)
+    metrics.gauge('vram_allocated_bytes', 'VRAM currently allocated by tensors',
+                  lambda: _vram_samples(torch.cuda.memory_allocated))
+    metrics.gauge('vram_reserved_bytes', 'VRAM currently reserved by the caching allocator',
+                  lambda: _vram_samples(torch.cuda.memory_reserved))
+    metrics.gauge('resident_runners', 'Prepared runners kept loaded, by residency tier',
+                  lambda: [({'tier': tier}, sum(1 for e in list(runner_pool.entries.values()) if e['tier'] == tier))
+                           for tier in ('gpu', 'cpu')])
 
 
 # ============================================================================
@@ -552,11 +3761,25 @@ class GPUManager:
         
     def get_status(self) -> Dict[str, Any]:
         import torch
+        current_model = runner_pool.current_model()
+        loading_model = runner_pool.loading_model()
         status = {
             'cuda_available': torch.cuda.is_available(),
             'processing': task_queue.current_task_id is not None,
-            'current_task': task_queue.current_task_id
+            'current_task': task_queue.current_task_id,
+            'model_loaded': current_model is not None,
+            'current_model': current_model,
+            'loading': loading_model is not None,
+            'loading_model': loading_model,
+            'resident_runners': runner_pool.get_status(),
+            'devices': task_queue.device_status()
         }
+        for device in status['devices']:
+            device['resident_models'] = runner_pool.device_models(device['device'])
+            if device['device'].startswith('cuda'):
+                device['gpu_name'] = torch.cuda.get_device_name(device['device'])
+                device['vram_used_mb'] = torch.cuda.memory_allocated(device['device']) // (1024*1024)
+                device['vram_total_mb'] = torch.cuda.get_device_properties(device['device']).total_memory // (1024*1024)
         if torch.cuda.is_available():
             status['gpu_name'] = torch.cuda.get_device_name(0)
             status['vram_used_mb'] = torch.cuda.memory_allocated(0) // (1024*1024)
@@ -566,11 +3789,19 @@ class GPUManager:
     def offload(self):
         import torch
         with self.lock:
+            evicted = runner_pool.evict()
+            if evicted:
+                print(f"[GPU] Evicted {evicted} resident runner(s)")
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
             return True
+    
+    def load_model(self, params: Dict[str, Any], device: str, tier: str) -> str:
+        """Start loading the runner a task with params would use on device, returns the load status"""
+        key = ResidentRunnerPool.make_key(params, device)
+        return runner_pool.load_async(key, make_runner_loader(params, device, Debug(enabled=False)), tier=tier)
 
-gpu_manager = GPUManager()
+gpu_manager = EngineProxy(engine, 'gpu_manager') if FRONTEND else GPUManager()
 
 # ============================================================================
 # API Routes
@@ -588,6 +3819,11 @@ def health():
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/gpu/status')
 def gpu_status():
     """Get GPU status"""
@@ -595,20 +3831,22 @@ def gpu_status():
 
 @app.route('/api/gpu/offload', methods=['POST'])
 def gpu_offload():
-    """Release GPU memory"""
+    """Release GPU memory and evict resident runners"""
     gpu_manager.offload()
     return jsonify({'status': 'success', 'message': 'GPU memory released'})
 
 @app.route('/api/models')
 def list_models():
-    """List available models"""
+    """List available models with their load state"""
     available_files = set()
     if os.path.exists(MODEL_DIR):
         available_files = set(os.listdir(MODEL_DIR))
     
+    states = runner_pool.model_states()
     models = []
     for name, info in MODEL_INFO.items():
         if info['type'] == 'DiT' and name in available_files:
+            state = states.get(name, {})
             models.append({
                 'name': name,
                 'params': info.get('params', ''),
@@ -616,14 +3854,97 @@ def list_models():
                 'precision': info.get('precision', ''),
                 'vram': info.get('vram', ''),
                 'variant': info.get('variant', ''),
-                'desc': info.get('desc', {})
+                'desc': info.get('desc', {}),
+                'load_state': state.get('state', 'unloaded'),
+                'load_time': state.get('load_time'),
+                'load_error': state.get('error'),
+                'runners': state.get('runners', [])
             })
     
+    loading_model = runner_pool.loading_model()
     return jsonify({
         'models': models,
-        'default': DEFAULT_DIT
+        'default': DEFAULT_DIT,
+        'current': runner_pool.current_model(),
+        'loading': loading_model is not None,
+        'loading_model': loading_model
     })
 
+def _load_model_in_background(tier: str):
+    """Shared body of /api/models/switch and /api/models/preload"""
+    data = request.get_json(silent=True) or {}
+    model = data.get('model') or runner_pool.current_model() or DEFAULT_DIT
+    if MODEL_INFO.get(model, {}).get('type') != 'DiT':
+        return jsonify({'error': f'Unknown model: {model}'}), 404
+    
+    # Key the runner exactly as a task with these settings would, so it hits on submit
+    try:
+        params = build_task_params({**data, 'dit_model': model}, bool(data.get('is_video', False)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    devices = task_queue.devices
+    device = data.get('device') or devices[0]
+    if device not in devices:
+        return jsonify({'error': f'Unknown device: {device}', 'devices': devices}), 400
+    status = gpu_manager.load_model(params, device, tier)
+    runner = ResidentRunnerPool.key_id(ResidentRunnerPool.make_key(params, device))
+    return jsonify({'status': status, 'model': model, 'tier': tier, 'device': device,
+                    'runner': runner}), (200 if status == 'already_loaded' else 202)
+
+@app.route('/api/models/switch', methods=['POST'])
+def switch_model():
+    """
+    Load a DiT model onto the GPU in the background and make it current
+    ---
+    tags: [Models]
+    consumes: [application/json]
+    parameters:
+      - name: body
+        in: body
+        schema:
+          properties:
+            model: {type: string}
+            resolution: {type: integer, default: 1080}
+            vae_tiling: {type: string, default: auto}
+            vae_quality: {type: string, default: high}
+            blocks_to_swap: {type: integer, default: 0}
+            is_video: {type: boolean, default: false}
+            device: {type: string, description: 'Worker device, e.g. cuda:1 (default: first device)'}
+    responses:
+      200:
+        description: Model already resident
+      202:
+        description: Model loading in background - poll /api/models for load_state
+    """
+    return _load_model_in_background('gpu')
+
+@app.route('/api/models/preload', methods=['POST'])
+def preload_model():
+    """
+    Preload a DiT model into CPU RAM in the background (defaults to the current model)
+    ---
+    tags: [Models]
+    consumes: [application/json]
+    parameters:
+      - name: body
+        in: body
+        schema:
+          properties:
+            model: {type: string}
+            resolution: {type: integer, default: 1080}
+            vae_tiling: {type: string, default: auto}
+            vae_quality: {type: string, default: high}
+            blocks_to_swap: {type: integer, default: 0}
+            is_video: {type: boolean, default: false}
+            device: {type: string, description: 'Worker device, e.g. cuda:1 (default: first device)'}
+    responses:
+      200:
+        description: Model already resident
+      202:
+        description: Model loading in background
+    """
+    return _load_model_in_background('cpu')
+
 # ============================================================================
 # Queue API Routes - NEW in v1.5.1
 # ============================================================================
@@ -660,6 +3981,107 @@ def queue_position(task_id):
         return jsonify(result), 404
     return jsonify(result)
 
+# Every open event stream pins a gthread thread for its whole life; past the cap
+# new streams are refused so uploads and status calls always find a free thread
+event_slots = threading.BoundedSemaphore(max(1, HTTP_THREADS - EVENT_STREAM_RESERVE)) if FRONTEND else None
+
+@app.route('/api/events', methods=['GET', 'POST'])
+def event_stream():
+    """
+    Stream task progress, queue position and queue updates (Server-Sent Events)
+    ---
+    tags: [Queue]
+    produces: [text/event-stream]
+    parameters:
+      - name: task_id
+        in: query
+        type: string
+        description: Task(s) to watch, repeatable or comma-separated
+      - name: all
+        in: query
+        type: boolean
+        description: Push task events for every task
+      - name: gpu
+        in: query
+        type: boolean
+        description: Also push GPU status every 5 seconds
+      - name: body
+        in: body
+        required: false
+        description: "POST instead of query parameters, for task id lists too long for a URL: {task_ids: [...], all, gpu, positions}"
+        schema:
+          type: object
+    responses:
+      200:
+        description: text/event-stream of task, position, queue and gpu events
+      400:
+        description: Malformed POST body
+      503:
+        description: This HTTP worker has no thread to spare for another stream; retry after Retry-After seconds
+    """
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not isinstance(body.get('task_ids', []), list):
+            return jsonify({'error': 'Expected a JSON object with a task_ids list'}), 400
+        task_ids = [str(tid) for tid in body.get('task_ids', []) if tid]
+        watch_all, with_gpu = bool(body.get('all')), bool(body.get('gpu'))
+        with_positions = bool(body.get('positions', True))
+    else:
+        task_ids = [tid for value in request.args.getlist('task_id') for tid in value.split(',') if tid]
+        watch_all = request.args.get('all', '').lower() in ('1', 'true')
+        with_gpu = request.args.get('gpu', '').lower() in ('1', 'true')
+        with_positions = True
+    if event_slots is not None and not event_slots.acquire(blocking=False):
+        return jsonify({'error': 'Too many open event streams, retry later'}), 503, {'Retry-After': '5'}
+    sub = task_queue.events.subscribe(None if watch_all else task_ids)
+    
+    def stream():
+        positions = {}
+        
+        def position_events():
+            # Watched tasks' positions only change when the queue does
+            for task_id in task_ids if with_positions else ():
+                info = task_queue.get_task_position(task_id)
+                if info.get('status') != 'queued':
+                    continue
+                key = (info['position'], info['estimated_wait'])
+                if positions.get(task_id) != key:
+                    positions[task_id] = key
+                    yield EventBroker.format('position', info)
+        
+        try:
+            yield 'retry: 3000\n\n'
+            for task_id in task_ids:
+                event = task_queue.get_task_event(task_id)
+                yield EventBroker.format('task', event or {'task_id': task_id, 'status': 'not_found'})
+            yield from position_events()
+            yield EventBroker.format('queue', task_queue.queue_summary())
+            last_sent = last_gpu = 0.0
+            while True:
+                try:
+                    event, data = sub['queue'].get(timeout=1.0)
+                    yield EventBroker.format(event, data)
+                    if event == 'queue':
+                        yield from position_events()
+                    last_sent = time.time()
+                except queue.Empty:
+                    pass
+                now = time.time()
+                if with_gpu and now - last_gpu >= 5:
+                    yield EventBroker.format('gpu', gpu_manager.get_status())
+                    last_sent = last_gpu = now
+                if now - last_sent >= EVENT_KEEPALIVE:
+                    yield ': keepalive\n\n'
+                    last_sent = now
+        finally:
+            task_queue.events.unsubscribe(sub)
+    
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if event_slots is not None:
+        response.call_on_close(event_slots.release)  # runs even if the client left before the first event
+    return response
+
 @app.route('/api/queue/history')
 def queue_history():
     """
@@ -682,6 +4104,172 @@ def queue_history():
 # Processing API Routes
 # ============================================================================
 
+def save_upload(file, path: str) -> str:
+    """Stream an uploaded file to path, returning the SHA-256 of its content"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        while True:
+            block = file.stream.read(UPLOAD_BLOCK)
+            if not block:
+                break
+            digest.update(block)
+            out.write(block)
+    return digest.hexdigest()
+
+
+_digest_memo: 'OrderedDict[Tuple[int, int, int, int], str]' = OrderedDict()  # (dev, inode, size, mtime_ns) -> SHA-256
+_digest_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file, remembered per inode and mtime so resubmitting the same file skips the read"""
+    st = os.stat(path)
+    key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        if key in _digest_memo:
+            _digest_memo.move_to_end(key)
+            return _digest_memo[key]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(UPLOAD_BLOCK), b''):
+            digest.update(block)
+    with _digest_lock:
+        _digest_memo[key] = digest.hexdigest()
+        while len(_digest_memo) > 4096:
+            _digest_memo.popitem(last=False)
+    return digest.hexdigest()
+
+
+def clone_file(src: str, dst: str) -> str:
+    """Reflink src to dst, else copy - returns the method used
+    
+    Never a hard link: the task's input would share the caller's inode, so
+    later edits to the source would change it mid-run and under its digest,
+    and evicting the task would touch a file the server does not own.
+    """
+    try:
+        import fcntl
+        with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+            fcntl.ioctl(fout.fileno(), 0x40049409, fin.fileno())  # FICLONE
+        return 'reflink'
+    except (ImportError, OSError):
+        if os.path.exists(dst):
+            os.remove(dst)
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+
+def resolve_input_path(ref: str) -> str:
+    """Real path of a server-side input (plain path or file:// URL), which must lie inside INPUT_ROOTS"""
+    if ref.startswith('file://'):
+        ref = urllib.parse.unquote(urllib.parse.urlparse(ref).path)
+    path = os.path.realpath(ref)
+    if not any(path.startswith(root.rstrip(os.sep) + os.sep) for root in INPUT_ROOTS):
+        raise PermissionError(f"Input path is outside INPUT_ROOTS: {ref}")
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Input file not found: {ref}")
+    return path
+
+
+def check_input_url(url: str):
+    """Refuse URLs that are not http(s) on an INPUT_URL_HOSTS host"""
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme not in ('http', 'https') or parsed.hostname not in INPUT_URL_HOSTS:
+        raise PermissionError(f"Input URL host is not in INPUT_URL_HOSTS: {url}")
+
+
+class InputURLRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follows a redirect only when its target passes check_input_url, so an allowed host cannot bounce the server elsewhere"""
+    
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_input_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+input_url_opener = urllib.request.build_opener(InputURLRedirectHandler)
+
+
+def fetch_url(url: str, path: str) -> str:
+    """Stream an http(s) URL on an INPUT_URL_HOSTS host to path, returning the SHA-256 of its content"""
+    check_input_url(url)
+    digest, size = hashlib.sha256(), 0
+    with input_url_opener.open(url, timeout=30) as resp, open(path, 'wb') as out:
+        for block in iter(lambda: resp.read(UPLOAD_BLOCK), b''):
+            size += len(block)
+            if size > MAX_CONTENT_LENGTH:
+                raise ValueError(f"Input exceeds {MAX_CONTENT_LENGTH} bytes")
+            digest.update(block)
+            out.write(block)
+    return digest.hexdigest()
+
+
+def import_input(ref: str, path: str) -> str:
+    """Bring a referenced input (server path, file:// or local http(s) URL) to path without re-uploading it
+    
+    Server files are reflinked when UPLOAD_FOLDER is on the same
+    copy-on-write file system, so nothing is copied, and copied otherwise.
+    Returns the input's SHA-256.
+    """
+    if urllib.parse.urlparse(ref).scheme in ('http', 'https'):
+        try:
+            return fetch_url(ref, path)
+        except Exception:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+    src = resolve_input_path(ref)
+    method = clone_file(src, path)
+    print(f"[Queue] Imported {src} by {method}")
+    return file_digest(src)
+
+
+def build_task_params(form, is_video: bool, default_priority: str = 'normal') -> Dict[str, Any]:
+    """Parse processing parameters from a form/JSON mapping and resolve VAE tiling"""
+    params = {
+        'resolution': int(form.get('resolution', 1080)),
+        'batch_size': int(form.get('batch_size', 5)),
+        'dit_model': form.get('dit_model', DEFAULT_DIT),
+        'color_correction': form.get('color_correction', 'lab'),
+        'seed': int(form.get('seed', 42)),
+        'blocks_to_swap': int(form.get('blocks_to_swap', 0)),
+        'vae_tiling': form.get('vae_tiling', 'auto'),
+        'vae_quality': form.get('vae_quality', 'high'),
+        'tf32': form.get('tf32', 'on'),
+        'chunk_batches': int(form.get('chunk_batches', VIDEO_CHUNK_BATCHES)),
+        'video_codec': form.get('video_codec', VIDEO_CODEC),
+        'video_preset': form.get('video_preset', VIDEO_PRESET),
+        'video_crf': int(form.get('video_crf', VIDEO_CRF)),
+        'segment_parallel': form.get('segment_parallel', 'auto'),
+        'priority': form.get('priority') or default_priority,
+    }
+    if params['batch_size'] < 1 or params['batch_size'] % 4 != 1:
+        raise ValueError(f"batch_size must be 4n+1 (1, 5, 9, ...): {params['batch_size']}")
+    if params['chunk_batches'] < 0:
+        raise ValueError(f"chunk_batches must be 0 or more: {params['chunk_batches']}")
+    if params['video_codec'] not in VIDEO_CODECS:
+        raise ValueError(f"Unsupported video_codec: {params['video_codec']}")
+    if not valid_preset(params['video_codec'], params['video_preset']):
+        raise ValueError(f"Invalid video_preset for {params['video_codec']}: {params['video_preset']}")
+    if params['segment_parallel'] not in ('auto', 'off'):
+        raise ValueError(f"Invalid segment_parallel: {params['segment_parallel']}")
+    if params['priority'] not in PRIORITY_LEVELS:
+        raise ValueError(f"Invalid priority: {params['priority']}")
+    
+    resolution = params['resolution']
+    vae_tiling = params['vae_tiling']
+    if vae_tiling == 'on':
+        params['encode_tiled'] = True
+        params['decode_tiled'] = True
+    elif vae_tiling == 'off':
+        params['encode_tiled'] = False
+        params['decode_tiled'] = False
+    else:
+        threshold = 1440 if is_video else 2880
+        params['encode_tiled'] = resolution >= threshold
+        params['decode_tiled'] = resolution >= threshold
+    return params
+
+
 @app.route('/api/process', methods=['POST'])
 def process():
     """
@@ -693,7 +4281,16 @@ def process():
       - name: file
         in: formData
         type: file
-        required: true
+        required: false
+        description: Input file - or reference one with input_path / input_url
+      - name: input_path
+        in: formData
+        type: string
+        description: Server-side path or file:// URL inside INPUT_ROOTS, reflinked (or copied) instead of uploaded
+      - name: input_url
+        in: formData
+        type: string
+        description: http(s) URL on an INPUT_URL_HOSTS host, fetched by the server
       - name: resolution
         in: formData
         type: integer
@@ -713,52 +4310,227 @@ def process():
         in: formData
         type: integer
         default: 42
+      - name: chunk_batches
+        in: formData
+        type: integer
+        default: 0
+        description: Temporal batches per chunk for long videos (0 = process whole clip at once)
+      - name: video_codec
+        in: formData
+        type: string
+        default: libx264
+        enum: [libx264, libx265, libsvtav1, h264_nvenc, hevc_nvenc]
+      - name: video_preset
+        in: formData
+        type: string
+        default: fast
+        description: x264-style name (ultrafast ... veryslow), mapped to SVT-AV1 0-13 and NVENC p1-p7; native values are accepted too
+      - name: video_crf
+        in: formData
+        type: integer
+        default: 18
+      - name: segment_parallel
+        in: formData
+        type: string
+        enum: [auto, off]
+        default: auto
+      - name: priority
+        in: formData
+        type: string
+        enum: [high, normal, low]
+        description: Defaults to the X-API-Key's class from API_KEY_PRIORITIES, else normal
+      - name: use_cache
+        in: formData
+        type: string
+        enum: ["on", "off"]
+        default: "on"
+        description: Answer identical submissions from the result cache
+      - name: X-API-Key
+        in: header
+        type: string
+        required: false
     responses:
       200:
         description: Task queued with position info
     """
-    if 'file' not in request.files:
+    ref = request.form.get('input_path') or request.form.get('input_url')
+    if ref:
+        file = None
+        filename = Path(urllib.parse.urlparse(ref).path if '://' in ref else ref).name
+    elif 'file' in request.files:
+        file = request.files['file']
+        filename = file.filename
+    else:
         return jsonify({'error': 'No file provided'}), 400
-    
-    file = request.files['file']
-    if not file.filename:
+    if not filename:
         return jsonify({'error': 'Empty filename'}), 400
     
-    task_id = str(uuid.uuid4())[:8]
-    filename = secure_filename(file.filename)
-    input_path = os.path.join(UPLOAD_FOLDER, f"{task_id}_{filename}")
-    file.save(input_path)
+    ext = Path(filename).suffix.lower()
+    is_video = ext in VIDEO_EXTENSIONS
+    try:
+        default_priority = API_KEY_PRIORITIES.get(request.headers.get('X-API-Key', ''), 'normal')
+        params = build_task_params(request.form, is_video, default_priority)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    params = {
-        'resolution': int(request.form.get('resolution', 1080)),
-        'batch_size': int(request.form.get('batch_size', 5)),
-        'dit_model': request.form.get('dit_model', DEFAULT_DIT),
-        'color_correction': request.form.get('color_correction', 'lab'),
-        'seed': int(request.form.get('seed', 42)),
-        'blocks_to_swap': int(request.form.get('blocks_to_swap', 0)),
-        'vae_tiling': request.form.get('vae_tiling', 'auto'),
-        'vae_quality': request.form.get('vae_quality', 'high'),
-        'tf32': request.form.get('tf32', 'on'),
-    }
+    task_id = str(uuid.uuid4())[:8]
+    input_path = os.path.join(UPLOAD_FOLDER, f"{task_id}_{secure_filename(filename)}")
+    try:
+        digest = import_input(ref, input_path) if ref else save_upload(file, input_path)
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except (ValueError, OSError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(submit_input(task_id, input_path, digest, is_video, params, request.form))
+
+
+def submit_input(task_id: str, input_path: str, digest: str, is_video: bool, params: Dict[str, Any], form) -> Dict[str, Any]:
+    """Queue a saved input, or answer it from the result cache"""
+    cache_key = None
+    if result_cache is not None and form.get('use_cache', 'on') != 'off':
+        cache_key = ResultCache.make_key(digest, params, is_video, len(task_queue.devices))
+        entry = result_cache.get(cache_key)
+        if entry is not None:
+            try:
+                return task_queue.submit_cached(task_id, input_path, params, entry)
+            except OSError:
+                result_cache.discard(cache_key)  # entry vanished from disk - process it normally
+    return task_queue.submit(task_id, input_path, params, cache_key, digest)
+
+
+@app.route('/api/uploads', methods=['POST'])
+def upload_create():
+    """
+    Start a chunked, resumable upload
+    ---
+    tags: [Processing]
+    parameters:
+      - name: body
+        in: body
+        schema:
+          type: object
+          required: [filename]
+          properties:
+            filename: {type: string}
+            size: {type: integer, description: Total bytes - required for early start}
+            start_early: {type: boolean, description: Queue a video before the upload completes}
+            params: {type: object, description: Processing params (as for /api/process) used by start_early}
+    responses:
+      200:
+        description: Upload id and offset
+    """
+    data = request.get_json(silent=True) or request.form
+    filename = data.get('filename')
+    if not filename or not secure_filename(filename):
+        return jsonify({'error': 'filename required'}), 400
+    size = int(data['size']) if data.get('size') not in (None, '') else None
+    if size is not None and size > MAX_CONTENT_LENGTH:
+        return jsonify({'error': f'Upload exceeds {MAX_CONTENT_LENGTH} bytes'}), 413
+    params = None
+    if str(data.get('start_early', '')).lower() in ('1', 'true', 'on'):
+        try:
+            default_priority = API_KEY_PRIORITIES.get(request.headers.get('X-API-Key', ''), 'normal')
+            params = build_task_params(data.get('params') or {}, Path(filename).suffix.lower() in VIDEO_EXTENSIONS,
+                                       default_priority)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    return jsonify(uploads.create(filename, size, params))
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'HEAD'])
+def upload_status(upload_id):
+    """Current offset of an upload - resume appending from here"""
+    upload = uploads.get(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    response = jsonify(upload)
+    response.headers['Upload-Offset'] = str(upload['offset'])
+    return response
+
+
+@app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+def upload_append(upload_id):
+    """
+    Append the request body at Upload-Offset
+    ---
+    tags: [Processing]
+    consumes: [application/offset+octet-stream]
+    parameters:
+      - name: Upload-Offset
+        in: header
+        type: integer
+        required: true
+    responses:
+      200:
+        description: New offset
+      409:
+        description: Offset mismatch - body has the current offset
+    """
+    try:
+        offset = int(request.headers.get('Upload-Offset', request.args.get('offset', '')))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header required'}), 400
+    try:
+        upload = uploads.append(upload_id, offset, request.stream)
+    except KeyError:
+        return jsonify({'error': 'Upload not found'}), 404
+    except UploadConflict as e:
+        return jsonify(dict(uploads.get(upload_id) or {}, error=str(e))), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 413
     
-    ext = Path(file.filename).suffix.lower()
-    is_video = ext in ['.mp4', '.avi', '.mov', '.mkv', '.webm']
+    params = uploads.ready_to_start(upload_id)
+    if params is not None:
+        # Enough has landed to start - the task's reader waits for the rest
+        uploads.attach_task(upload_id, upload_id)
+        upload['task_id'] = upload_id
+        upload['task'] = task_queue.submit(upload_id, uploads.path(upload_id), params, uploading=True)
+    response = jsonify(upload)
+    response.headers['Upload-Offset'] = str(upload['offset'])
+    return response
+
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def upload_finalize(upload_id):
+    """
+    Finish an upload and queue it - takes the same form fields as /api/process
+    ---
+    tags: [Processing]
+    responses:
+      200:
+        description: Task queued with position info
+      409:
+        description: Upload incomplete
+    """
+    try:
+        upload = uploads.finalize(upload_id)
+    except KeyError:
+        return jsonify({'error': 'Upload not found'}), 404
+    except UploadConflict as e:
+        return jsonify(dict(uploads.get(upload_id) or {}, error=str(e))), 409
     
-    resolution = params['resolution']
-    vae_tiling = params['vae_tiling']
-    if vae_tiling == 'on':
-        params['encode_tiled'] = True
-        params['decode_tiled'] = True
-    elif vae_tiling == 'off':
-        params['encode_tiled'] = False
-        params['decode_tiled'] = False
-    else:
-        threshold = 1440 if is_video else 2880
-        params['encode_tiled'] = resolution >= threshold
-        params['decode_tiled'] = resolution >= threshold
+    if upload['task_id']:
+        # Already queued while uploading - its reader picks up the remaining bytes
+        task_queue.finish_upload(upload['task_id'], upload['digest'])
+        return jsonify(task_queue.get_task_position(upload['task_id']))
     
-    result = task_queue.submit(task_id, input_path, params)
-    return jsonify(result)
+    is_video = Path(upload['filename']).suffix.lower() in VIDEO_EXTENSIONS
+    try:
+        default_priority = API_KEY_PRIORITIES.get(request.headers.get('X-API-Key', ''), 'normal')
+        params = upload['params'] or build_task_params(request.form, is_video, default_priority)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(submit_input(upload_id, upload['path'], upload['digest'], is_video, params, request.form))
+
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def upload_abort(upload_id):
+    """Abort an upload and delete its data"""
+    if not uploads.abort(upload_id):
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({'status': 'aborted', 'upload_id': upload_id})
 
 @app.route('/api/status/<task_id>')
 def task_status(task_id):
@@ -768,9 +4540,80 @@ def task_status(task_id):
         return jsonify({'error': 'Task not found'}), 404
     return jsonify(task)
 
+class FileSlice:
+    """Bytes [start, start + length) of an open file, as a range response body
+    
+    Reads stop at the end of the slice, while fileno() lets a server with
+    sendfile (gunicorn) take over - it sends Content-Length bytes from the
+    current offset without copying them through Python.
+    """
+    
+    def __init__(self, f, start: int, length: int):
+        self.f = f
+        self.remaining = length
+        f.seek(start)
+    
+    def read(self, size: int = -1) -> bytes:
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        block = self.f.read(size)
+        self.remaining -= len(block)
+        return block
+    
+    def fileno(self) -> int:
+        return self.f.fileno()
+    
+    def close(self):
+        self.f.close()
+
+
+def send_output(path: str, download_name: str) -> Response:
+    """Serve a result file with ETag, If-None-Match / If-Range and byte-range support
+    
+    With DOWNLOAD_ACCEL the front proxy is handed the file (X-Sendfile, or
+    X-Accel-Redirect under DOWNLOAD_ACCEL_PREFIX) and serves the bytes itself.
+    """
+    st = os.stat(path)
+    rv = Response(mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream', direct_passthrough=True)
+    rv.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    if DOWNLOAD_ACCEL == 'x-sendfile':
+        rv.headers['X-Sendfile'] = path
+        return rv
+    if DOWNLOAD_ACCEL == 'x-accel' and path.startswith(os.path.join(OUTPUT_FOLDER, '')):
+        rel = urllib.parse.quote(os.path.relpath(path, OUTPUT_FOLDER))
+        rv.headers['X-Accel-Redirect'] = f"{DOWNLOAD_ACCEL_PREFIX.rstrip('/')}/{rel}"
+        return rv
+    
+    rv.set_etag(f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}")
+    rv.last_modified = st.st_mtime
+    rv.content_length = st.st_size
+    rv.make_conditional(request, accept_ranges=True, complete_length=st.st_size)
+    if rv.status_code in (200, 206) and request.method != 'HEAD':
+        start, length = 0, st.st_size
+        if rv.status_code == 206:
+            start, length = rv.content_range.start, rv.content_range.stop - rv.content_range.start
+        rv.response = wrap_file(request.environ, FileSlice(open(path, 'rb'), start, length), UPLOAD_BLOCK)
+    return rv
+
+
 @app.route('/api/download/<task_id>')
 def download_result(task_id):
-    """Download processed file"""
+    """
+    Download processed file - supports Range requests and ETag revalidation
+    ---
+    tags: [Processing]
+    parameters:
+      - name: task_id
+        in: path
+        type: string
+        required: true
+    responses:
+      200:
+        description: The result file
+      206:
+        description: The requested byte range
+      304:
+        description: Not modified (If-None-Match)
+    """
     task = task_queue.get_task(task_id)
     if not task:
         return jsonify({'error': 'Task not found'}), 404
@@ -783,7 +4626,59 @@ def download_result(task_id):
     if not output_path or not os.path.exists(output_path):
         return jsonify({'error': 'Output file not found'}), 404
     
-    return send_file(output_path, as_attachment=True, download_name=output_filename)
+    return send_output(output_path, output_filename)
+
+@app.route('/api/download/<task_id>/live')
+def download_live(task_id):
+    """
+    Stream a chunked video's output while it is still being encoded
+    ---
+    tags: [Processing]
+    produces: [video/mp4]
+    parameters:
+      - name: task_id
+        in: path
+        type: string
+        required: true
+    responses:
+      200:
+        description: Fragmented MP4 sent as it is written, ending when the task completes (the file itself once completed)
+      409:
+        description: No output to stream yet - retry later
+    """
+    task = task_queue.get_task(task_id)
+    if not task:
+        return jsonify({'error': 'Task not found'}), 404
+    f = None
+    if task.get('partial_output_path'):
+        try:
+            f = open(task['partial_output_path'], 'rb')
+        except FileNotFoundError:
+            task = task_queue.get_task(task_id) or task  # finished (and renamed) since the lookup
+    if f is None:
+        if task['status'] == 'completed':
+            return download_result(task_id)
+        return jsonify({'error': 'Output not available yet', 'status': task['status']}), 409, {'Retry-After': '5'}
+    
+    def stream():
+        with f:
+            while True:
+                block = f.read(UPLOAD_BLOCK)
+                if block:
+                    yield block
+                    continue
+                status = (task_queue.get_task(task_id) or {}).get('status')
+                if status == 'processing':
+                    time.sleep(LIVE_POLL_INTERVAL)
+                    continue
+                if status == 'completed':
+                    # The partial file was renamed into place - same inode, so finish reading it
+                    yield from iter(lambda: f.read(UPLOAD_BLOCK), b'')
+                return
+    
+    return Response(stream(), mimetype='video/mp4',
+                    headers={'Content-Disposition': f'attachment; filename="{task_id}_live.mp4"',
+                             'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # ============================================================================
 # UI Route
@@ -814,15 +4709,19 @@ if __name__ == '__main__':
     parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 8200)))
     parser.add_argument('--debug', action='store_true')
     args = parser.parse_args()
+    if SERVE_MODE not in ('standalone', 'engine'):
+        sys.exit(f"SERVE_MODE={SERVE_MODE}: run 'standalone' or 'engine' here - the front end is started by the engine "
+                 f"or by gunicorn (SERVE_MODE=frontend gunicorn -k gthread server:app)")
     
-    # Start queue worker
+    # Start queue worker and idle offload watchdog
     task_queue.start_worker()
+    runner_pool.start_idle_watchdog(GPU_IDLE_TIMEOUT, CPU_IDLE_TIMEOUT)
     
     print(f"""
 ╔════════════════════════════════════════════════════════════╗
 ║     SeedVR2 Video Upscaler Server v1.5.1 - Queue Edition   ║
 ╠════════════════════════════════════════════════════════════╣
-║  🔄 Task Queue: ENABLED (Serial GPU Processing)            ║
+║  🔄 Task Queue: ENABLED (Pipelined Multi-GPU Processing)   ║
 ║  📊 Max History: {MAX_HISTORY_SIZE} tasks                                   ║
 ╚════════════════════════════════════════════════════════════╝
 
@@ -830,9 +4729,36 @@ if __name__ == '__main__':
    📚 API Docs:    http://{args.host}:{args.port}/docs
    🔧 Health:      http://{args.host}:{args.port}/health
    📋 Queue:       http://{args.host}:{args.port}/api/queue/status
+   🖥️  Workers:     {', '.join(task_queue.devices)} (decode / GPU / encode stages each)
+   ⚙️  Serving:     {SERVE_MODE if SERVE_MODE == 'standalone' else f'engine + gunicorn ({HTTP_WORKERS} workers x {HTTP_THREADS} threads)'}
 """)
     
+    engine_server = frontend = None
     try:
-        app.run(host=args.host, port=args.port, debug=args.debug, threaded=True)
+        if SERVE_MODE == 'engine':
+            # GPU work stays in this process; HTTP is served by gunicorn workers calling in over ENGINE_SOCKET
+            authkey = ENGINE_AUTHKEY or secrets.token_hex(16)
+            exposed = {'task_queue': task_queue, 'runner_pool': runner_pool, 'gpu_manager': gpu_manager,
+                       'uploads': uploads, 'result_cache': result_cache, 'metrics': metrics}
+            engine_server = EngineServer(ENGINE_SOCKET, authkey.encode(),
+                                         {name: obj for name, obj in exposed.items() if obj is not None})
+            engine_server.start()
+            signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+            frontend = launch_frontend(args.host, args.port, authkey)
+            frontend.wait()
+            print(f"[Engine] Front end exited with code {frontend.returncode}")
+        else:
+            app.run(host=args.host, port=args.port, debug=args.debug, threaded=True)
     finally:
+        if frontend is not None and frontend.poll() is None:
+            frontend.terminate()
+            try:
+                frontend.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                frontend.kill()
+        if engine_server is not None:
+            engine_server.shutdown()
         task_queue.shutdown()
+        runner_pool.shutdown()
+        if task_store is not None:
+            task_store.close()
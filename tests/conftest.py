@@ -0,0 +1,42 @@
+"""
+Test setup - import server.py without the GPU stack
+
+The tests cover the CPU-side queue, cache, upload and download logic, so
+torch, OpenCV and the SeedVR2 `src` package (which comes from the
+ComfyUI-SeedVR2 checkout, not this repo) are replaced by mocks before
+server.py is imported. Upload and output folders point at a temp directory.
+"""
+import os
+import sys
+import tempfile
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+GPU_MODULES = ('torch', 'torch.cuda', 'cv2', 'src', 'src.utils', 'src.utils.model_registry',
+               'src.utils.constants', 'src.utils.debug')
+OPTIONAL_MODULES = ('numpy', 'flask_cors', 'flasgger', 'fastmcp')  # mocked only when not installed
+
+for name in GPU_MODULES:
+    sys.modules[name] = mock.MagicMock()
+for name in OPTIONAL_MODULES:
+    try:
+        __import__(name)
+    except ImportError:
+        sys.modules[name] = mock.MagicMock()
+
+sys.modules['torch'].cuda.is_available.return_value = False
+sys.modules['src.utils.model_registry'].DEFAULT_DIT = 'seedvr2_ema_3b_fp8_e4m3fn.safetensors'
+sys.modules['src.utils.model_registry'].DEFAULT_VAE = 'ema_vae_fp16.safetensors'
+sys.modules['src.utils.constants'].SEEDVR2_FOLDER_NAME = 'SEEDVR2'
+
+TMP = tempfile.mkdtemp(prefix='seedvr2-tests-')
+os.environ.update({
+    'UPLOAD_FOLDER': os.path.join(TMP, 'uploads'),
+    'OUTPUT_FOLDER': os.path.join(TMP, 'outputs'),
+    'TASK_DB': '',
+    'SERVE_MODE': 'standalone',
+    'DOWNLOAD_ACCEL': '',
+})
@@ -0,0 +1,25 @@
+"""benchmark_queue.py runs against the current TaskQueue"""
+import importlib.util
+import os
+
+from conftest import ROOT
+
+
+def load_benchmark(monkeypatch):
+    """Import the script without its chdir into the Docker image's /app"""
+    monkeypatch.setattr(os, 'chdir', lambda path: None)
+    spec = importlib.util.spec_from_file_location('benchmark_queue', os.path.join(ROOT, 'benchmark_queue.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_benchmark_runs_and_reports_every_call(monkeypatch, capsys):
+    benchmark = load_benchmark(monkeypatch)
+    monkeypatch.setattr(benchmark, 'CALLS', 50)
+    results = {200: benchmark.benchmark_queue(200, 'input.png')}
+    assert set(results[200]) == {'submit', 'position', 'task', 'status', 'status_rebuild'}
+    assert all(value > 0 for value in results[200].values())
+    benchmark.print_results(results)
+    assert 'QUEUE BOOKKEEPING' in capsys.readouterr().out
+
@@ -0,0 +1,111 @@
+"""Result downloads - FileSlice, byte ranges and ETag revalidation"""
+import io
+import os
+
+import pytest
+
+import server
+from server import FileSlice
+
+DATA = os.urandom(200_000)
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / 'result.mp4'
+    path.write_bytes(DATA)
+    server.task_queue.tasks['dl000001'] = {
+        'id': 'dl000001', 'status': 'completed', 'output_path': str(path), 'output_filename': 'result.mp4'}
+    yield server.app.test_client()
+    server.task_queue.tasks.pop('dl000001', None)
+
+
+def test_file_slice_stops_at_the_end_of_the_range():
+    piece = FileSlice(io.BytesIO(DATA), 1000, 2500)
+    assert piece.read(2000) == DATA[1000:3000]
+    assert piece.read(2000) == DATA[3000:3500]
+    assert piece.read(2000) == b''
+
+
+def test_file_slice_read_all():
+    assert FileSlice(io.BytesIO(DATA), 10, 20).read() == DATA[10:30]
+
+
+def test_full_download(client):
+    resp = client.get('/api/download/dl000001')
+    assert resp.status_code == 200
+    assert resp.data == DATA
+    assert resp.headers['Accept-Ranges'] == 'bytes'
+    assert resp.headers['ETag']
+    assert resp.headers['Content-Length'] == str(len(DATA))
+    assert 'result.mp4' in resp.headers['Content-Disposition']
+
+
+def test_range_request(client):
+    resp = client.get('/api/download/dl000001', headers={'Range': 'bytes=100-199'})
+    assert resp.status_code == 206
+    assert resp.data == DATA[100:200]
+    assert resp.headers['Content-Range'] == f'bytes 100-199/{len(DATA)}'
+    assert resp.headers['Content-Length'] == '100'
+
+
+def test_open_ended_and_suffix_ranges(client):
+    resp = client.get('/api/download/dl000001', headers={'Range': f'bytes={len(DATA) - 10}-'})
+    assert resp.status_code == 206
+    assert resp.data == DATA[-10:]
+    resp = client.get('/api/download/dl000001', headers={'Range': 'bytes=-5'})
+    assert resp.status_code == 206
+    assert resp.data == DATA[-5:]
+
+
+def test_unsatisfiable_range(client):
+    resp = client.get('/api/download/dl000001', headers={'Range': f'bytes={len(DATA) + 10}-'})
+    assert resp.status_code == 416
+
+
+def test_if_none_match_revalidates(client):
+    etag = client.get('/api/download/dl000001').headers['ETag']
+    resp = client.get('/api/download/dl000001', headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.data == b''
+
+
+def test_if_range_with_a_stale_etag_sends_the_whole_file(client):
+    etag = client.get('/api/download/dl000001').headers['ETag']
+    resp = client.get('/api/download/dl000001', headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert resp.status_code == 206
+    assert resp.data == DATA[:10]
+    resp = client.get('/api/download/dl000001', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert resp.status_code == 200
+    assert resp.data == DATA
+
+
+def test_etag_changes_when_the_file_does(client):
+    etag = client.get('/api/download/dl000001').headers['ETag']
+    path = server.task_queue.tasks['dl000001']['output_path']
+    with open(path, 'ab') as f:
+        f.write(b'more')
+    resp = client.get('/api/download/dl000001', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.data == DATA + b'more'
+
+
+def test_head_sends_headers_only(client):
+    resp = client.head('/api/download/dl000001')
+    assert resp.status_code == 200
+    assert resp.headers['Content-Length'] == str(len(DATA))
+    assert resp.data == b''
+
+
+def test_x_accel_hands_the_file_to_the_proxy(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, 'DOWNLOAD_ACCEL', 'x-accel')
+    monkeypatch.setattr(server, 'OUTPUT_FOLDER', str(tmp_path))
+    resp = client.get('/api/download/dl000001')
+    assert resp.headers['X-Accel-Redirect'] == '/_outputs/result.mp4'
+    assert resp.data == b''
+
+
+def test_download_of_an_unfinished_task(client):
+    server.task_queue.tasks['dl000001']['status'] = 'processing'
+    assert client.get('/api/download/dl000001').status_code == 400
+    assert client.get('/api/download/missing').status_code == 404
@@ -0,0 +1,53 @@
+"""Cost-model ETAs - predicted task durations and queue waits"""
+import pytest
+
+import server
+from server import DurationModel
+
+PARAMS = {'dit_model': 'seedvr2_ema_3b_fp8_e4m3fn.safetensors', 'resolution': 1080}
+
+
+def test_work_is_output_megapixel_frames():
+    assert DurationModel.work(PARAMS, 960, 540, 100) == pytest.approx(100 * 1080 * 1920 / 1e6)
+    assert DurationModel.work(PARAMS, 0, 0, 1) == pytest.approx(1080 * 1080 / 1e6)  # unknown size: square
+
+
+def test_unlearned_rate_reproduces_the_benchmark_table():
+    model = DurationModel()
+    for resolution, seconds in DurationModel.BENCHMARK_SECONDS.items():
+        params = dict(PARAMS, resolution=resolution)
+        assert model.predict(params, DurationModel.work(params, 256, 256, 1)) == pytest.approx(seconds)
+    assert model.bucket(1000) == 1080 and model.bucket(9999) == 4320
+
+
+def test_observed_rates_are_smoothed_per_key():
+    model = DurationModel()
+    model.observe(PARAMS, work=10, seconds=2.5 + 10)
+    assert model.rate(PARAMS) == pytest.approx(1.0)
+    model.observe(PARAMS, work=10, seconds=2.5 + 20)
+    assert model.rate(PARAMS) == pytest.approx(0.7 * 1.0 + 0.3 * 2.0)
+    # other resolutions and tiled runs keep their own rate
+    assert model.rate(dict(PARAMS, resolution=2160)) == model.seed_rates[2160]
+    assert model.rate(dict(PARAMS, decode_tiled=True)) == model.seed_rates[1080]
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(server, 'duration_model', DurationModel())
+    monkeypatch.setattr(server, 'STATUS_SNAPSHOT_TTL', 0)
+    return lambda devices: server.TaskQueue(devices=devices, store=None)
+
+
+def test_waits_add_up_the_predictions_ahead(queue):
+    tq = queue(['cpu'])
+    waits = [tq.submit(f't{i}', 'in.png', PARAMS)['estimated_wait_seconds'] for i in range(3)]
+    predicted = tq.tasks['t0']['predicted_duration']
+    assert predicted == pytest.approx(4, abs=0.1)
+    assert waits == [0, int(predicted), int(2 * predicted)]
+
+
+def test_waits_spread_over_devices(queue):
+    tq = queue(['cpu:0', 'cpu:1'])
+    waits = [tq.submit(f't{i}', 'in.png', PARAMS)['estimated_wait_seconds'] for i in range(4)]
+    predicted = tq.tasks['t0']['predicted_duration']
+    assert waits == [0, 0, int(predicted), int(predicted)]
@@ -0,0 +1,69 @@
+"""Engine socket - front-end proxies calling into the engine process"""
+import io
+import queue
+
+import pytest
+
+import server
+from server import EngineClient, EngineProxy, EngineServer, RemoteEvents, UploadConflict, UploadManager
+
+
+@pytest.fixture
+def engine(tmp_path):
+    address = str(tmp_path / 'engine.sock')
+    objects = {'uploads': UploadManager(str(tmp_path)), 'task_queue': server.task_queue,
+               'metrics': server.metrics}
+    engine_server = EngineServer(address, b'secret', objects)
+    engine_server.start()
+    yield EngineClient(address, 'secret')
+    engine_server.shutdown()
+
+
+def test_calls_stream_bodies_and_return_values(engine):
+    uploads = EngineProxy(engine, 'uploads')
+    upload_id = uploads.create('clip.mp4', 10, None)['upload_id']
+    assert uploads.append(upload_id, 0, io.BytesIO(b'12345'))['offset'] == 5
+    assert uploads.get(upload_id)['offset'] == 5
+
+
+def test_engine_errors_keep_their_type(engine):
+    uploads = EngineProxy(engine, 'uploads')
+    upload_id = uploads.create('clip.mp4', 10, None)['upload_id']
+    with pytest.raises(UploadConflict):
+        uploads.append(upload_id, 3, io.BytesIO(b'x'))
+    with pytest.raises(ValueError):
+        uploads.append(upload_id, 0, io.BytesIO(b'x' * 20))
+    # The connection stays in step after a failed streamed call
+    assert uploads.get(upload_id)['size'] == 10
+
+
+def test_attributes_are_fetched_as_values(engine):
+    task_queue = EngineProxy(engine, 'task_queue', attrs=('devices',))
+    assert task_queue.devices == server.task_queue.devices
+    assert 'queue_length' in task_queue.get_status()
+
+
+@pytest.mark.parametrize('name, attr', [
+    ('task_queue', 'shutdown'), ('task_queue', 'start_worker'), ('task_queue', 'store'),
+    ('task_queue', '_metric_queue_depth'), ('uploads', 'expire'), ('runner_pool', 'get_status'),
+])
+def test_only_the_front_end_api_is_exposed(engine, name, attr):
+    with pytest.raises(AttributeError):
+        engine.request(('call', name, attr, (), {}, None))
+
+
+def test_event_subscriptions_are_forwarded(engine):
+    events = RemoteEvents(engine)
+    sub = events.subscribe(['t1'])
+    try:
+        for _ in range(50):
+            if server.task_queue.events.subscriber_count:
+                break
+            server.time.sleep(0.02)
+        server.task_queue.events.publish('task', {'task_id': 't2'}, 't2')
+        server.task_queue.events.publish('task', {'task_id': 't1', 'progress': 5}, 't1')
+        assert sub['queue'].get(timeout=2) == ('task', {'task_id': 't1', 'progress': 5})
+        with pytest.raises(queue.Empty):
+            sub['queue'].get(timeout=0.2)
+    finally:
+        events.unsubscribe(sub)
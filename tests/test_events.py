@@ -0,0 +1,112 @@
+"""Server-Sent Events stream - subscriptions by query string or POST body"""
+import json
+
+import pytest
+
+import server
+from server import EventBroker
+
+
+@pytest.fixture
+def tasks(monkeypatch):
+    """Adds processing tasks to the live queue; returns their ids"""
+    added = []
+
+    def add(count):
+        for i in range(count):
+            task_id = f'ev{len(added):06d}'
+            server.task_queue.tasks[task_id] = {'id': task_id, 'status': 'processing', 'progress': i % 100,
+                                                'params': {}, 'input_path': 'clip.mp4', 'submitted_at': 0}
+            added.append(task_id)
+        return added[-count:]
+    yield add
+    for task_id in added:
+        server.task_queue.tasks.pop(task_id, None)
+
+
+def read_events(resp, count):
+    """First `count` events of a streamed response as (event, data) pairs"""
+    events, buffer = [], ''
+    chunks = iter(resp.response)
+    try:
+        while len(events) < count:
+            chunk = next(chunks)
+            buffer += chunk.decode() if isinstance(chunk, bytes) else chunk
+            while '\n\n' in buffer and len(events) < count:
+                message, buffer = buffer.split('\n\n', 1)
+                fields = dict(line.split(': ', 1) for line in message.splitlines() if ': ' in line)
+                if 'event' in fields:
+                    events.append((fields['event'], json.loads(fields['data'])))
+    finally:
+        resp.close()
+    return events
+
+
+def test_broker_filters_task_events_by_subscription():
+    broker = EventBroker()
+    watcher, everyone = broker.subscribe(['a']), broker.subscribe()
+    broker.publish('task', {'task_id': 'b'}, 'b')
+    broker.publish('task', {'task_id': 'a'}, 'a')
+    broker.publish('queue', {'queue_length': 0})
+    assert list(watcher['queue'].queue) == [('task', {'task_id': 'a'}), ('queue', {'queue_length': 0})]
+    assert len(everyone['queue'].queue) == 3
+    broker.unsubscribe(watcher)
+    assert broker.subscriber_count == 1
+
+
+def test_slow_subscriber_keeps_the_newest_events():
+    broker = EventBroker(max_buffered=2)
+    sub = broker.subscribe()
+    for progress in range(5):
+        broker.publish('task', {'task_id': 'a', 'progress': progress}, 'a')
+    assert [data['progress'] for _, data in sub['queue'].queue] == [3, 4]
+
+
+def test_stream_sends_current_state_then_live_events(tasks):
+    first, second = tasks(2)
+    resp = server.app.test_client().get(f'/api/events?task_id={first},missing&task_id={second}', buffered=False)
+    assert resp.mimetype == 'text/event-stream'
+    # The subscription is open once the response is: these queue up behind the current state
+    server.task_queue.events.publish('task', {'task_id': 'other', 'progress': 1}, 'other')
+    server.task_queue.events.publish('task', {'task_id': first, 'progress': 50}, first)
+    events = read_events(resp, 5)
+    assert [(event, data['task_id'], data['status']) for event, data in events[:3]] == [
+        ('task', first, 'processing'), ('task', 'missing', 'not_found'), ('task', second, 'processing')]
+    assert events[3][0] == 'queue'
+    assert events[4] == ('task', {'task_id': first, 'progress': 50})
+
+
+def test_post_body_subscribes_to_long_id_lists(tasks):
+    ids = tasks(600)
+    body = {'task_ids': ids, 'positions': False}
+    assert len(json.dumps(body)) > 4094  # past gunicorn's request line limit as a query string
+    resp = server.app.test_client().post('/api/events', json=body, buffered=False)
+    assert resp.status_code == 200
+    events = read_events(resp, len(ids) + 1)
+    assert [data['task_id'] for _, data in events[:-1]] == ids
+    assert events[-1][0] == 'queue'
+
+
+def test_post_unknown_task_is_not_found(tasks):
+    resp = server.app.test_client().post('/api/events', json={'task_ids': ['missing']}, buffered=False)
+    assert read_events(resp, 1) == [('task', {'task_id': 'missing', 'status': 'not_found'})]
+
+
+@pytest.mark.parametrize('body', ['[1, 2]', '{"task_ids": "abc"}', 'not json'])
+def test_malformed_post_body_is_a_bad_request(body):
+    resp = server.app.test_client().post('/api/events', data=body, content_type='application/json')
+    assert resp.status_code == 400
+
+
+def test_streams_past_the_thread_cap_are_refused(monkeypatch):
+    monkeypatch.setattr(server, 'event_slots', server.threading.BoundedSemaphore(1))
+    client = server.app.test_client()
+    first = client.get('/api/events', buffered=False)
+    assert first.status_code == 200
+    refused = client.get('/api/events')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After']
+    first.close()  # closing the stream frees its slot, even before the first event was read
+    again = client.get('/api/events', buffered=False)
+    assert again.status_code == 200
+    again.close()
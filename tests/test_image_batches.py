@@ -0,0 +1,63 @@
+"""Coalescing compatible image tasks into one GPU pass"""
+import pytest
+
+import server
+
+PARAMS = {'dit_model': 'seedvr2_ema_3b_fp8_e4m3fn.safetensors', 'tf32': 'on'}
+
+
+@pytest.fixture
+def tq(monkeypatch):
+    monkeypatch.setattr(server, 'IMAGE_BATCH_MAX', 3)
+    monkeypatch.setattr(server, 'IMAGE_BATCH_WAIT', 0.5)
+    return server.TaskQueue(devices=['cpu'], store=None)
+
+
+def ready(tq, task_id, params=PARAMS, input_path='in.png', age=0.0):
+    """Add a decoded image job to the ready list"""
+    tq.tasks[task_id] = {'id': task_id, 'params': params, 'input_path': input_path}
+    job = {'task_id': task_id, 'params': params, 'batch_key': tq._batch_params(params),
+           'ready_at': server.time.time() - age, 'frames': object()}
+    tq.ready_jobs.append(job)
+    return job
+
+
+def queued(tq, task_id, params=PARAMS, input_path='in.png'):
+    tq.tasks[task_id] = {'id': task_id, 'params': params, 'input_path': input_path}
+    tq.pending.add(task_id, 1, 1.0, server.time.time())
+
+
+def test_compatible_images_share_a_pass_up_to_the_limit(tq):
+    first = ready(tq, 'a', age=1)
+    ready(tq, 'b', age=1)
+    ready(tq, 'tiled', dict(PARAMS, decode_tiled=True), age=1)
+    ready(tq, 'no-tf32', dict(PARAMS, tf32='off'), age=1)
+    ready(tq, 'c', age=1)
+    ready(tq, 'd', age=1)
+    assert [job['task_id'] for job in tq._collect_batch(first)] == ['a', 'b', 'c']
+
+
+def test_short_batch_waits_for_compatible_images_still_decoding(tq):
+    first = ready(tq, 'a')
+    queued(tq, 'b')
+    assert tq._collect_batch(first) is None
+    first['ready_at'] -= 1  # waited IMAGE_BATCH_WAIT
+    assert [job['task_id'] for job in tq._collect_batch(first)] == ['a']
+
+
+def test_incompatible_work_behind_does_not_hold_a_batch(tq):
+    first = ready(tq, 'a')
+    queued(tq, 'video', input_path='clip.mp4')
+    queued(tq, 'other', dict(PARAMS, dit_model='seedvr2_ema_7b_fp16.safetensors'))
+    assert [job['task_id'] for job in tq._collect_batch(first)] == ['a']
+
+
+def test_batch_members_split_the_shared_runner_prep(tq):
+    batch = [ready(tq, tid) for tid in ('a', 'b')]
+    job = tq._merge_batch(batch)
+    assert 'frames' not in job and job['batch_tasks'] == ['a', 'b']
+    job['device'] = 'cpu'
+    tq.tasks['a']['timings'] = {'runner_prep': {'calls': 1, 'wall': 3.0}}
+    tq._split_batch(job)
+    assert [tq.tasks[tid]['timings']['runner_prep']['wall'] for tid in ('a', 'b')] == [1.5, 1.5]
+    assert all(member['device'] == 'cpu' for member in batch)
@@ -0,0 +1,79 @@
+"""Submitting inputs by server path or URL, and parameter validation"""
+import os
+
+import pytest
+
+import server
+from server import build_task_params, check_input_url, clone_file, resolve_input_path
+
+
+@pytest.fixture
+def roots(tmp_path, monkeypatch):
+    root = tmp_path / 'shared'
+    root.mkdir()
+    monkeypatch.setattr(server, 'INPUT_ROOTS', [str(root)])
+    return root
+
+
+def test_paths_must_lie_inside_input_roots(roots, tmp_path):
+    inside = roots / 'clip.mp4'
+    inside.write_bytes(b'x')
+    outside = tmp_path / 'secret.mp4'
+    outside.write_bytes(b'x')
+    assert resolve_input_path(f'file://{inside}') == str(inside)
+    with pytest.raises(PermissionError):
+        resolve_input_path(str(outside))
+    with pytest.raises(PermissionError):
+        resolve_input_path(str(roots / '..' / 'secret.mp4'))
+    with pytest.raises(FileNotFoundError):
+        resolve_input_path(str(roots / 'missing.mp4'))
+
+
+def test_symlinks_out_of_the_roots_are_refused(roots, tmp_path):
+    target = tmp_path / 'secret.mp4'
+    target.write_bytes(b'x')
+    (roots / 'link.mp4').symlink_to(target)
+    with pytest.raises(PermissionError):
+        resolve_input_path(str(roots / 'link.mp4'))
+
+
+def test_clone_never_hard_links(tmp_path):
+    src = tmp_path / 'src.mp4'
+    src.write_bytes(b'data')
+    dst = tmp_path / 'dst.mp4'
+    assert clone_file(str(src), str(dst)) in ('reflink', 'copy')
+    assert os.stat(dst).st_ino != os.stat(src).st_ino
+    src.write_bytes(b'edited')
+    assert dst.read_bytes() == b'data'
+
+
+def test_url_inputs_are_off_by_default():
+    assert server.INPUT_URL_HOSTS == set()
+    with pytest.raises(PermissionError):
+        check_input_url('http://localhost:8000/clip.mp4')
+
+
+def test_url_hosts_and_schemes_are_checked(monkeypatch):
+    monkeypatch.setattr(server, 'INPUT_URL_HOSTS', {'media.local'})
+    check_input_url('https://media.local/clip.mp4')
+    for url in ('http://other.local/clip.mp4', 'ftp://media.local/clip.mp4', 'file:///etc/passwd'):
+        with pytest.raises(PermissionError):
+            check_input_url(url)
+
+
+@pytest.mark.parametrize('batch_size', [1, 5, 9, 81])
+def test_batch_sizes_of_the_form_4n_plus_1_are_accepted(batch_size):
+    assert build_task_params({'batch_size': batch_size}, True)['batch_size'] == batch_size
+
+
+@pytest.mark.parametrize('form', [{'batch_size': 0}, {'batch_size': -3}, {'batch_size': 4}, {'batch_size': 6},
+                                  {'chunk_batches': -1}])
+def test_invalid_batch_settings_are_rejected(form):
+    with pytest.raises(ValueError):
+        build_task_params(form, True)
+
+
+def test_invalid_batch_size_is_a_bad_request():
+    resp = server.app.test_client().post('/api/process', data={'input_path': '/nowhere.mp4', 'batch_size': '4'})
+    assert resp.status_code == 400
+    assert 'batch_size' in resp.get_json()['error']
@@ -0,0 +1,66 @@
+"""LatentCache keys and the per-entry size gate"""
+import pytest
+
+import server
+from server import LatentCache
+
+DIGEST = 'a' * 64
+PARAMS = {'resolution': 1080, 'batch_size': 5, 'encode_tiled': False, 'vae_quality': 'high', 'tf32': 'on',
+          'dit_model': 'seedvr2_ema_3b_fp8_e4m3fn.safetensors', 'seed': 42, 'decode_tiled': False,
+          'color_correction': 'lab'}
+
+
+class FakeTensor:
+    """Stands in for a tensor in a context snapshot - only its size matters"""
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+    def numel(self):
+        return self.nbytes
+
+    def element_size(self):
+        return 1
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(server.torch, 'Tensor', FakeTensor)
+    monkeypatch.setattr(server.torch, 'save', lambda state, path: open(path, 'wb').write(b'x' * 100))
+    return LatentCache(str(tmp_path), max_bytes=1 << 30, max_entry_bytes=1 << 20)
+
+
+def test_encode_key_ignores_seed_and_decode_key_does_not():
+    encoded, decoded = LatentCache.make_keys(DIGEST, PARAMS)
+    reseeded = LatentCache.make_keys(DIGEST, dict(PARAMS, seed=7))
+    assert reseeded[0] == encoded
+    assert reseeded[1] != decoded
+    assert LatentCache.make_keys(DIGEST, dict(PARAMS, color_correction='wavelet')) == (encoded, decoded)
+
+
+def test_estimate_scales_to_the_output_size():
+    # 540p input upscaled to 1080p: four times the pixels, float16 RGB
+    assert server.upscaled_bytes(10, 540, 960, 1080) == 10 * 1080 * 1920 * 3 * 2
+
+
+def test_long_clips_do_not_fit(cache):
+    # 108x192 output frames are 124,416 bytes each: 8 fit in the 1 MiB entry cap, 9 do not
+    assert cache.fits(8, 54, 96, 108)
+    assert not cache.fits(9, 54, 96, 108)
+
+
+def test_entry_cap_never_exceeds_the_cache_bound(tmp_path):
+    assert LatentCache(str(tmp_path), max_bytes=100, max_entry_bytes=1000).max_entry_bytes == 100
+
+
+def test_put_skips_oversized_state_before_saving(cache, monkeypatch):
+    saved = []
+    monkeypatch.setattr(server.torch, 'save', lambda state, path: saved.append(path))
+    cache.put('big', {'latents': [FakeTensor(1 << 19), FakeTensor(1 << 19)], 'extra': {'x': FakeTensor(1)}})
+    assert saved == []
+    assert cache.get_status()['entries'] == 0
+
+
+def test_put_stores_small_state(cache):
+    cache.put('small', {'latents': [FakeTensor(1000)]})
+    assert list(cache.entries) == ['small']
+    assert cache.bytes == 100
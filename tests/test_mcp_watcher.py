@@ -0,0 +1,60 @@
+"""MCP TaskWatcher - hundreds of waits resolved from one event stream"""
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip('httpx')
+from werkzeug.serving import make_server
+
+import mcp_server
+import server
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """The Flask app on a real local port, with the MCP client pointed at it"""
+    httpd = make_server('127.0.0.1', 0, server.app, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(mcp_server, 'API_BASE', f'http://127.0.0.1:{httpd.server_port}')
+    monkeypatch.setattr(mcp_server, '_http', None)
+    added = []
+    yield added
+    httpd.shutdown()
+    for task_id in added:
+        server.task_queue.tasks.pop(task_id, None)
+
+
+def test_many_waits_share_one_posted_subscription(api):
+    ids = [f'mw{i:06d}' for i in range(600)]  # a query string of these would overflow gunicorn's 4094-byte line
+    for task_id in ids:
+        server.task_queue.tasks[task_id] = {'id': task_id, 'status': 'processing', 'progress': 0,
+                                            'params': {}, 'input_path': 'clip.mp4', 'submitted_at': 0}
+    api.extend(ids)
+
+    async def scenario():
+        watcher = mcp_server.TaskWatcher()
+        waits = {task_id: asyncio.ensure_future(watcher.wait(task_id, timeout=60, poll_interval=30))
+                 for task_id in ids}
+        try:
+            for _ in range(200):
+                if watcher.connected and watcher.subscribed == frozenset(ids):
+                    break
+                await asyncio.sleep(0.05)
+            assert watcher.connected
+            done = ids[123]
+            server.task_queue.tasks[done].update(status='completed', progress=100)
+            server.task_queue.events.publish('task', {'task_id': done, 'status': 'completed', 'progress': 100}, done)
+            result = await asyncio.wait_for(waits[done], 5)  # well inside the 30 s poll interval
+            assert result['status'] == 'completed'
+            assert not any(wait.done() for task_id, wait in waits.items() if task_id != done)
+        finally:
+            for wait in waits.values():
+                wait.cancel()
+            if watcher.stream_task:
+                watcher.stream_task.cancel()
+            await asyncio.gather(*waits.values(), watcher.stream_task, return_exceptions=True)
+            await mcp_server._client().aclose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,55 @@
+"""Prometheus registry and /metrics"""
+import pytest
+
+import server
+from server import MetricsRegistry
+
+
+@pytest.fixture
+def registry():
+    registry = MetricsRegistry(prefix='t')
+    registry.counter('jobs_total', 'Jobs')
+    registry.gauge('depth', 'Depth', lambda: [({'stage': 'gpu'}, 2)])
+    registry.histogram('seconds', 'Seconds', buckets=(1, 5))
+    return registry
+
+
+def test_text_exposition(registry):
+    registry.inc('jobs_total', {'model': '3b'})
+    registry.inc('jobs_total', {'model': '3b'}, 2)
+    for value in (0.5, 3, 9):
+        registry.observe('seconds', value, {'phase': 'dit'})
+    lines = registry.render().splitlines()
+    assert '# TYPE t_jobs_total counter' in lines
+    assert 't_jobs_total{model="3b"} 3' in lines
+    assert 't_depth{stage="gpu"} 2' in lines
+    # buckets are cumulative and end with +Inf
+    assert [line for line in lines if line.startswith('t_seconds')] == [
+        't_seconds_bucket{phase="dit",le="1.0"} 1', 't_seconds_bucket{phase="dit",le="5.0"} 2',
+        't_seconds_bucket{phase="dit",le="+Inf"} 3', 't_seconds_sum{phase="dit"} 12.5', 't_seconds_count{phase="dit"} 3']
+
+
+def test_label_values_are_escaped(registry):
+    registry.inc('jobs_total', {'model': 'a"b\\c\nd'})
+    assert 't_jobs_total{model="a\\"b\\\\c\\nd"} 1' in registry.render()
+
+
+def test_broken_gauge_callback_does_not_break_the_scrape(registry):
+    registry.gauge('broken', 'Broken', lambda: 1 / 0)
+    registry.inc('jobs_total')
+    assert 't_jobs_total 1' in registry.render()
+
+
+def test_resolution_label_is_bucketed():
+    labels = server.TaskQueue._metric_labels({'params': {'resolution': 1000, 'dit_model': 'seedvr2_ema_7b_fp16.safetensors'},
+                                              'input_path': 'a.png'})
+    assert labels == {'model': '7b_fp16', 'resolution': '1080', 'is_video': 'false'}
+
+
+def test_metrics_endpoint():
+    resp = server.app.test_client().get('/metrics')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/plain'
+    text = resp.get_data(as_text=True)
+    assert '# TYPE seedvr2_tasks_submitted_total counter' in text
+    assert 'seedvr2_queue_depth{stage="decode"}' in text
@@ -0,0 +1,81 @@
+"""/api/models/switch and /api/models/preload - background model loading"""
+import threading
+from unittest import mock
+
+import pytest
+
+import server
+from server import ResidentRunnerPool
+
+MODEL = 'seedvr2_ema_3b_fp16.safetensors'
+
+
+@pytest.fixture
+def unblock():
+    """Set to let model loads finish"""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+@pytest.fixture
+def pool(monkeypatch, unblock):
+    """Fresh runner pool whose loads wait for unblock"""
+    pool = ResidentRunnerPool(max_size=2)
+
+    def make_loader(params, device, debug):
+        def load():
+            unblock.wait(5)
+            return mock.MagicMock(), {}
+        return load
+    monkeypatch.setattr(server, 'runner_pool', pool)
+    monkeypatch.setattr(server, 'make_runner_loader', make_loader)
+    return pool
+
+
+def wait_loaded(pool):
+    for _ in range(100):
+        if not pool.loading:
+            return
+        server.time.sleep(0.02)
+    raise AssertionError('load did not finish')
+
+
+def test_switch_loads_in_the_background(pool, unblock):
+    client = server.app.test_client()
+    resp = client.post('/api/models/switch', json={'model': MODEL})
+    assert resp.status_code == 202
+    body = resp.get_json()
+    key = ResidentRunnerPool.make_key(server.build_task_params({'dit_model': MODEL}, False), body['device'])
+    assert body['runner'] == ResidentRunnerPool.key_id(key)  # the runner a matching task will hit
+    assert pool.model_states()[MODEL]['state'] == 'loading'
+    assert client.post('/api/models/switch', json={'model': MODEL}).get_json()['status'] == 'loading'
+    unblock.set()
+    wait_loaded(pool)
+    again = client.post('/api/models/switch', json={'model': MODEL})
+    assert again.status_code == 200
+    assert again.get_json()['status'] == 'already_loaded'
+    assert pool.is_resident(key)
+
+
+def test_preload_parks_the_runner_in_cpu_memory(pool, unblock):
+    unblock.set()
+    resp = server.app.test_client().post('/api/models/preload', json={'model': MODEL})
+    assert resp.status_code == 202
+    wait_loaded(pool)
+    for _ in range(100):
+        if pool.model_states()[MODEL]['state'] == 'cpu':
+            break
+        server.time.sleep(0.02)
+    assert pool.model_states()[MODEL]['state'] == 'cpu'
+
+
+@pytest.mark.parametrize('body, status', [
+    ({'model': 'ema_vae_fp16.safetensors'}, 404),
+    ({'model': 'nope.safetensors'}, 404),
+    ({'model': MODEL, 'device': 'cuda:7'}, 400),
+    ({'model': MODEL, 'batch_size': 4}, 400),
+])
+def test_bad_switch_requests(pool, body, status):
+    assert server.app.test_client().post('/api/models/switch', json=body).status_code == status
+    assert not pool.loading
@@ -0,0 +1,91 @@
+"""One worker per device - device selection, runner affinity and the TF32 gate"""
+import threading
+
+import pytest
+
+import server
+from server import ResidentRunnerPool, TF32Gate
+
+PARAMS = {'dit_model': 'seedvr2_ema_3b_fp8_e4m3fn.safetensors'}
+OTHER = {'dit_model': 'seedvr2_ema_7b_fp16.safetensors'}
+
+
+def test_devices_from_the_environment(monkeypatch):
+    monkeypatch.setattr(server, 'FAKE_GPUS', 3)
+    assert server.resolve_devices() == ['cpu:0', 'cpu:1', 'cpu:2']
+    monkeypatch.setattr(server, 'FAKE_GPUS', 0)
+    monkeypatch.setattr(server.torch.cuda, 'is_available', lambda: True)
+    monkeypatch.setattr(server, 'GPU_DEVICES', '1, cuda:3')
+    assert server.resolve_devices() == ['cuda:1', 'cuda:3']
+    assert server.torch_device('cpu:2') == 'cpu'
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    """Two-device queue over a fresh pool; resident(params, device) loads a runner there"""
+    pool = ResidentRunnerPool(max_size=2)
+    monkeypatch.setattr(server, 'runner_pool', pool)
+    tq = server.TaskQueue(devices=['cpu:0', 'cpu:1'], store=None)
+
+    def resident(params, device):
+        key = ResidentRunnerPool.make_key(params, device)
+        pool.acquire(key, lambda: (object(), {}))
+        pool.release(key)
+    return tq, resident
+
+
+def job(task_id, params):
+    return {'task_id': task_id, 'params': params}
+
+
+def test_worker_prefers_a_job_its_runner_is_resident_for(workers):
+    tq, resident = workers
+    resident(OTHER, 'cpu:0')
+    tq.ready_jobs = [job('a', PARAMS), job('b', OTHER)]
+    assert tq._next_job('cpu:0')['task_id'] == 'b'
+
+
+def test_worker_leaves_a_job_to_the_idle_device_that_has_it_loaded(workers):
+    tq, resident = workers
+    resident(PARAMS, 'cpu:1')
+    tq.ready_jobs = [job('a', PARAMS), job('b', OTHER)]
+    assert tq._next_job('cpu:0')['task_id'] == 'b'
+    tq.workers['cpu:1']['task_id'] = 'busy'  # not idle: take the oldest job after all
+    assert tq._next_job('cpu:0')['task_id'] == 'a'
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    gate = TF32Gate()
+    gate.enabled = True
+    return gate
+
+
+def test_tasks_in_the_current_mode_share_the_gate(gate):
+    with gate.hold(True):
+        with gate.hold(True):
+            assert gate.holders == 2
+
+
+def test_other_mode_waits_for_holders_and_blocks_newcomers(gate):
+    order = []
+    first = gate.hold(True)
+    first.__enter__()
+
+    def run(enabled, name):
+        with gate.hold(enabled):
+            order.append((name, gate.enabled))
+
+    off = threading.Thread(target=run, args=(False, 'off'))
+    off.start()
+    while not gate.waiting[False]:
+        server.time.sleep(0.01)
+    late = threading.Thread(target=run, args=(True, 'late'))
+    late.start()
+    server.time.sleep(0.1)
+    assert order == []  # the late tf32 task may not overtake the waiting one
+    first.__exit__(None, None, None)
+    off.join(2)
+    late.join(2)
+    assert order == [('off', False), ('late', True)]
+    assert server.torch.backends.cuda.matmul.allow_tf32 is True
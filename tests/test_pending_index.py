@@ -0,0 +1,85 @@
+"""PendingIndex ordering and aging"""
+import pytest
+
+import server
+from server import PendingIndex, PRIORITY_LEVELS, build_task_params
+
+HIGH, NORMAL, LOW = PRIORITY_LEVELS['high'], PRIORITY_LEVELS['normal'], PRIORITY_LEVELS['low']
+
+
+def test_priority_classes_then_fifo():
+    index = PendingIndex('priority', 0.0, 0)
+    index.add('low', LOW, 10, 1.0)
+    index.add('normal-1', NORMAL, 10, 2.0)
+    index.add('high', HIGH, 10, 3.0)
+    index.add('normal-2', NORMAL, 10, 4.0)
+    assert list(index) == ['high', 'normal-1', 'normal-2', 'low']
+    assert index.rank('normal-2') == 2
+    assert index.pop_first() == 'high'
+    assert index.head(2) == ['normal-1', 'normal-2']
+
+
+def test_priority_aging_promotes_one_class_per_interval():
+    index = PendingIndex('priority', 0.0, 60)
+    index.add('low', LOW, 10, 0.0)
+    index.add('normal', NORMAL, 10, 50.0)
+
+    assert not index.advance(59.0)
+    assert list(index) == ['normal', 'low']
+
+    # 'low' has waited one interval: it joins the normal class, ahead of the newer task
+    assert index.advance(60.0)
+    assert list(index) == ['low', 'normal']
+    assert index.by_id['low'][0] == NORMAL
+
+    # After two intervals it reaches the top class, and so does 'normal' after one
+    assert index.advance(120.0)
+    assert index.by_id['low'][0] == HIGH
+    assert index.by_id['normal'][0] == HIGH
+    assert list(index) == ['low', 'normal']
+    assert not index.advance(120.0)
+
+
+def test_priority_aging_keeps_submission_order_within_a_class():
+    index = PendingIndex('priority', 0.0, 60)
+    for i in range(5):
+        index.add(f'low-{i}', LOW, 10, float(i * 10))
+    index.add('normal', NORMAL, 10, 45.0)
+
+    index.advance(85.0)  # low-0..low-2 have waited a full interval
+    assert list(index) == ['low-0', 'low-1', 'low-2', 'normal', 'low-3', 'low-4']
+
+
+def test_aging_skips_removed_tasks():
+    index = PendingIndex('priority', 0.0, 60)
+    index.add('low-0', LOW, 10, 0.0)
+    index.add('low-1', LOW, 10, 1.0)
+    index.remove('low-0')
+    assert index.advance(61.0)
+    assert list(index) == ['low-1']
+    assert index.by_id['low-1'][0] == NORMAL
+
+
+def test_sjf_prefers_short_tasks_until_long_ones_have_waited():
+    index = PendingIndex('sjf', 0.5, 0)
+    index.add('long', NORMAL, 100, 0.0)
+    index.add('short', NORMAL, 10, 100.0)
+    # aged costs: long 100 + 0.5 * 0 = 100, short 10 + 0.5 * 100 = 60
+    assert list(index) == ['short', 'long']
+    index.add('later', NORMAL, 10, 200.0)
+    assert list(index) == ['short', 'long', 'later']
+
+
+def test_queue_runs_higher_classes_first(monkeypatch):
+    monkeypatch.setattr(server, 'duration_model', server.DurationModel())
+    tq = server.TaskQueue(devices=['cpu'], store=None)
+    for task_id, priority in (('low', 'low'), ('normal', 'normal'), ('high', 'high')):
+        tq.submit(task_id, 'in.png', {'priority': priority})
+    assert [tq.get_task_position(tid)['position'] for tid in ('high', 'normal', 'low')] == [1, 2, 3]
+
+
+def test_priority_defaults_and_validation():
+    assert build_task_params({}, False, default_priority='low')['priority'] == 'low'
+    assert build_task_params({'priority': 'high'}, False, default_priority='low')['priority'] == 'high'
+    with pytest.raises(ValueError):
+        build_task_params({'priority': 'urgent'}, False)
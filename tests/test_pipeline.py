@@ -0,0 +1,74 @@
+"""Decode / GPU / encode stages overlap across tasks"""
+import threading
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Single-device queue with stubbed stages
+    
+    Each stage logs (stage, task_id) as it starts. A stage with a gate waits
+    for that event and records in `overlapped` whether it came in time.
+    """
+    monkeypatch.setattr(server, 'duration_model', server.DurationModel())
+    monkeypatch.setattr(server, 'TASK_TTL', 0)
+    monkeypatch.setattr(server, 'TASK_STORE_MAX', 0)
+    tq = server.TaskQueue(devices=['cpu'], store=None)
+    tq.log, tq.gates, tq.overlapped = [], {}, {}
+
+    def gate(stage, task_id):
+        tq.log.append((stage, task_id))
+        if (stage, task_id) in tq.gates:
+            tq.overlapped[stage, task_id] = tq.gates[stage, task_id].wait(2)
+
+    def prepare(task_id, input_path, params):
+        gate('decode', task_id)
+        return {'task_id': task_id, 'input_path': input_path, 'params': params}
+
+    def run_gpu(job):
+        gate('gpu', job['task_id'])
+
+    def finalize(job):
+        gate('encode', job['task_id'])
+        with tq.lock:
+            tq.tasks[job['task_id']]['status'] = 'completed'
+    monkeypatch.setattr(tq, '_prepare_input', prepare)
+    monkeypatch.setattr(tq, '_run_gpu_stage', run_gpu)
+    monkeypatch.setattr(tq, '_finalize', finalize)
+    yield tq
+    tq.shutdown()
+
+
+def started(tq, stage, task_id):
+    """Event set once the stage starts on task_id"""
+    event = threading.Event()
+
+    def watch():
+        while tq.running and (stage, task_id) not in tq.log:
+            server.time.sleep(0.01)
+        event.set()
+    threading.Thread(target=watch, daemon=True).start()
+    return event
+
+
+def wait_done(tq, task_ids):
+    for _ in range(500):
+        if all(tq.tasks[tid]['status'] == 'completed' for tid in task_ids):
+            return
+        server.time.sleep(0.01)
+    raise AssertionError(f'tasks did not finish: {tq.log}')
+
+
+def test_next_input_decodes_while_the_gpu_runs(pipeline):
+    pipeline.gates[('gpu', 'a')] = started(pipeline, 'decode', 'b')
+    pipeline.gates[('encode', 'a')] = started(pipeline, 'gpu', 'b')
+    pipeline.start_worker()
+    for task_id in 'abc':
+        pipeline.submit(task_id, f'{task_id}.png', {})
+    wait_done(pipeline, 'abc')
+    # b was decoded while a held the GPU, and a was encoded while b held it
+    assert pipeline.overlapped == {('gpu', 'a'): True, ('encode', 'a'): True}
+    assert [tid for stage, tid in pipeline.log if stage == 'gpu'] == ['a', 'b', 'c']
@@ -0,0 +1,54 @@
+"""Per-frame progress and live remaining time"""
+import pytest
+
+import server
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen time.time(); advance by adding to clock[0]"""
+    clock = [1000.0]
+    monkeypatch.setattr(server.time, 'time', lambda: clock[0])
+    return clock
+
+
+@pytest.fixture
+def tq(clock):
+    tq = server.TaskQueue(devices=['cpu'], store=None)
+    tq.tasks['t1'] = {'id': 't1', 'status': 'processing', 'progress': 30, 'start_time': clock[0],
+                      'predicted_duration': 500.0}
+    return tq
+
+
+def test_frames_map_onto_30_to_90_percent(tq):
+    tq._report_frames('t1', 0, 200)
+    assert tq.tasks['t1']['progress'] == 30
+    tq._report_frames('t1', 100, 200)
+    assert tq.tasks['t1']['progress'] == 60
+    tq._report_frames('t1', 250, 200)  # clamped to the total
+    assert (tq.tasks['t1']['frames_done'], tq.tasks['t1']['progress']) == (200, 90)
+
+
+def test_remaining_time_follows_measured_throughput(tq, clock):
+    tq._report_frames('t1', 0, 200)
+    clock[0] += 10
+    tq._report_frames('t1', 50, 200)
+    task = tq.tasks['t1']
+    assert task['frames_per_second'] == 5.0
+    assert task['remaining_seconds'] == 30.0
+    clock[0] += 4
+    with tq.lock:
+        assert tq._remaining_seconds('t1') == 26.0  # aged since the last report, not the 500 s prediction
+
+
+def test_reports_for_finished_tasks_are_ignored(tq):
+    tq.tasks['t1']['status'] = 'completed'
+    tq._report_frames('t1', 10, 20)
+    assert 'frames_done' not in tq.tasks['t1']
+
+
+def test_phase_shares_are_learned_once_every_phase_is_timed(tq):
+    assert tq._phase_shares() == server.PHASE_SHARES
+    for phase, wall in (('vae_encode', 1), ('dit_upscale', 6), ('vae_decode', 2), ('postprocess', 1)):
+        tq._aggregate_timings({phase: {'wall': wall}})
+    assert tq._phase_shares() == {'vae_encode': 0.1, 'dit_upscale': 0.6, 'vae_decode': 0.2, 'postprocess': 0.1}
@@ -0,0 +1,31 @@
+"""Queue status snapshot and exact positions"""
+import server
+
+
+def test_status_snapshot_is_reused_but_positions_stay_exact(monkeypatch):
+    monkeypatch.setattr(server, 'STATUS_PENDING_LIMIT', 5)
+    tq = server.TaskQueue(devices=['cpu'], store=None)
+    monkeypatch.setattr(server, 'STATUS_SNAPSHOT_TTL', 0)
+    for i in range(20):
+        tq.submit(f't{i}', 'input.png', {})
+    status = tq.get_status()
+    assert len(status['pending_tasks']) == 5 and status['queue_length'] == 20
+    monkeypatch.setattr(server, 'STATUS_SNAPSHOT_TTL', 60)
+    snapshot = tq.snapshot
+    tq.submit('urgent', 'input.png', {'priority': 'high'})
+    assert tq.snapshot is snapshot  # not rebuilt within the TTL
+    assert tq.get_task_position('urgent')['position'] == 1  # ranks come from the pending index
+    assert tq.get_task_position('t0')['position'] == 2
+    assert tq.get_task_position('t19')['position'] == 21
+
+
+def test_waits_beyond_the_snapshot_are_extrapolated(monkeypatch):
+    tq = server.TaskQueue(devices=['cpu'], store=None)
+    monkeypatch.setattr(server, 'STATUS_SNAPSHOT_TTL', 60)
+    tq.submit('first', 'input.png', {})  # snapshot: first, then the end of the queue
+    tq.submit('second', 'input.png', {})
+    third = tq.submit('third', 'input.png', {})
+    predicted = tq.tasks['third']['predicted_duration']
+    assert tq.snapshot['eta'] == [0, tq.tasks['first']['predicted_duration']]
+    assert third['queue_position'] == 3
+    assert third['estimated_wait_seconds'] == int(2 * predicted)
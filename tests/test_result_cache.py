@@ -0,0 +1,90 @@
+"""ResultCache keys and persistence"""
+import pytest
+
+import server
+from server import ResultCache
+
+DIGEST = 'a' * 64
+IMAGE = {'dit_model': 'seedvr2_ema_3b_fp8_e4m3fn.safetensors', 'resolution': 1080, 'batch_size': 5,
+         'color_correction': 'lab', 'seed': 42, 'vae_quality': 'high', 'encode_tiled': False,
+         'decode_tiled': False, 'tf32': 'on'}
+VIDEO = dict(IMAGE, video_codec='libx264', video_preset='fast', video_crf=18,
+             chunk_batches=0, segment_parallel='auto')
+
+
+def test_key_is_stable():
+    assert ResultCache.make_key(DIGEST, IMAGE, False) == ResultCache.make_key(DIGEST, dict(IMAGE), False)
+    assert len(ResultCache.make_key(DIGEST, IMAGE, False)) == 64
+
+
+@pytest.mark.parametrize('name, value', [
+    ('dit_model', 'seedvr2_ema_7b_fp16.safetensors'), ('resolution', 720), ('batch_size', 9),
+    ('color_correction', 'wavelet'), ('seed', 7), ('vae_quality', 'low'), ('encode_tiled', True),
+    ('decode_tiled', True), ('tf32', 'off'),
+])
+def test_output_params_change_the_key(name, value):
+    assert ResultCache.make_key(DIGEST, IMAGE, False) != ResultCache.make_key(DIGEST, dict(IMAGE, **{name: value}), False)
+
+
+def test_content_and_kind_change_the_key():
+    assert ResultCache.make_key(DIGEST, IMAGE, False) != ResultCache.make_key('b' * 64, IMAGE, False)
+    assert ResultCache.make_key(DIGEST, IMAGE, False) != ResultCache.make_key(DIGEST, IMAGE, True)
+
+
+def test_unrelated_params_do_not_change_the_key():
+    assert (ResultCache.make_key(DIGEST, IMAGE, False)
+            == ResultCache.make_key(DIGEST, dict(IMAGE, priority='high', blocks_to_swap=8), False))
+
+
+def test_image_key_ignores_video_settings():
+    assert ResultCache.make_key(DIGEST, IMAGE, False) == ResultCache.make_key(DIGEST, VIDEO, False)
+    assert (ResultCache.make_key(DIGEST, IMAGE, False, device_count=1)
+            == ResultCache.make_key(DIGEST, IMAGE, False, device_count=4))
+
+
+@pytest.mark.parametrize('name, value', [
+    ('video_codec', 'libx265'), ('video_preset', 'slow'), ('video_crf', 23),
+    ('chunk_batches', 4), ('segment_parallel', 'off'),
+])
+def test_video_settings_and_plan_change_the_key(name, value):
+    assert ResultCache.make_key(DIGEST, VIDEO, True) != ResultCache.make_key(DIGEST, dict(VIDEO, **{name: value}), True)
+
+
+def test_video_key_follows_the_device_count():
+    assert (ResultCache.make_key(DIGEST, VIDEO, True, device_count=1)
+            != ResultCache.make_key(DIGEST, VIDEO, True, device_count=2))
+
+
+def test_video_plan_defaults_match_explicit_values():
+    implicit = {name: value for name, value in VIDEO.items() if name not in ('chunk_batches', 'segment_parallel')}
+    explicit = dict(implicit, chunk_batches=server.VIDEO_CHUNK_BATCHES, segment_parallel='auto')
+    assert ResultCache.make_key(DIGEST, implicit, True) == ResultCache.make_key(DIGEST, explicit, True)
+
+
+def test_video_key_follows_server_plan_settings(monkeypatch):
+    key = ResultCache.make_key(DIGEST, VIDEO, True)
+    monkeypatch.setattr(server, 'VIDEO_CHUNK_OVERLAP', server.VIDEO_CHUNK_OVERLAP + 1)
+    assert ResultCache.make_key(DIGEST, VIDEO, True) != key
+    monkeypatch.undo()
+    monkeypatch.setattr(server, 'SEGMENT_MIN_FRAMES', server.SEGMENT_MIN_FRAMES + 1)
+    assert ResultCache.make_key(DIGEST, VIDEO, True) != key
+    monkeypatch.undo()
+    monkeypatch.setattr(server, 'VIDEO_WHOLE_MAX_GB', server.VIDEO_WHOLE_MAX_GB * 2)
+    assert ResultCache.make_key(DIGEST, VIDEO, True) != key
+
+
+def test_entries_survive_a_restart_and_evict_lru(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    cache = ResultCache(cache_dir, max_bytes=1 << 20, max_entries=2)
+    for name in ('one', 'two', 'three'):
+        output = tmp_path / f'{name}.png'
+        output.write_bytes(name.encode())
+        cache.put(name, str(output), {'width': 1, 'height': 1, 'frames': 1})
+
+    assert cache.get('one') is None  # evicted as least recently used
+    entry = cache.get('two')
+    assert open(entry['path'], 'rb').read() == b'two'
+
+    reopened = ResultCache(cache_dir, max_bytes=1 << 20, max_entries=2)
+    assert set(reopened.entries) == {'two', 'three'}
+    assert reopened.get('three')['frames'] == 1
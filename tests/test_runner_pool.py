@@ -0,0 +1,143 @@
+"""ResidentRunnerPool - prepared runners kept between tasks"""
+import sys
+from unittest import mock
+
+import pytest
+
+import server
+from server import ResidentRunnerPool
+
+PARAMS = {'dit_model': 'seedvr2_ema_3b_fp8_e4m3fn.safetensors', 'vae_quality': 'high'}
+
+
+class Loader:
+    """Pool loader that counts its calls and hands out a fresh runner each time"""
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return mock.MagicMock(name=f'runner{self.calls}'), {'cache': self.calls}
+
+
+def test_runner_is_reused_while_resident():
+    pool, loader = ResidentRunnerPool(max_size=1), Loader()
+    key = pool.make_key(PARAMS, 'cpu')
+    runner, ctx, hit = pool.acquire(key, loader)
+    pool.release(key)
+    again, again_ctx, hit_again = pool.acquire(key, loader)
+    assert (hit, hit_again) == (False, True)
+    assert again is runner and again_ctx is ctx
+    assert loader.calls == 1
+    assert pool.get_status()['hits'] == 1
+
+
+def test_idle_lru_runner_makes_room_per_device():
+    pool, loader = ResidentRunnerPool(max_size=1), Loader()
+    first = pool.make_key(PARAMS, 'cpu:0')
+    other_device = pool.make_key(PARAMS, 'cpu:1')
+    second = pool.make_key(dict(PARAMS, decode_tiled=True), 'cpu:0')
+    for key in (first, other_device):
+        pool.acquire(key, loader)
+        pool.release(key)
+    pool.acquire(second, loader)
+    assert list(pool.entries) == [other_device, second]
+    assert pool.evictions == 1
+
+
+def test_runner_in_use_is_not_evicted_for_another():
+    pool, loader = ResidentRunnerPool(max_size=1), Loader()
+    busy = pool.make_key(PARAMS, 'cpu')
+    pool.acquire(busy, loader)
+    pool.acquire(pool.make_key(dict(PARAMS, encode_tiled=True), 'cpu'), loader)
+    assert busy in pool.entries
+    assert pool.evict() == 0  # both held
+
+
+def test_disabled_pool_keeps_nothing():
+    pool, loader = ResidentRunnerPool(max_size=0), Loader()
+    key = pool.make_key(PARAMS, 'cpu')
+    pool.acquire(key, loader)
+    pool.release(key)
+    pool.acquire(key, loader)
+    assert loader.calls == 2
+    assert not pool.entries
+
+
+def test_loader_prepares_runner_with_caches_enabled(monkeypatch):
+    generation = mock.MagicMock()
+    generation.prepare_runner.return_value = ('runner', {})
+    monkeypatch.setitem(sys.modules, 'src.core', mock.MagicMock())
+    monkeypatch.setitem(sys.modules, 'src.core.generation_utils', generation)
+    monkeypatch.setitem(sys.modules, 'src.utils.downloads', mock.MagicMock())
+    assert server.make_runner_loader(PARAMS, 'cpu:1', None)() == ('runner', {})
+    kwargs = generation.prepare_runner.call_args.kwargs
+    assert kwargs['dit_cache'] and kwargs['vae_cache']
+    assert generation.setup_generation_context.call_args.kwargs['dit_device'] == 'cpu'
+
+
+def test_failed_load_is_not_kept():
+    pool = ResidentRunnerPool(max_size=1)
+
+    def broken():
+        raise RuntimeError('missing weights')
+    with pytest.raises(RuntimeError):
+        pool.acquire(pool.make_key(PARAMS, 'cpu'), broken)
+    assert not pool.entries and not pool.loading
+    assert pool.model_states()[PARAMS['dit_model']]['state'] == 'error'
+
+
+@pytest.fixture
+def idle_pool():
+    """Pool with 10 s gpu and 20 s cpu idle timeouts"""
+    pool = ResidentRunnerPool(max_size=2)
+    pool.gpu_idle_timeout, pool.cpu_idle_timeout = 10, 20
+    return pool
+
+
+def load(pool, **params):
+    key = pool.make_key(dict(PARAMS, **params), 'cuda:0')
+    pool.acquire(key, Loader())
+    pool.release(key)
+    return key
+
+
+def idle(pool, key, seconds):
+    """Backdate a runner's last use, then run one watchdog pass"""
+    pool.entries[key]['last_used'] = server.time.time() - seconds
+    pool._demote_idle()
+
+
+def test_idle_runner_moves_to_cpu_then_disk(idle_pool):
+    key = load(idle_pool)
+    runner = idle_pool.entries[key]['runner']
+    idle(idle_pool, key, 5)
+    assert idle_pool.entries[key]['tier'] == 'gpu'
+    idle(idle_pool, key, 11)
+    assert idle_pool.entries[key]['tier'] == 'cpu'
+    runner.dit.to.assert_called_with('cpu')
+    idle(idle_pool, key, 31)
+    assert key not in idle_pool.entries
+    assert [(t['from'], t['to']) for t in idle_pool.transitions] == [('disk', 'gpu'), ('gpu', 'cpu'), ('cpu', 'disk')]
+
+
+def test_block_swapped_runner_skips_the_cpu_tier(idle_pool):
+    key = load(idle_pool, blocks_to_swap=8)
+    idle(idle_pool, key, 11)
+    assert key not in idle_pool.entries
+
+
+def test_runner_in_use_is_never_demoted(idle_pool):
+    key = load(idle_pool)
+    idle_pool.acquire(key, Loader())
+    idle(idle_pool, key, 100)
+    assert idle_pool.entries[key]['tier'] == 'gpu'
+
+
+def test_acquire_promotes_an_offloaded_runner(idle_pool):
+    key = load(idle_pool)
+    idle(idle_pool, key, 11)
+    runner, _, hit = idle_pool.acquire(key, Loader())
+    assert hit
+    assert idle_pool.entries[key]['tier'] == 'gpu'
+    runner.dit.to.assert_called_with('cuda:0')
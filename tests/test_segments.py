@@ -0,0 +1,72 @@
+"""Splitting one long video across devices by temporal segment"""
+from unittest import mock
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(server, 'SEGMENT_MIN_FRAMES', 600)
+    return lambda count: server.TaskQueue(devices=[f'cpu:{i}' for i in range(count)], store=None)
+
+
+def test_segments_are_whole_batches_and_the_last_runs_to_the_end(queue):
+    assert queue(2)._plan_segments(1000, {'batch_size': 5}) == [(0, 500), (500, None)]
+    assert queue(3)._plan_segments(1001, {'batch_size': 5}) == [(0, 335), (335, 335), (670, None)]
+
+
+@pytest.mark.parametrize('devices, frames, params', [
+    (1, 5000, {}), (2, 599, {}), (2, 5000, {'segment_parallel': 'off'}),
+])
+def test_videos_that_stay_on_one_device(queue, devices, frames, params):
+    assert queue(devices)._plan_segments(frames, dict(params, batch_size=5)) == []
+
+
+def test_later_segments_start_early_by_the_overlap(queue, monkeypatch):
+    opened = []
+
+    class FakeReader:
+        frame_count = 500
+
+        def __init__(self, path, start=0, limit=None, growing=None, batch_size=16):
+            opened.append((start, limit))
+    monkeypatch.setattr(server, 'VideoFrameReader', FakeReader)
+    job = {'task_id': 't1', 'input_path': 'clip.mp4', 'params': {'batch_size': 5}}
+    jobs = queue(2)._segment_jobs(job, [(0, 500), (500, None)], chunk_frames=0, frame_count=1000)
+    assert opened == [(0, 500), (496, None)]  # 4 frames of context, cross-faded when stitching
+    assert [j['segment']['index'] for j in jobs] == [0, 1]
+    assert jobs[0]['segment']['state'] is jobs[1]['segment']['state']
+
+
+def frames(count):
+    held = mock.MagicMock()
+    held.__len__.return_value = count
+    return held
+
+
+def test_parts_are_joined_with_cross_faded_seams(queue, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, 'OUTPUT_FOLDER', str(tmp_path))
+    monkeypatch.setattr(server, 'VideoFrameWriter', mock.MagicMock())
+    joined = []
+    monkeypatch.setattr(server, 'concat_videos', lambda paths, output, audio_source: joined.append(list(paths)))
+    parts = [{'path': str(tmp_path / 'seg0.mp4'), 'frames': 496, 'head': None, 'tail': frames(4)},
+             {'path': str(tmp_path / 'seg1.mp4'), 'frames': 500, 'head': frames(4), 'tail': None}]
+    for part in parts:
+        open(part['path'], 'wb').close()
+    job = {'task_id': 't1', 'input_path': 'clip.mp4', 'params': {}, 'fps': 25.0, 'width': 8, 'height': 8,
+           'segment': {'state': {'parts': parts}}}
+    assert queue(2)._stitch_segments(job, str(tmp_path / 'out.mp4')) == 1000
+    assert joined == [[parts[0]['path'], str(tmp_path / 't1_seam1.mp4'), parts[1]['path']]]
+    assert list(tmp_path.iterdir()) == []  # parts and seams are removed once joined
+
+
+def test_a_failed_segment_drops_the_finished_parts(queue, tmp_path):
+    part = tmp_path / 'seg0.mp4'
+    part.write_bytes(b'x')
+    state = {'failed': False, 'parts': [{'path': str(part)}, None]}
+    tq = queue(2)
+    assert tq._abort_segments(state)
+    assert not tq._abort_segments(state)  # only the first failure reports the task
+    assert not part.exists()
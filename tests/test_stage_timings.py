@@ -0,0 +1,46 @@
+"""Per-stage timing and memory recorded on every task"""
+import pytest
+
+import server
+
+
+@pytest.fixture
+def tq(monkeypatch):
+    monkeypatch.setattr(server, 'metrics', server.MetricsRegistry())
+    server.metrics.histogram('phase_seconds', 'test')
+    server.metrics.gauge('vram_peak_bytes', 'test')
+    tq = server.TaskQueue(devices=['cpu'], store=None)
+    tq.tasks['t1'] = {'id': 't1', 'status': 'processing', 'params': {'resolution': 1000},
+                      'input_path': 'clip.mp4'}
+    return tq
+
+
+def test_repeated_stages_accumulate(tq):
+    for _ in range(3):
+        with tq._stage('t1', 'vae_encode'):
+            pass
+    entry = tq.tasks['t1']['timings']['vae_encode']
+    assert entry['calls'] == 3
+    assert entry['wall'] >= 0 and 'cuda' not in entry
+
+
+def test_failed_stage_is_still_timed(tq):
+    with pytest.raises(RuntimeError):
+        with tq._stage('t1', 'dit_upscale'):
+            raise RuntimeError('out of memory')
+    assert tq.tasks['t1']['timings']['dit_upscale']['calls'] == 1
+
+
+def test_gpu_stages_record_cuda_time_and_peak_vram(tq, monkeypatch):
+    monkeypatch.setattr(server.torch.cuda, 'max_memory_allocated', lambda device: 3 << 30)
+    with tq._stage('t1', 'vae_decode', device='cuda:0'):
+        pass
+    entry = tq.tasks['t1']['timings']['vae_decode']
+    assert entry['peak_vram_mb'] == 3072
+    assert 'cuda' in entry
+
+
+def test_timings_fold_into_queue_totals(tq):
+    tq._aggregate_timings({'vae_encode': {'calls': 2, 'wall': 1.5, 'cuda': 1.25, 'peak_vram_mb': 900}})
+    tq._aggregate_timings({'vae_encode': {'calls': 1, 'wall': 0.5}})
+    assert tq.stage_totals['vae_encode'] == {'tasks': 2, 'wall': 2.0, 'cuda': 1.25, 'peak_vram_mb': 900}
@@ -0,0 +1,51 @@
+"""TaskStore persistence and restoring tasks on startup"""
+import server
+from server import TaskStore
+
+
+def test_task_store_loads_in_submission_order(tmp_path):
+    store = TaskStore(str(tmp_path / 'tasks.db'))
+    for task_id, submitted_at in (('b', 2.0), ('c', 3.0), ('a', 1.0)):
+        store.save({'id': task_id, 'status': 'queued', 'submitted_at': submitted_at})
+    assert [task['id'] for task in store.load()] == ['a', 'b', 'c']
+    store.close()
+
+
+def test_restored_tasks_keep_fifo_order(tmp_path):
+    store = TaskStore(str(tmp_path / 'tasks.db'))
+    for task_id, submitted_at in (('t2', 2.0), ('t3', 3.0), ('t1', 1.0)):
+        path = tmp_path / f'{task_id}.png'
+        path.write_bytes(b'x')
+        store.save({'id': task_id, 'status': 'queued', 'submitted_at': submitted_at, 'priority': 'low',
+                    'input_path': str(path), 'params': {}})
+    queue = server.TaskQueue(devices=['cpu'], store=store)
+    assert list(queue.pending) == ['t1', 't2', 't3']
+    store.close()
+
+
+def test_an_older_snapshot_never_overwrites_a_newer_one(tmp_path):
+    store = TaskStore(str(tmp_path / 'tasks.db'))
+    store.write('t1', 'completed', '{"id": "t1", "status": "completed"}', seq=2)
+    store.write('t1', 'queued', '{"id": "t1", "status": "queued"}', seq=1)
+    assert [task['status'] for task in store.load()] == ['completed']
+    store.close()
+
+
+def test_store_writes_happen_outside_the_queue_lock(tmp_path):
+    class ProbeStore(TaskStore):
+        """Records whether the queue lock was free during each write"""
+        def write(self, *record):
+            self.lock_free.append(queue.lock.acquire(blocking=False))
+            if self.lock_free[-1]:
+                queue.lock.release()
+            super().write(*record)
+
+    store = ProbeStore(str(tmp_path / 'tasks.db'))
+    store.lock_free = []
+    queue = server.TaskQueue(devices=['cpu'], store=store)
+    queue.tasks['t1'] = {'id': 't1', 'status': 'processing', 'submitted_at': 1.0, 'params': {}, 'input_path': 'a.png'}
+    queue._fail('t1', RuntimeError('boom'))
+    queue.finish_upload('t1', 'f' * 64)
+    assert store.lock_free == [True, True]
+    assert store.load()[0]['input_digest'] == 'f' * 64
+    store.close()
@@ -0,0 +1,94 @@
+"""UploadManager append, resume and finalize"""
+import hashlib
+import io
+import os
+
+import pytest
+
+from server import UploadManager, UploadConflict
+
+DATA = os.urandom(300_000)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return UploadManager(str(tmp_path))
+
+
+def test_append_in_pieces_and_finalize(manager):
+    upload = manager.create('clip.mp4', len(DATA), None)
+    upload_id = upload['upload_id']
+    assert upload['offset'] == 0
+
+    assert manager.append(upload_id, 0, io.BytesIO(DATA[:100_000]))['offset'] == 100_000
+    assert manager.append(upload_id, 100_000, io.BytesIO(DATA[100_000:]))['offset'] == len(DATA)
+
+    result = manager.finalize(upload_id)
+    assert result['digest'] == hashlib.sha256(DATA).hexdigest()
+    assert open(result['path'], 'rb').read() == DATA
+    assert result['filename'] == 'clip.mp4'
+
+
+def test_append_at_the_wrong_offset_is_rejected(manager):
+    upload_id = manager.create('clip.mp4', len(DATA), None)['upload_id']
+    manager.append(upload_id, 0, io.BytesIO(DATA[:1000]))
+    with pytest.raises(UploadConflict):
+        manager.append(upload_id, 0, io.BytesIO(DATA[:1000]))
+    with pytest.raises(UploadConflict):
+        manager.append(upload_id, 2000, io.BytesIO(DATA[2000:3000]))
+    assert manager.get(upload_id)['offset'] == 1000
+
+
+def test_resume_after_a_dropped_connection(manager):
+    upload_id = manager.create('clip.mp4', len(DATA), None)['upload_id']
+
+    class Dropped(io.BytesIO):
+        """Delivers some bytes, then fails like a reset connection"""
+        def read(self, size=-1):
+            if self.tell() >= 50_000:
+                raise ConnectionResetError()
+            return super().read(min(size, 50_000 - self.tell()))
+
+    with pytest.raises(ConnectionResetError):
+        manager.append(upload_id, 0, Dropped(DATA))
+    offset = manager.get(upload_id)['offset']
+    assert offset == 50_000
+
+    manager.append(upload_id, offset, io.BytesIO(DATA[offset:]))
+    assert manager.finalize(upload_id)['digest'] == hashlib.sha256(DATA).hexdigest()
+
+
+def test_resume_after_a_restart(tmp_path):
+    first = UploadManager(str(tmp_path))
+    upload_id = first.create('clip.mp4', len(DATA), {'resolution': 720})['upload_id']
+    first.append(upload_id, 0, io.BytesIO(DATA[:120_000]))
+
+    # A new manager on the same folder picks the upload up from its sidecar
+    second = UploadManager(str(tmp_path))
+    assert second.get(upload_id)['offset'] == 120_000
+    second.append(upload_id, 120_000, io.BytesIO(DATA[120_000:]))
+    result = second.finalize(upload_id)
+    assert result['digest'] == hashlib.sha256(DATA).hexdigest()  # recomputed, the running hash was lost
+    assert result['params'] == {'resolution': 720}
+
+
+def test_finalize_checks_the_declared_size(manager):
+    upload_id = manager.create('clip.mp4', len(DATA), None)['upload_id']
+    manager.append(upload_id, 0, io.BytesIO(DATA[:10]))
+    with pytest.raises(UploadConflict):
+        manager.finalize(upload_id)
+
+
+def test_append_beyond_the_declared_size_fails(manager):
+    upload_id = manager.create('clip.mp4', 10, None)['upload_id']
+    with pytest.raises(ValueError):
+        manager.append(upload_id, 0, io.BytesIO(DATA[:100]))
+
+
+def test_abort_removes_the_data(manager):
+    upload_id = manager.create('clip.mp4', None, None)['upload_id']
+    path = manager.path(upload_id)
+    manager.append(upload_id, 0, io.BytesIO(DATA[:10]))
+    assert manager.abort(upload_id)
+    assert not os.path.exists(path)
+    assert manager.get(upload_id) is None
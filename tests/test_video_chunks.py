@@ -0,0 +1,65 @@
+"""Whole-clip vs chunked plan for videos"""
+import pytest
+
+import server
+
+GB = 1024**3
+
+
+class FakeReader:
+    """VideoFrameReader stand-in with a fixed header; read_all records that the clip was loaded whole"""
+    frame_count, height, width, fps = 0, 540, 960, 25.0
+
+    def __init__(self, path, start=0, limit=None, growing=None, batch_size=16):
+        self.whole = False
+
+    def read_all(self):
+        self.whole = True
+        return 'frames'
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'VideoFrameReader', FakeReader)
+    monkeypatch.setattr(server, 'VIDEO_WHOLE_MAX_GB', 1.0)
+    return server.TaskQueue(devices=['cpu'], store=None)
+
+
+def decode(queue, frame_count, **params):
+    FakeReader.frame_count = frame_count
+    params = dict({'resolution': 1080, 'batch_size': 5}, **params)
+    return queue._decode_input('t1', 'clip.mp4', params, None)
+
+
+def test_short_clips_run_whole(queue):
+    per_frame = server.upscaled_bytes(1, 540, 960, 1080)
+    job = decode(queue, GB // per_frame)
+    assert job['frames'] == 'frames'
+    assert job['chunk_frames'] == 0
+
+
+def test_long_clips_are_chunked_without_chunk_batches(queue):
+    job = decode(queue, 20_000)
+    assert 'frames' not in job
+    assert job['chunk_frames'] == server.VIDEO_AUTO_CHUNK_BATCHES * 5
+    assert not job['reader'].whole
+
+
+def test_automatic_chunks_shrink_to_the_budget(queue):
+    per_frame = server.upscaled_bytes(1, 540, 960, 1080)  # about 12 MB at 1080p
+    job = decode(queue, 20_000, batch_size=33)
+    assert job['chunk_frames'] == (GB // (per_frame * 33)) * 33
+    assert job['chunk_frames'] * per_frame <= GB
+
+
+def test_explicit_chunk_batches_win(queue):
+    assert decode(queue, 20_000, chunk_batches=2)['chunk_frames'] == 10
+    assert decode(queue, 50, chunk_batches=2)['chunk_frames'] == 10
+
+
+def test_zero_budget_keeps_every_clip_whole(queue, monkeypatch):
+    monkeypatch.setattr(server, 'VIDEO_WHOLE_MAX_GB', 0)
+    assert decode(queue, 20_000)['chunk_frames'] == 0
@@ -0,0 +1,107 @@
+"""VideoFrameReader decode buffers stay bounded by the batch size"""
+from unittest import mock
+
+import numpy as np
+import pytest
+
+import server
+from server import VideoFrameReader
+
+pytestmark = pytest.mark.skipif(isinstance(np, mock.MagicMock), reason='needs numpy')
+
+HEIGHT, WIDTH = 4, 6
+
+
+class FakeCapture:
+    """cv2.VideoCapture over a clip of `frames` frames whose header may under-report the count"""
+    def __init__(self, frames, header_frames):
+        self.frames, self.header_frames, self.position = frames, header_frames, 0
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        cv2 = server.sys.modules['cv2']
+        return {cv2.CAP_PROP_FPS: 25.0, cv2.CAP_PROP_FRAME_WIDTH: WIDTH, cv2.CAP_PROP_FRAME_HEIGHT: HEIGHT,
+                cv2.CAP_PROP_FRAME_COUNT: self.header_frames}.get(prop, 0)
+
+    def set(self, prop, value):
+        self.position = value
+
+    def read(self, out=None):
+        if self.position >= self.frames:
+            return False, None
+        self.position += 1
+        return True, np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+    def release(self):
+        pass
+
+
+class FakeFrames:
+    """Float16 frame tensor stand-in that only tracks its length"""
+    def __init__(self, n):
+        self.n = n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        return FakeFrames(len(range(self.n)[index]))
+
+    def copy_(self, other):
+        return self
+
+    def div_(self, value):
+        return self
+
+
+@pytest.fixture
+def clip(monkeypatch):
+    """Opens readers on a fake clip; torch.empty records every float16 buffer a read allocates"""
+    cv2 = server.sys.modules['cv2']
+    allocated = []
+
+    def empty(shape, dtype=None):
+        allocated.append(shape[0])
+        return FakeFrames(shape[0])
+    monkeypatch.setattr(server.torch, 'empty', empty)
+
+    def open_clip(frames, header_frames=None, **kwargs):
+        monkeypatch.setattr(cv2, 'VideoCapture', lambda path: FakeCapture(
+            frames, frames if header_frames is None else header_frames))
+        return VideoFrameReader('clip.mp4', **kwargs)
+    open_clip.allocated = allocated
+    return open_clip
+
+
+def test_batches_decode_through_one_batch_sized_buffer(clip):
+    reader = clip(103, batch_size=5)
+    batches = list(reader.iter_batches())
+    assert [len(batch) for batch in batches] == [5] * 20 + [3]
+    assert reader.frames_read == 103
+    assert len(reader._scratch) == 5
+    assert max(clip.allocated) == 5
+
+
+def test_a_chunk_read_only_adds_its_output(clip):
+    reader = clip(1000, batch_size=5)
+    assert len(reader.read(80)) == 80
+    assert reader.frames_read == 80
+    assert len(reader._scratch) == 5  # uint8 decode buffer
+    assert clip.allocated == [80]  # the chunk's float16 frames
+
+
+def test_read_all_picks_up_frames_past_the_header_count(clip, monkeypatch):
+    monkeypatch.setattr(server.torch, 'cat', lambda parts: parts)
+    reader = clip(12, header_frames=10, batch_size=4)
+    parts = reader.read_all()
+    assert reader.frames_read == 12
+    assert clip.allocated == [10, 4]
+    assert [len(part) for part in parts] == [10, 2]
+    assert len(reader._scratch) == 4
+
+
+def test_empty_clip_is_an_error(clip):
+    with pytest.raises(ValueError):
+        clip(0, batch_size=5).read_all()
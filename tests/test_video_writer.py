@@ -0,0 +1,72 @@
+"""Single-pass ffmpeg encoding - command line and per-codec presets"""
+import io
+
+import pytest
+
+import server
+from server import VideoFrameWriter, build_task_params, encoder_preset, valid_preset
+
+
+class FakeProc:
+    """subprocess.Popen stand-in for an ffmpeg that exits cleanly"""
+    def __init__(self, cmd, **kwargs):
+        self.cmd, self.stdin, self.returncode = cmd, io.BytesIO(), 0
+
+    def wait(self):
+        return self.returncode
+
+
+@pytest.fixture
+def ffmpeg(monkeypatch):
+    """Returns the command line of the last writer opened"""
+    procs = []
+
+    def popen(cmd, **kwargs):
+        procs.append(FakeProc(cmd, **kwargs))
+        return procs[-1]
+    monkeypatch.setattr(server.subprocess, 'Popen', popen)
+
+    def command(**kwargs):
+        writer = VideoFrameWriter('out.mp4', 25.0, kwargs.pop('width', 1920), kwargs.pop('height', 1080), **kwargs)
+        writer.close()
+        return procs[-1].cmd
+    return command
+
+
+def option(cmd, flag):
+    return cmd[cmd.index(flag) + 1]
+
+
+def test_frames_are_piped_straight_into_the_encoder(ffmpeg):
+    cmd = ffmpeg(codec='libx264', preset='slow', crf=20)
+    assert option(cmd, '-i') == 'pipe:0'
+    assert (option(cmd, '-c:v'), option(cmd, '-preset'), option(cmd, '-crf')) == ('libx264', 'slow', '20')
+    assert option(cmd, '-movflags') == '+faststart'
+    assert cmd[-1] == 'out.mp4'
+
+
+@pytest.mark.parametrize('codec, preset, expected', [
+    ('libx264', 'veryslow', 'veryslow'), ('libsvtav1', 'fast', '8'), ('libsvtav1', '3', '3'),
+    ('h264_nvenc', 'medium', 'p5'), ('hevc_nvenc', 'p2', 'p2'),
+])
+def test_presets_are_translated_per_codec(codec, preset, expected):
+    assert encoder_preset(codec, preset) == expected
+
+
+def test_nvenc_uses_constant_quality(ffmpeg):
+    cmd = ffmpeg(codec='h264_nvenc', preset='fast', crf=23)
+    assert option(cmd, '-cq') == '23' and '-crf' not in cmd
+    assert option(cmd, '-preset') == 'p4'
+
+
+def test_odd_sizes_are_cropped_and_live_output_is_fragmented(ffmpeg):
+    cmd = ffmpeg(width=1919, height=1080, fragmented=True)
+    assert option(cmd, '-vf') == 'crop=trunc(iw/2)*2:trunc(ih/2)*2'
+    assert option(cmd, '-movflags') == 'frag_keyframe+empty_moov+default_base_moof'
+
+
+@pytest.mark.parametrize('codec, preset', [('libsvtav1', '14'), ('h264_nvenc', 'p9'), ('libx264', 'p4')])
+def test_foreign_presets_are_rejected(codec, preset):
+    assert not valid_preset(codec, preset)
+    with pytest.raises(ValueError):
+        build_task_params({'video_codec': codec, 'video_preset': preset}, True)